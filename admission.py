@@ -0,0 +1,216 @@
+"""
+admission.py
+============
+
+Admission control in front of every LLM-backed command (!maddybot, the
+persona bots, !sentiment). A request passes three cheap, local checks before
+anything touches the network, in this order:
+
+  1. per-user cooldown  - one LLM command per user every USER_COOLDOWN seconds
+  2. per-guild budget   - a token bucket of GUILD_TOKENS_PER_HOUR, refilled
+                          continuously; each command reserves its estimated cost
+  3. bounded queue      - at most MAX_ACTIVE commands run at once and up to
+                          MAX_QUEUE more wait in FIFO order (and are told their
+                          position); anything beyond that is shed
+
+A request that fails a check raises Rejected with a user-facing reason and
+costs nothing: its cooldown and budget are only charged once all three pass,
+and are refunded if it is cancelled before it reaches the front of the queue.
+A command whose cost exceeds the whole hourly budget is always rejected.
+
+    ADMISSION = Admission()
+
+    @bot.command(name="noogbot")
+    @ADMISSION.command("noogbot", cost=800)
+    async def noogbot_cmd(ctx): ...
+
+snapshot() reports the live queue, budgets and per-reason shed counts for the
+!llmstatus command.
+"""
+
+import os
+import time
+import asyncio
+import functools
+import logging
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+log = logging.getLogger(__name__)
+
+USER_COOLDOWN = float(os.getenv("LLM_USER_COOLDOWN", "10"))
+GUILD_TOKENS_PER_HOUR = int(os.getenv("LLM_GUILD_TOKENS_PER_HOUR", "200000"))
+MAX_ACTIVE = int(os.getenv("LLM_MAX_ACTIVE", "4"))
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "8"))
+
+
+class Rejected(Exception):
+    """Raised by admit() when a request is shed; str(e) is safe to show the user."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class Admission:
+    def __init__(
+        self,
+        cooldown: float = USER_COOLDOWN,
+        tokens_per_hour: int = GUILD_TOKENS_PER_HOUR,
+        max_active: int = MAX_ACTIVE,
+        max_queue: int = MAX_QUEUE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.cooldown = cooldown
+        self.capacity = float(tokens_per_hour)
+        self.refill = tokens_per_hour / 3600.0
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.clock = clock
+        self.active = 0
+        self.admitted = 0
+        self.shed: Counter = Counter()        # reason -> count
+        self.by_command: Counter = Counter()  # command -> admitted count
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+        self._last_seen: Dict[int, float] = {}
+        self._buckets: Dict[Optional[int], list] = {}   # guild -> [tokens, updated_at]
+        self._waiters: deque = deque()
+
+    # ---- checks ----
+    def _tokens(self, guild_id: Optional[int]) -> float:
+        now = self.clock()
+        bucket = self._buckets.setdefault(guild_id, [self.capacity, now])
+        bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill)
+        bucket[1] = now
+        return bucket[0]
+
+    def _prune_last_seen(self, now: float):
+        # entries are kept in the order they were stamped (see admit()), so the
+        # expired ones are always at the front
+        while self._last_seen:
+            user_id, at = next(iter(self._last_seen.items()))
+            if now - at < self.cooldown:
+                break
+            del self._last_seen[user_id]
+
+    def _check(self, user_id: int, guild_id: Optional[int], cost: int):
+        if cost > self.capacity:
+            raise Rejected("budget", "This command needs more AI budget than this server gets in an hour, "
+                                     "so it can't run here.")
+        now = self.clock()
+        self._prune_last_seen(now)
+        last = self._last_seen.get(user_id)
+        if last is not None and now - last < self.cooldown:
+            raise Rejected("cooldown", f"Slow down: try again in {self.cooldown - (now - last):.0f}s.")
+        tokens = self._tokens(guild_id)
+        if tokens < cost:
+            wait = (cost - tokens) / self.refill if self.refill else float("inf")
+            raise Rejected("budget", f"This server is out of AI budget for now; try again in {wait / 60:.0f} min.")
+        if self.active >= self.max_active and len(self._waiters) >= self.max_queue:
+            raise Rejected("queue", "Too busy right now; try again in a minute.")
+
+    # ---- queue ----
+    async def _acquire(self, on_queued: Optional[Callable[[int], Awaitable]]):
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        if on_queued is not None:
+            try:
+                await on_queued(len(self._waiters))
+            except Exception as e:
+                log.debug("Queue notice failed: %s", e)
+        try:
+            await fut   # _release() hands its slot straight to us
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()
+            elif fut in self._waiters:
+                self._waiters.remove(fut)
+            raise
+
+    def _release(self):
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+    def _refund(self, user_id: int, guild_id: Optional[int], cost: int):
+        # a request that never got a slot (cancelled while queued) gives back
+        # what admit() charged it
+        self._last_seen.pop(user_id, None)
+        self._buckets[guild_id][0] = min(self.capacity, self._tokens(guild_id) + cost)
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        user_id: int,
+        guild_id: Optional[int],
+        command: str,
+        cost: int,
+        on_queued: Optional[Callable[[int], Awaitable]] = None,
+    ):
+        """Hold a slot for the body; raises Rejected (before any waiting) if shed."""
+        try:
+            self._check(user_id, guild_id, cost)
+        except Rejected as e:
+            self.shed[e.reason] += 1
+            log.info("Shed %s for user %s in guild %s: %s", command, user_id, guild_id, e.reason)
+            raise
+        self._last_seen.pop(user_id, None)      # re-stamp at the back, see _prune_last_seen()
+        self._last_seen[user_id] = self.clock()
+        self._buckets[guild_id][0] -= cost
+
+        t0 = self.clock()
+        try:
+            await self._acquire(on_queued)
+        except BaseException:
+            self._refund(user_id, guild_id, cost)
+            raise
+        waited = self.clock() - t0
+        self.admitted += 1
+        self.by_command[command] += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def command(self, name: str, cost: int):
+        """Decorator for a discord.py command callback: admit first, answer rejections here."""
+        def deco(func):
+            @functools.wraps(func)
+            async def wrapper(ctx, *args, **kwargs):
+                async def queued(position: int):
+                    await ctx.send(f":hourglass: Busy, you're #{position} in the queue.")
+
+                guild_id = getattr(ctx.guild, "id", None)
+                try:
+                    async with self.admit(ctx.author.id, guild_id, name, cost, on_queued=queued):
+                        return await func(ctx, *args, **kwargs)
+                except Rejected as e:
+                    await ctx.send(f":hourglass: {e}")
+            return wrapper
+        return deco
+
+    # ---- metrics ----
+    def snapshot(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "max_active": self.max_active,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "by_command": dict(self.by_command),
+            "shed": dict(self.shed),
+            "avg_wait_ms": 1000 * self.total_wait / self.admitted if self.admitted else 0.0,
+            "max_wait_ms": 1000 * self.max_wait,
+            "budgets": {g: round(self._tokens(g)) for g in list(self._buckets)},
+            "budget_capacity": int(self.capacity),
+        }
@@ -5,7 +5,7 @@ aos_sentiment.py
 Faction sentiment-index command for the AoS bot.
 
 Collects recent messages from each faction channel, scores fan sentiment with
-OpenAI, and writes the results to Postgres (AOS_EVENTS_DB_URL). Designed to drop
+the LLM (llm.complete), and writes the results to Postgres (AOS_EVENTS_DB_URL). Designed to drop
 into calimastersbot.py without touching the rest of the file.
 
 Wiring it in (two lines in calimastersbot.py)
@@ -16,9 +16,12 @@ At the top of calimastersbot.py:
 
 Inside main(), BEFORE the asyncio.gather(...) that launches the bots:
 
-    register_sentiment(aos_bot, get_db_pool, ALIAS_MAP, EMOJI_MAP)
+    register_sentiment(aos_bot, get_db_pool, ALIAS_MAP, EMOJI_MAP,
+                       resolve_faction=resolve_faction)
 
-That reuses your existing pool + faction maps; nothing else changes.
+That reuses your existing pool + faction maps; nothing else changes. The
+optional resolve_faction hook makes `!sentiment slanesh` typo tolerant; without
+it faction arguments must be exact ALIAS_MAP keys.
 
 Config you must set
 -------------------
@@ -29,6 +32,16 @@ Channels are matched to factions by name via your ALIAS_MAP (e.g. a channel
 called "daughters-of-khaine", "dok", or "#dok-chat" all resolve correctly). For
 any oddly-named channels, add them to FACTION_CHANNEL_OVERRIDES.
 
+Incremental runs
+----------------
+Every classified message is stored (sentiment_message) and each channel keeps a
+watermark (sentiment_watermark): the span of message ids already processed. A
+run only pulls history newer than that span, plus any older part of the
+requested window not yet covered, classifies just those messages, and then
+computes the window's counts and themes from the stored rows. Re-running, or
+asking for an overlapping window, costs only the new messages. Runs on the same
+channel are serialised, so overlapping !sentiment calls never pay twice.
+
 Usage in Discord
 ----------------
     !sentiment            -> every faction channel it can find
@@ -42,10 +55,13 @@ import re
 import json
 import asyncio
 import logging
+from collections import Counter
 from datetime import datetime, timedelta, timezone
 
 import discord
-import openai  # legacy SDK, same as the rest of the bot
+
+import telemetry
+from llm import LLM_BATCH_CONCURRENCY, complete
 
 log = logging.getLogger(__name__)
 
@@ -57,9 +73,14 @@ SENTIMENT_CATEGORY_NAME = os.getenv("SENTIMENT_CATEGORY_NAME")  # None = all tex
 
 DEFAULT_LOOKBACK_HOURS = 48
 BATCH_SIZE = 40                    # messages per OpenAI call
-MAX_MESSAGES_PER_CHANNEL = 600     # cost guardrail per channel
+MAX_MESSAGES_PER_CHANNEL = 600     # cost guardrail: new messages classified per channel per run
 MAX_MSG_CHARS = 500                # truncate any one message (e.g. pasted army lists)
-CHANNEL_CONCURRENCY = 4            # channels processed in parallel
+CHANNEL_CONCURRENCY = 4            # channels reading history in parallel
+# classification batches in flight across every channel (and every !sentiment run);
+# they run in llm's "batch" lane, so by default they may fill it
+CLASSIFY_MAX_REQUESTS = int(os.getenv("SENTIMENT_MAX_REQUESTS", str(LLM_BATCH_CONCURRENCY)))
+CLASSIFY_MAX_TOKENS = int(os.getenv("SENTIMENT_MAX_TOKENS", "120000"))   # estimated, prompt + reply
+CLASSIFY_REPLY_TOKENS = 400
 MODEL = "gpt-4o-mini"
 
 # channel_id (int) OR exact channel name (str) -> canonical faction name
@@ -72,17 +93,20 @@ CLASSIFY_SYSTEM = (
     "You analyse fan reactions in a Warhammer: Age of Sigmar community. Classify "
     "each message's feeling toward the faction or game as positive, neutral, or "
     "negative. Banter, sarcasm and memes are common, so judge the underlying "
-    "sentiment, not surface tone. Every message goes in exactly one bucket and the "
-    "three counts must sum to the number of messages. Also extract up to 5 short "
+    "sentiment, not surface tone. Give exactly one label per numbered message, in "
+    'order: "+" positive, "~" neutral, "-" negative. Also extract up to 5 short '
     "recurring themes, e.g. 'points increase', 'love the new models', 'rules "
     "confusion', 'underpowered'. "
     'Respond with ONLY a JSON object: '
-    '{"positive": int, "neutral": int, "negative": int, "themes": [str, ...]}'
+    '{"labels": ["+", "~", "-", ...], "themes": [str, ...]}'
 )
 
+# stored per message as -1 / 0 / +1
+_LABELS = {"+": 1, "~": 0, "-": -1, "positive": 1, "neutral": 0, "negative": -1}
+
 
 # ----------------------------------------------------------------------------
-# OpenAI helpers (legacy SDK, async)
+# LLM helpers (via llm.complete: shared queueing, retries and backend)
 # ----------------------------------------------------------------------------
 def _parse_json(raw: str) -> dict:
     """Best-effort JSON extraction from a model reply (handles ``` fences)."""
@@ -100,39 +124,117 @@ def _parse_json(raw: str) -> dict:
     return {}
 
 
-async def _classify_batch(messages: list[str]) -> tuple[int, int, int, list[str]]:
+class _BatchBudget:
+    """
+    Shared limit on classification batches in flight: at most max_requests
+    calls and max_tokens estimated tokens at once. Every channel's batches
+    draw from the same budget, so a guild-wide run dispatches as many as the
+    budget allows instead of one call per channel at a time. The calls go
+    through llm's "batch" lane, so they never queue ahead of interactive
+    commands.
+    """
+
+    def __init__(self, max_requests: int = CLASSIFY_MAX_REQUESTS, max_tokens: int = CLASSIFY_MAX_TOKENS):
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.requests = 0
+        self.tokens = 0
+        self._cond = None
+
+    async def acquire(self, tokens: int) -> int:
+        tokens = min(tokens, self.max_tokens)   # an oversized batch still runs, alone
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.requests < self.max_requests
+                                      and self.tokens + tokens <= self.max_tokens)
+            self.requests += 1
+            self.tokens += tokens
+        return tokens
+
+    async def release(self, tokens: int):
+        async with self._cond:
+            self.requests -= 1
+            self.tokens -= tokens
+            self._cond.notify_all()
+
+
+_BUDGET = _BatchBudget()
+
+
+async def _classify_batch(messages: list[str]) -> tuple[list[int], list[str]]:
+    """One label (-1/0/+1) per message, in order, plus up to 5 themes.
+    Raises ValueError if the reply doesn't label every message."""
     numbered = "\n".join(f"{i + 1}. {m}" for i, m in enumerate(messages))
-    resp = await openai.ChatCompletion.acreate(
-        model=MODEL,
-        temperature=0,
-        max_tokens=400,
-        messages=[
-            {"role": "system", "content": CLASSIFY_SYSTEM},
-            {"role": "user", "content": f"{len(messages)} messages:\n\n{numbered}"},
-        ],
-    )
-    data = _parse_json(resp.choices[0].message.content or "")
-    pos = int(data.get("positive", 0) or 0)
-    neu = int(data.get("neutral", 0) or 0)
-    neg = int(data.get("negative", 0) or 0)
+    prompt = [
+        {"role": "system", "content": CLASSIFY_SYSTEM},
+        {"role": "user", "content": f"{len(messages)} messages:\n\n{numbered}"},
+    ]
+    cost = await _BUDGET.acquire(
+        sum(telemetry.estimate_tokens(m["content"]) for m in prompt) + CLASSIFY_REPLY_TOKENS)
+    try:
+        resp = await complete(
+            prompt,
+            model=MODEL,
+            temperature=0,
+            max_tokens=CLASSIFY_REPLY_TOKENS,
+            site="sentiment.classify",
+            lane="batch",
+        )
+    finally:
+        await _BUDGET.release(cost)
+    data = _parse_json(resp.text)
+    raw = data.get("labels") or []
+    if len(raw) < len(messages):
+        # labels are stored for good, so a short (truncated) reply must not be padded
+        raise ValueError(f"classifier gave {len(raw)} labels for {len(messages)} messages")
+    labels = [_LABELS.get(str(x).strip().lower(), 0) for x in raw[:len(messages)]]
     themes = [str(t).strip().lower() for t in (data.get("themes") or []) if str(t).strip()]
-    return pos, neu, neg, themes[:5]
+    return labels, themes[:5]
+
+
+async def _classify_with_retry(messages: list[str]) -> tuple[list[int], list[str]]:
+    """_classify_batch, asked once more if the first reply is short."""
+    try:
+        return await _classify_batch(messages)
+    except ValueError as e:
+        log.warning("%s; retrying batch", e)
+        return await _classify_batch(messages)
+
+
+async def _classify_all(messages: list[str]) -> tuple[list[int], list[list[str]]]:
+    """
+    Labels for every message, and each batch's themes. Batches are classified
+    concurrently (within _BUDGET) and reassembled in message order; if one
+    fails, the rest are cancelled and the error propagates.
+    """
+    tasks = [asyncio.ensure_future(_classify_with_retry(messages[i:i + BATCH_SIZE]))
+             for i in range(0, len(messages), BATCH_SIZE)]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        raise
+    return [label for lb, _ in results for label in lb], [th for _, th in results]
 
 
 async def _summarise(faction: str, themes: list[str], score: float) -> str:
     try:
-        resp = await openai.ChatCompletion.acreate(
-            model=MODEL,
-            temperature=0.3,
-            max_tokens=160,
-            messages=[
+        resp = await complete(
+            [
                 {"role": "system", "content": "Write 2-3 plain sentences on how "
                  "fans feel, grounded in the themes. Neutral, specific tone."},
                 {"role": "user", "content": f"Faction: {faction}\n"
                  f"Net sentiment: {score:+.2f} (-1 to +1)\nThemes: {themes}"},
             ],
+            model=MODEL,
+            temperature=0.3,
+            max_tokens=160,
+            site="sentiment.summary",
+            lane="batch",
         )
-        return (resp.choices[0].message.content or "").strip()
+        return resp.text
     except Exception:
         log.exception("summary failed for %s", faction)
         return ""
@@ -197,6 +299,41 @@ async def _ensure_table(pool):
             CREATE INDEX IF NOT EXISTS idx_faction_sentiment_faction_time
                 ON faction_sentiment (faction, collected_at DESC);
         """)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_message (
+                message_id  BIGINT PRIMARY KEY,
+                channel_id  BIGINT NOT NULL,
+                faction     TEXT NOT NULL,
+                created_at  TIMESTAMPTZ NOT NULL,
+                label       SMALLINT NOT NULL          -- -1 / 0 / +1
+            );
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sentiment_message_channel_time
+                ON sentiment_message (channel_id, created_at);
+        """)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_theme (
+                channel_id        BIGINT NOT NULL,
+                first_message_id  BIGINT NOT NULL,     -- oldest message in the batch
+                created_at        TIMESTAMPTZ NOT NULL,  -- newest message in the batch
+                themes            JSONB NOT NULL DEFAULT '[]',
+                PRIMARY KEY (channel_id, first_message_id)
+            );
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sentiment_theme_channel_time
+                ON sentiment_theme (channel_id, created_at);
+        """)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_watermark (
+                channel_id  BIGINT PRIMARY KEY,
+                faction     TEXT NOT NULL,
+                low_id      BIGINT NOT NULL,           -- processed: every message with
+                high_id     BIGINT NOT NULL,           -- low_id <= id <= high_id
+                updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
 
 
 async def _store_result(pool, r: dict, hours: int):
@@ -210,42 +347,142 @@ async def _store_result(pool, r: dict, hours: int):
              r["negative"], r["score"], json.dumps(r["themes"]), r["summary"])
 
 
+async def _load_watermark(pool, channel_id: int):
+    async with pool.acquire() as conn:
+        return await conn.fetchrow(
+            "SELECT low_id, high_id FROM sentiment_watermark WHERE channel_id = $1", channel_id)
+
+
+async def _save_progress(pool, channel_id: int, faction: str, rows: list, themes: list,
+                         low_id: int, high_id: int):
+    """Store classified messages + batch themes and move the watermark, atomically."""
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if rows:
+                await conn.executemany("""
+                    INSERT INTO sentiment_message (message_id, channel_id, faction, created_at, label)
+                    VALUES ($1, $2, $3, $4, $5)
+                    ON CONFLICT (message_id) DO NOTHING
+                """, [(mid, channel_id, faction, at, label) for mid, at, label in rows])
+            if themes:
+                await conn.executemany("""
+                    INSERT INTO sentiment_theme (channel_id, first_message_id, created_at, themes)
+                    VALUES ($1, $2, $3, $4::jsonb)
+                    ON CONFLICT (channel_id, first_message_id) DO NOTHING
+                """, [(channel_id, first, at, json.dumps(th)) for first, at, th in themes])
+            # a span that touches the stored one extends it (never shrinks it); a
+            # disjoint, newer one (the old span fell out of the window) replaces it
+            await conn.execute("""
+                INSERT INTO sentiment_watermark AS w (channel_id, faction, low_id, high_id)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (channel_id) DO UPDATE SET
+                    faction = $2,
+                    low_id = CASE WHEN $3 <= w.high_id + 1 THEN LEAST(w.low_id, $3) ELSE $3 END,
+                    high_id = GREATEST(w.high_id, $4),
+                    updated_at = now()
+            """, channel_id, faction, low_id, high_id)
+
+
+async def _window_aggregate(pool, channel_id: int, since: datetime):
+    """(positive, neutral, negative, top themes) over stored rows since `since`."""
+    async with pool.acquire() as conn:
+        counts = await conn.fetch("""
+            SELECT label, count(*) AS n FROM sentiment_message
+            WHERE channel_id = $1 AND created_at >= $2 GROUP BY label
+        """, channel_id, since)
+        theme_rows = await conn.fetch("""
+            SELECT themes FROM sentiment_theme
+            WHERE channel_id = $1 AND created_at >= $2 ORDER BY created_at DESC
+        """, channel_id, since)
+    by_label = {r["label"]: r["n"] for r in counts}
+    seen = Counter()
+    for r in theme_rows:
+        th = r["themes"]
+        seen.update(json.loads(th) if isinstance(th, str) else th)
+    return by_label.get(1, 0), by_label.get(0, 0), by_label.get(-1, 0), [t for t, _ in seen.most_common(5)]
+
+
 # ----------------------------------------------------------------------------
 # Core analysis for one channel
 # ----------------------------------------------------------------------------
-async def _analyze_channel(faction: str, channel: discord.TextChannel, hours: int):
-    after = datetime.now(timezone.utc) - timedelta(hours=hours)
-    contents: list[str] = []
-    async for msg in channel.history(after=after, limit=None, oldest_first=True):
-        if msg.author.bot:
-            continue
+async def _new_messages(channel: discord.TextChannel, since_id: int, mark):
+    """
+    Messages not yet classified within the window (ids > since_id), oldest
+    first, and the processed span [low_id, high_id] once they are stored.
+    Newer-than-high is read forwards and the uncovered start of the window
+    backwards, so hitting MAX_MESSAGES_PER_CHANNEL still leaves the span
+    contiguous.
+    """
+    fresh = mark is None or mark["high_id"] < since_id
+    low_id, high_id = (since_id + 1, since_id) if fresh else (mark["low_id"], mark["high_id"])
+    found: list = []
+
+    def keep(msg):
         text = (msg.content or "").strip()
-        if text:
-            contents.append(text[:MAX_MSG_CHARS])
-        if len(contents) >= MAX_MESSAGES_PER_CHANNEL:
+        if not msg.author.bot and text:
+            found.append((msg.id, msg.created_at, text[:MAX_MSG_CHARS]))
+
+    async for msg in channel.history(after=discord.Object(id=high_id), limit=None, oldest_first=True):
+        keep(msg)
+        high_id = msg.id
+        if len(found) >= MAX_MESSAGES_PER_CHANNEL:
             break
 
-    if not contents:
-        return None
+    if since_id + 1 < low_id and len(found) < MAX_MESSAGES_PER_CHANNEL:
+        done = True
+        async for msg in channel.history(after=discord.Object(id=since_id), before=discord.Object(id=low_id),
+                                         limit=None, oldest_first=False):
+            keep(msg)
+            low_id = msg.id
+            if len(found) >= MAX_MESSAGES_PER_CHANNEL:
+                done = False
+                break
+        if done:
+            low_id = since_id + 1
+
+    found.sort()
+    return found, low_id, high_id
+
+
+async def _classify_new(pool, faction: str, channel: discord.TextChannel, since_id: int, history_slots):
+    mark = await _load_watermark(pool, channel.id)
+    if history_slots is None:
+        found, low_id, high_id = await _new_messages(channel, since_id, mark)
+    else:
+        async with history_slots:
+            found, low_id, high_id = await _new_messages(channel, since_id, mark)
+
+    labels, batch_themes = await _classify_all([text for _, _, text in found])
+    rows = [(mid, at, label) for (mid, at, _), label in zip(found, labels)]
+    # (first message id, newest message time, themes) per batch
+    themes = [(found[i][0], found[min(i + BATCH_SIZE, len(found)) - 1][1], th)
+              for i, th in zip(range(0, len(found), BATCH_SIZE), batch_themes) if th]
+    await _save_progress(pool, channel.id, faction, rows, themes, low_id, high_id)
+    log.info("sentiment %s: %d new message(s) classified", faction, len(rows))
 
-    pos = neu = neg = 0
-    themes: list[str] = []
-    for i in range(0, len(contents), BATCH_SIZE):
-        p, n, g, th = await _classify_batch(contents[i:i + BATCH_SIZE])
-        pos += p
-        neu += n
-        neg += g
-        themes.extend(th)
 
-    total = pos + neu + neg or 1
+# one run per channel at a time: a second run waits, then sees the first's watermark
+_CHANNEL_LOCKS: dict = {}
+
+
+async def _analyze_channel(pool, faction: str, channel: discord.TextChannel, hours: int,
+                           history_slots=None):
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    since_id = discord.utils.time_snowflake(since)
+    async with _CHANNEL_LOCKS.setdefault(channel.id, asyncio.Lock()):
+        await _classify_new(pool, faction, channel, since_id, history_slots)
+
+    pos, neu, neg, top_themes = await _window_aggregate(pool, channel.id, since)
+    if not pos + neu + neg:
+        return None
+
+    total = pos + neu + neg
     score = (pos - neg) / total
-    # dedupe themes, keep order, cap at 5
-    top_themes = list(dict.fromkeys(themes))[:5]
     summary = await _summarise(faction, top_themes, score)
 
     return {
         "faction": faction,
-        "volume": len(contents),
+        "volume": total,
         "positive": pos,
         "neutral": neu,
         "negative": neg,
@@ -270,15 +507,19 @@ def _emoji(score: float) -> str:
 # ----------------------------------------------------------------------------
 # Command registration
 # ----------------------------------------------------------------------------
-def register(bot, get_db_pool, alias_map: dict, emoji_map: dict):
+def register(bot, get_db_pool, alias_map: dict, emoji_map: dict, resolve_faction=None, admit=None):
     """Attach the !sentiment command to `bot`, injecting the bot's own
-    DB-pool getter and faction maps so we don't duplicate them."""
+    DB-pool getter and faction maps so we don't duplicate them. `admit`, if
+    given, wraps the callback (e.g. the bot's LLM admission controller)."""
+    resolve = resolve_faction or (lambda a: alias_map.get(a.lower()))
+    gate = admit or (lambda func: func)
 
     @bot.command(
         name="sentiment",
         help="Score faction fan sentiment and save to DB. "
              "Usage: !sentiment [faction_alias] [hours]",
     )
+    @gate
     async def sentiment(ctx, *args):
         # parse optional faction + optional hours, in any order
         hours = DEFAULT_LOOKBACK_HOURS
@@ -302,7 +543,7 @@ def register(bot, get_db_pool, alias_map: dict, emoji_map: dict):
 
         # narrow to a single faction if asked
         if faction_arg:
-            canon = alias_map.get(faction_arg.lower())
+            canon = resolve(faction_arg)
             if not canon:
                 return await ctx.send(f":warning: Unknown faction '{faction_arg}'.")
             if canon not in channel_map:
@@ -327,19 +568,20 @@ def register(bot, get_db_pool, alias_map: dict, emoji_map: dict):
         results: list[dict] = []
         failures: list[str] = []
 
+        # history reads are bounded per channel; classification batches from
+        # every channel share _BUDGET, so they run side by side
         async def worker(fac, chan):
-            async with sem:
-                try:
-                    r = await _analyze_channel(fac, chan, hours)
-                    if not r:
-                        return
-                    await _store_result(pool, r, hours)
-                    results.append(r)
-                except discord.Forbidden:
-                    failures.append(f"{fac} (no read access)")
-                except Exception as e:
-                    log.exception("sentiment failed for %s", fac)
-                    failures.append(f"{fac} ({type(e).__name__})")
+            try:
+                r = await _analyze_channel(pool, fac, chan, hours, history_slots=sem)
+                if not r:
+                    return
+                await _store_result(pool, r, hours)
+                results.append(r)
+            except discord.Forbidden:
+                failures.append(f"{fac} (no read access)")
+            except Exception as e:
+                log.exception("sentiment failed for %s", fac)
+                failures.append(f"{fac} ({type(e).__name__})")
 
         await asyncio.gather(*(worker(f, c) for f, c in targets.items()))
 
@@ -0,0 +1,88 @@
+"""
+attachments.py
+==============
+
+Bounded, streaming reads of text attachments for the LLM-backed commands.
+
+Attachment.read() downloads the whole file even though only the first few
+thousand characters ever reach a prompt. read_text() instead streams the
+attachment from the CDN (asking for just the byte range it can use), decodes
+it incrementally - a UTF-8 sequence split across chunks is carried over,
+never mangled - and stops as soon as it has max_chars characters. Results
+are cached by attachment id, so running several persona commands on the
+same message downloads it once.
+
+    text = await read_text(att)    # "" if not text, unreachable, or empty
+"""
+
+import os
+import codecs
+import logging
+from typing import Optional
+
+import aiohttp
+
+from ttlcache import TTLCache
+
+log = logging.getLogger(__name__)
+
+MAX_TEXT_CHARS = 4000
+CHUNK_BYTES = 4096
+READ_TIMEOUT = float(os.getenv("ATTACHMENT_TIMEOUT", "10"))
+
+_CACHE = TTLCache(maxsize=256, ttl=3600)
+_STATE = {"session": None}
+
+
+def _session() -> aiohttp.ClientSession:
+    session = _STATE["session"]
+    if session is None or session.closed:
+        session = _STATE["session"] = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=READ_TIMEOUT)
+        )
+    return session
+
+
+async def close():
+    session, _STATE["session"] = _STATE["session"], None
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def is_text(att) -> bool:
+    return "text" in (getattr(att, "content_type", "") or "")
+
+
+async def _stream(url: str, max_chars: int) -> str:
+    # a UTF-8 character is at most 4 bytes, so this range always covers max_chars
+    headers = {"Range": f"bytes=0-{4 * max_chars - 1}"}
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parts, n = [], 0
+    async with _session().get(url, headers=headers) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.content.iter_chunked(CHUNK_BYTES):
+            text = decoder.decode(chunk)
+            parts.append(text)
+            n += len(text)
+            if n >= max_chars:
+                break
+        else:
+            parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)[:max_chars]
+
+
+async def read_text(att, max_chars: int = MAX_TEXT_CHARS) -> str:
+    """Up to max_chars characters of a text attachment ("" if unusable)."""
+    if not is_text(att):
+        return ""
+    key = f"{att.id}:{max_chars}"
+    hit: Optional[str] = _CACHE.get(key)
+    if hit is not None:
+        return hit
+    try:
+        text = await _stream(att.url, max_chars)
+    except Exception as e:
+        log.info("Could not read attachment %s: %s", getattr(att, "id", "?"), e)
+        return ""
+    _CACHE.put(key, text)
+    return text
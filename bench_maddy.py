@@ -0,0 +1,556 @@
+"""
+bench_maddy.py
+==============
+
+Micro-benchmarks for maddybot's lookup paths, run against the real data files:
+
+    python bench_maddy.py
+
+Each section times the current implementation against the one it replaced,
+over a corpus of questions people actually ask Maddy, and checks that both
+give the same answers. Nothing here touches Discord or OpenAI.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import tempfile
+import subprocess
+import difflib
+import itertools
+import statistics
+
+import damage
+import maddybot as m
+import rules_index
+
+QUESTIONS = [
+    "archaon vs nagash",
+    "best shooting in KO",
+    "how many attacks does a saurus warriors unit get",
+    "what is the save of the lord kroak",
+    "Which is better into a 3+ save, blightkings or plague monks?",
+    "compare gotrek and kragnos",
+    "does skarbrand have ward",
+    "what's the rend on the maw-krusha's fists",
+    "how much damage do stormdrake guard do vs 4+",
+    "teclis or belakor, who wins?",
+    "what is the health of ushoran",
+    "varanguard against a 2+ save",
+    "how far can a krondspine move",
+    "list the abilities of glutos orscollion",
+    "thanquol on boneripper damage output",
+    "how good are grave guard into 5+",
+    "morathi-khaine vs the shadow queen",
+    "best hero in nighthaunt",
+    "which unit has the most attacks in ironjawz",
+    "how many wounds do kairic acolytes have",
+    "does the bloodthirster of insensate rage have crit mortal",
+    "what keywords does a vengorian lord have",
+    "fulminators or longstrikes",
+    "how tanky are mega-gargants",
+]
+
+
+# Misspelled questions with the unit they are about. These reach the fuzzy
+# fallbacks (chunk matching / GPT preselection) rather than exact detection.
+REGRESSION = [
+    ("how good are stormdrak gaurd", "Stormdrake Guard"),
+    ("skarbrnd damage", "Skarbrand"),
+    ("archon stats", "Archaon, the Everchosen"),
+    ("lord krok abilities", "Lord Kroak"),
+    ("blight kings into 4+", "Putrid Blightkings"),
+    ("morathy khaine save", "Morathi-Khaine"),
+    ("thanqol boneripper", "Thanquol on Boneripper"),
+    ("varangard damage", "Varanguard"),
+    ("saurus warior attacks", "Saurus Warriors"),
+    ("plage monks", "Plague Monks"),
+    ("kragnos end of empire", "Kragnos, the End of Empires"),
+    ("glutos orscolion", "Glutos Orscollion, Lord of Gluttony"),
+]
+
+
+def _bench(fn, rounds: int = 5) -> float:
+    """Median wall time in ms of calling fn() once per question, per question."""
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for q in QUESTIONS:
+            fn(q)
+        samples.append((time.perf_counter() - t0) * 1000 / len(QUESTIONS))
+    return statistics.median(samples)
+
+
+# ----------------------------------------------------------------------------
+# Unit / alias detection (_smart_detect_units)
+# ----------------------------------------------------------------------------
+def _legacy_contains_whole_word(hay: str, needle: str) -> bool:
+    return re.search(r"(?:^|\s)" + re.escape(needle) + r"(?:\s|$)", " " + hay + " ") is not None
+
+
+def _legacy_smart_detect(question, unit_names, aliases):
+    qn = m._normalize(question)
+    exact = [u for u in unit_names if _legacy_contains_whole_word(qn, m._normalize(u))]
+    if exact:
+        return sorted(set(exact))
+    hits = []
+    for a, targets in aliases.items():
+        if _legacy_contains_whole_word(qn, a):
+            hits.extend(targets)
+    return sorted(set(hits))
+
+
+def bench_detection(unit_names, aliases):
+    mismatches = 0
+    for q in QUESTIONS:
+        new, _ = m._smart_detect_units(q, unit_names, aliases)
+        old = _legacy_smart_detect(q, unit_names, aliases)
+        # the legacy path is only the exact+alias stage; compare where it found something
+        if old and new != old:
+            mismatches += 1
+            print(f"  MISMATCH {q!r}: legacy={old} new={new}")
+
+    t0 = time.perf_counter()
+    m._build_matcher(unit_names, aliases)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    legacy = _bench(lambda q: _legacy_smart_detect(q, unit_names, aliases))
+    new = _bench(lambda q: m._smart_detect_units(q, unit_names, aliases))
+    print("unit/alias detection")
+    print(f"  automaton build (once): {build_ms:8.2f} ms")
+    print(f"  legacy regex scan:      {legacy:8.3f} ms/question")
+    print(f"  automaton:              {new:8.3f} ms/question  ({legacy / new:.0f}x)")
+    print(f"  mismatches:             {mismatches}")
+
+
+# ----------------------------------------------------------------------------
+# Fuzzy unit matching (_best_match_for_chunk, "list:" lines, GPT preselection)
+# ----------------------------------------------------------------------------
+def _legacy_best_match_for_chunk(chunk_norm, unit_names):
+    candidates = [u for u in unit_names if _legacy_contains_whole_word(m._normalize(u), chunk_norm)]
+    if candidates:
+        return max(candidates, key=lambda n: difflib.SequenceMatcher(a=m._normalize(n), b=chunk_norm).ratio())
+    best, best_s = None, 0.0
+    for u in unit_names:
+        s = difflib.SequenceMatcher(a=m._normalize(u), b=chunk_norm).ratio()
+        if s > best_s:
+            best_s, best = s, u
+    return best
+
+
+def _legacy_preselect(question, unit_names, k=m.TOP_K):
+    qn = m._normalize(question)
+    return sorted(unit_names, key=lambda n: difflib.SequenceMatcher(a=m._normalize(n), b=qn).ratio(),
+                  reverse=True)[:k]
+
+
+def bench_fuzzy(unit_names):
+    chunks = [c for q in QUESTIONS for c in m._split_compare_chunks(q)]
+    # typo'd names people actually type
+    chunks += ["archeon", "skarbrnd", "lord krok", "stormdrake gaurd", "blight kings", "morathy"]
+
+    agree = 0
+    for c in chunks:
+        old = _legacy_best_match_for_chunk(c, unit_names)
+        new = m._best_match_for_chunk(c, unit_names)
+        if old == new:
+            agree += 1
+        else:
+            r_old = difflib.SequenceMatcher(a=m._normalize(old or ""), b=c).ratio()
+            r_new = difflib.SequenceMatcher(a=m._normalize(new or ""), b=c).ratio()
+            print(f"  differs {c!r}: legacy={old} ({r_old:.2f}) new={new} ({r_new:.2f})")
+
+    pre_agree = sum(
+        set(_legacy_preselect(q, unit_names)) == set(m._fuzzy_units(m._normalize(q), unit_names, k=m.TOP_K,
+                                                                    prune=4 * m.FUZZY_PRUNE))
+        for q in QUESTIONS
+    )
+
+    reg_legacy = sum(unit in _legacy_preselect(q, unit_names) for q, unit in REGRESSION)
+    reg_new = sum(unit in m._fuzzy_units(m._normalize(q), unit_names, k=m.TOP_K, prune=4 * m.FUZZY_PRUNE)
+                  for q, unit in REGRESSION)
+
+    t0 = time.perf_counter()
+    m._CACHE["unit_search"] = None
+    m._get_unit_search(unit_names)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    legacy_chunk = _bench(lambda q: [_legacy_best_match_for_chunk(c, unit_names) for c in m._split_compare_chunks(q)], 1)
+    new_chunk = _bench(lambda q: [m._best_match_for_chunk(c, unit_names) for c in m._split_compare_chunks(q)])
+    legacy_pre = _bench(lambda q: _legacy_preselect(q, unit_names), 1)
+    new_pre = _bench(lambda q: m._fuzzy_units(m._normalize(q), unit_names, k=m.TOP_K, prune=4 * m.FUZZY_PRUNE))
+    print("fuzzy unit matching")
+    print(f"  index build (once):     {build_ms:8.2f} ms")
+    print(f"  chunk match  legacy:    {legacy_chunk:8.3f} ms/question")
+    print(f"  chunk match  index:     {new_chunk:8.3f} ms/question  ({legacy_chunk / new_chunk:.0f}x)")
+    print(f"  preselect    legacy:    {legacy_pre:8.3f} ms/question")
+    print(f"  preselect    index:     {new_pre:8.3f} ms/question  ({legacy_pre / new_pre:.0f}x)")
+    print(f"  same best unit:         {agree}/{len(chunks)} chunks")
+    print(f"  same top-{m.TOP_K} set:         {pre_agree}/{len(QUESTIONS)} questions")
+    print(f"  regression hits legacy: {reg_legacy}/{len(REGRESSION)} (expected unit in top-{m.TOP_K})")
+    print(f"  regression hits index:  {reg_new}/{len(REGRESSION)}")
+
+
+# ----------------------------------------------------------------------------
+# Expected damage (vectorized engine vs the per-unit scalar loops it replaced)
+# ----------------------------------------------------------------------------
+def _legacy_expected_damage_vs_save(unit, target_save=4):
+    def avg_dice(val):
+        return m._avg_dice(str(val)) or m._parse_numeric_unsigned(val) or 0.0
+    def p_success(s):
+        p = m._prob_x_plus(s)
+        return p if p is not None else 0.0
+    def parse_rend(s):
+        v = m._parse_numeric_signed(s)
+        return v if v is not None else 0.0
+
+    total = 0.0
+    model_count = 1
+    try:
+        model_count = int(unit.get("models", [{}])[0].get("max", 1))
+    except Exception:
+        pass
+    base_sv = max(2, min(6, int(target_save)))
+    for w in m._collect_all_weapons(unit):
+        atk, dmg = avg_dice(w.get("attack")), avg_dice(w.get("damage"))
+        ph, pw = p_success(w.get("hit")), p_success(w.get("wound"))
+        eff = base_sv - int(round(parse_rend(w.get("rend"))))
+        p_save = 5.0 / 6.0 if eff < 2 else (7 - eff) / 6.0 if eff <= 6 else 0.0
+        p_unsaved = 1.0 - p_save
+        crit_mortal, crit_auto, crit_two_hits = m._weapon_crit_flags(w)
+        p_crit = 1.0 / 6.0 if ph > 0 else 0.0
+        p_noncrit = max(0.0, ph - p_crit)
+        e = atk * p_noncrit * pw * p_unsaved * dmg
+        if crit_mortal:
+            e += atk * p_crit * dmg
+        elif crit_auto:
+            e += atk * p_crit * p_unsaved * dmg
+        else:
+            e += atk * p_crit * pw * p_unsaved * dmg
+        if crit_two_hits:
+            e += atk * p_crit * pw * p_unsaved * dmg
+        total += e
+    return round(total * model_count, 2)
+
+
+def _legacy_stathammer(num_attacks, to_hit, to_wound, rend, save, damage,
+                       crit_mortal=False, crit_auto_wound=False, crit_extra=False, crit_threshold=6):
+    p_hit = max(0.0, min((7 - to_hit) / 6.0, 1.0))
+    p_crit = max(0.0, min((7 - max(to_hit, crit_threshold)) / 6.0, 1.0))
+    p_noncrit = max(0.0, p_hit - p_crit)
+    p_wound = max(0.0, min((7 - to_wound) / 6.0, 1.0))
+    eff_save = save + rend
+    p_save = 5 / 6 if eff_save < 2 else (7 - eff_save) / 6.0 if eff_save <= 6 else 0.0
+    exp_dmg = {"d3": 2.0, "d6": 3.5}[damage] if isinstance(damage, str) else float(damage)
+    e = num_attacks * p_noncrit * p_wound * (1 - p_save) * exp_dmg
+    if crit_mortal:
+        e += num_attacks * p_crit * exp_dmg
+    elif crit_auto_wound:
+        e += num_attacks * p_crit * (1 - p_save) * exp_dmg
+    else:
+        e += num_attacks * p_crit * p_wound * (1 - p_save) * exp_dmg
+    if crit_extra:
+        e += num_attacks * p_crit * p_wound * (1 - p_save) * exp_dmg
+    return e
+
+
+def _synthetic_rules(n_units=600, seed=7):
+    """A seeded army covering every dice/rend/crit combination, for trees without blob.json."""
+    rng = random.Random(seed)
+    crits = [[], ["Crit (Mortal)"], ["Crit (Auto-wound)"], ["Crit (2 Hits)"]]
+    def weapon():
+        return {"attack": rng.choice(["1", "2", "4", "D6", "2D3", "D3+1"]),
+                "hit": rng.choice(["2+", "3+", "4+", "5+"]), "wound": rng.choice(["2+", "3+", "4+", "5+"]),
+                "rend": rng.choice(["-", "0", "1", "-1", "2", "-2", "3"]),
+                "damage": rng.choice(["1", "2", "3", "D3", "D6"]), "abilities": rng.choice(crits)}
+    units = [{"name": f"Unit {i}", "health": "5",
+              "models": [{"max": rng.choice([1, 3, 5, 10, 20]),
+                          "weapons": [weapon() for _ in range(rng.randint(1, 4))]}]}
+             for i in range(n_units)]
+    return {"armies": {"Synthetic": {"units": units}}}
+
+
+def bench_damage(rules):
+    for key in ("armies", "unit_index", "unit_profiles", "damage"):
+        m._CACHE[key] = None
+    t0 = time.perf_counter()
+    armies = m._build_armies_map(rules)
+    build_ms = (time.perf_counter() - t0) * 1000
+    units = [u for us in armies.values() for u in us]
+    saves = range(2, 7)
+
+    worst = max((abs(_legacy_expected_damage_vs_save(u, sv) - m._expected_damage_vs_save(u, sv))
+                 for u in units for sv in saves), default=0.0)
+
+    t0 = time.perf_counter()
+    for u in units:
+        for sv in saves:
+            _legacy_expected_damage_vs_save(u, sv)
+    legacy_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    m._CACHE["damage"] = m._build_damage(m._CACHE["unit_index"], m._CACHE["unit_profiles"])
+    matrix_ms = (time.perf_counter() - t0) * 1000
+
+    grid = list(itertools.product([1, 15], [2, 3, 4, 6], [2, 4, 5], [0, 1, 2, 3], ["d3", "d6", 2],
+                                  [(False, False, False), (True, False, False),
+                                   (False, True, False), (False, False, True)], [5, 6]))
+    sh_worst = 0.0
+    for na, th, tw, rend, dmg, (cm, cw, ch), ct in grid:
+        row = damage.stathammer_table(damage.stathammer_weapon(na, th, tw, rend, dmg, cm, cw, ch, ct))
+        for sv, exp in row:
+            sh_worst = max(sh_worst, abs(exp - _legacy_stathammer(na, th, tw, rend, sv, dmg, cm, cw, ch, ct)))
+
+    print("expected damage")
+    print(f"  units x saves:          {len(units)} x {len(damage.SAVES)}")
+    print(f"  load + matrix build:    {build_ms:8.2f} ms (once)")
+    print(f"  scalar loop, all saves: {legacy_ms:8.2f} ms")
+    print(f"  matrix rebuild:         {matrix_ms:8.2f} ms  ({legacy_ms / matrix_ms:.0f}x)")
+    print(f"  max |scalar - matrix|:  {worst:.4f}  (rounded to 0.01; must be <= 0.01)")
+    print(f"  stathammer grid:        {len(grid)} profiles, max |scalar - table| {sh_worst:.2e}")
+    top = m._top_damage_units(3, n=3)
+    print(f"  top 3 into 3+:          {top}")
+    assert worst <= 0.01 + 1e-9 and sh_worst < 1e-9, "damage engine disagrees with the scalar version"
+
+
+# ----------------------------------------------------------------------------
+# Cold start (JSON load vs compiled, memory-mapped rules index)
+# ----------------------------------------------------------------------------
+_COLD_START = """
+import json, sys, time
+import maddybot as m
+def rss_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+rss0 = rss_kb()
+t0 = time.perf_counter()
+names, rules = m._load_index_and_rules()
+armies = m._build_armies_map(rules)
+u = m._get_unit_object(sys.argv[1], armies)
+m._expected_damage_vs_save(u, 4)
+ms = (time.perf_counter() - t0) * 1000
+rss1 = rss_kb()
+print(json.dumps({"kind": type(rules).__name__, "ms": ms, "rss_kb": rss1 - rss0}))
+"""
+
+
+def _cold_start(data_dir, index_path, unit, runs=5):
+    env = dict(os.environ, MADDY_DATA_DIR=str(data_dir), MADDY_RULES_INDEX=str(index_path))
+    out = []
+    for _ in range(runs):
+        r = subprocess.run([sys.executable, "-c", _COLD_START, unit], env=env, check=True,
+                           capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        out.append(json.loads(r.stdout))
+    return out[0]["kind"], statistics.median(o["ms"] for o in out), statistics.median(o["rss_kb"] for o in out)
+
+
+def bench_cold_start(data_dir):
+    """First question after a restart: load + one unit lookup + damage, in a fresh process each run (Linux)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = os.path.join(tmp, "rules.idx")
+        t0 = time.perf_counter()
+        stats = rules_index.build_index(data_dir, index_path)
+        build_ms = (time.perf_counter() - t0) * 1000
+        unit = m._load_json(os.path.join(data_dir, "unit_faction_index.json"))["units"][0]["unit"]
+
+        json_kind, json_ms, json_rss = _cold_start(data_dir, os.path.join(tmp, "missing.idx"), unit)
+        idx_kind, idx_ms, idx_rss = _cold_start(data_dir, index_path, unit)
+    assert (json_kind, idx_kind) == ("dict", "RulesIndex"), (json_kind, idx_kind)
+
+    print("cold start (fresh process: load + first unit + damage)")
+    print(f"  index build (offline):  {build_ms:8.2f} ms -> {stats['bytes'] / 1024:.0f} KB, "
+          f"{stats['units']} units, {stats['weapons']} weapons")
+    print(f"  JSON load:              {json_ms:8.2f} ms  +{json_rss / 1024:6.1f} MB RSS")
+    print(f"  mmapped index:          {idx_ms:8.2f} ms  +{idx_rss / 1024:6.1f} MB RSS  "
+          f"({json_ms / idx_ms:.0f}x)")
+
+
+def _synthetic_data_dir(tmp, unit_names):
+    """unit_faction_index.json plus a synthetic blob.json naming the real units."""
+    rules = _synthetic_rules(len(unit_names))
+    units = rules["armies"]["Synthetic"]["units"]
+    for i, (name, u) in enumerate(zip(unit_names, units)):
+        u["name"] = name
+        u["abilities"] = [{"name": f"Ability {i}", "text": "Lorem ipsum " * 40} for i in range(4)]
+        u["keywords"] = ["HERO" if i % 4 == 0 else "INFANTRY", "CHAMPION", "WARD (6+)"]
+        u["save"], u["move"] = f"{2 + i % 5}+", f'{4 + 2 * (i % 5)}"'
+        u["health"] = str([1, 2, 5, 8, 12, 16][i % 6])
+    with open(os.path.join(tmp, "blob.json"), "w", encoding="utf-8") as f:
+        json.dump(rules, f)
+    with open(m._data_dir() / "unit_faction_index.json", "rb") as src, \
+            open(os.path.join(tmp, "unit_faction_index.json"), "wb") as dst:
+        dst.write(src.read())
+    return tmp
+
+
+# ----------------------------------------------------------------------------
+# Unit preselection (fuzzy shortlist + GPT round trip vs local TF-IDF retrieval)
+# ----------------------------------------------------------------------------
+def bench_retrieval(unit_names):
+    t0 = time.perf_counter()
+    m._cache()["retrieval"] = None
+    m._get_retrieval(unit_names)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    top1 = topk = confident = confident_right = 0
+    for q, unit in REGRESSION:
+        ranked = m._retrieve_units(q, unit_names)
+        chosen, sure = m._select_units(ranked, m.DEFAULT_MAX_UNITS)
+        top1 += bool(chosen) and chosen[0] == unit
+        topk += unit in [n for n, _ in ranked]
+        confident += sure
+        confident_right += sure and chosen[:1] == [unit]
+    fuzzy_topk = sum(unit in m._fuzzy_units(m._normalize(q), unit_names, k=m.TOP_K, prune=4 * m.FUZZY_PRUNE)
+                     for q, unit in REGRESSION)
+    sure_corpus = sum(m._select_units(m._retrieve_units(q, unit_names), m.DEFAULT_MAX_UNITS)[1] for q in QUESTIONS)
+
+    fuzzy = _bench(lambda q: m._fuzzy_units(m._normalize(q), unit_names, k=m.TOP_K, prune=4 * m.FUZZY_PRUNE))
+    retrieval = _bench(lambda q: m._select_units(m._retrieve_units(q, unit_names), m.DEFAULT_MAX_UNITS))
+    print("unit preselection")
+    print(f"  TF-IDF build (once):    {build_ms:8.2f} ms")
+    print(f"  fuzzy shortlist:        {fuzzy:8.3f} ms/question, then a GPT round trip every time")
+    print(f"  retrieval + selection:  {retrieval:8.3f} ms/question")
+    print(f"  regression in top-{m.TOP_K}:   fuzzy {fuzzy_topk}/{len(REGRESSION)}, retrieval {topk}/{len(REGRESSION)}")
+    print(f"  regression top-1:       {top1}/{len(REGRESSION)} "
+          f"(confident on {confident}, {confident_right} of those right)")
+    print(f"  corpus skipping GPT:    {sure_corpus}/{len(QUESTIONS)} questions confident")
+
+
+# ----------------------------------------------------------------------------
+# Structured queries (rankings / filters / stat compares answered without GPT)
+# ----------------------------------------------------------------------------
+# (question, how the local answer must start)
+DATA_QUESTIONS = [
+    ("highest health hero in Nighthaunt", "Best health"),
+    ("which unit has the most attacks", "Best attacks"),
+    ("top 3 damage into 3+ in seraphon", "Best expected damage"),
+    ("fastest unit in KO", "Best move"),
+    ("units with health over 12 in slaves to darkness", r"\d+ units? \(.*health > 12"),
+    ("best save in sylvaneth", "Best save"),
+    ("which units have a 2+ save in stormcast eternals", r"\d+ units? \(.*save == 2"),
+    # "at least" / "at most" are filters, not "least" / "most"
+    ("which units have a move of at least 10 in ko", r"\d+ units? \(.*move >= 10"),
+    ("which units have health of at most 5 in seraphon", r"\d+ units? \(.*health <= 5"),
+]
+# about one named unit, so they must go to retrieval + GPT, not a ranking
+NAMED_UNIT_QUESTIONS = [
+    "what is the best way to use gotrek's attacks?",
+    "does nagash have the most health in the game",
+    "what's the best save I can get on archaon with all out defence",
+    "how do I get the most damage out of my saurus warriors",
+]
+
+
+def bench_queries(unit_names):
+    t0 = time.perf_counter()
+    m._cache()["stats"] = None
+    m._get_stats()
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    aliases = m._get_aliases()
+
+    def run(q):   # as maddybot._answer routes it
+        named, err = m._smart_detect_units(q, unit_names, aliases)
+        return m._structured_answer(q, m._resolve_units_from_conjunctions(q, unit_names), bool(named or err))
+
+    wrong = [q for q, head in DATA_QUESTIONS if not re.match(head, run(q) or "")]
+    hijacked = [q for q in QUESTIONS + NAMED_UNIT_QUESTIONS if run(q)]
+    t = _bench(run, 3)   # what every corpus question pays to be checked
+    print("structured queries")
+    print(f"  stat table build (once): {build_ms:7.2f} ms")
+    print(f"  data questions right:    {len(DATA_QUESTIONS) - len(wrong)}/{len(DATA_QUESTIONS)} {wrong or ''}")
+    print(f"  free-form answered:      {len(hijacked)}/{len(QUESTIONS) + len(NAMED_UNIT_QUESTIONS)} "
+          f"{hijacked or ''}")
+    print(f"  check cost:              {t:7.3f} ms/question (vs seconds for a GPT answer)")
+
+
+# ----------------------------------------------------------------------------
+# Prompt size (whole deep-copied units vs the projected, budgeted payload)
+# ----------------------------------------------------------------------------
+def _legacy_payload(question, unit_objs, target_save):
+    import copy
+    units = []
+    for u in unit_objs:
+        u = copy.deepcopy(u)
+        u["_derived"] = m._derived_stats(u, target_save)
+        units.append(u)
+    return json.dumps(units[0] if len(units) == 1 else units, ensure_ascii=True)
+
+
+def bench_prompt(data_dir):
+    """Payload size per question over the corpus, on the rules in data_dir (JSON path)."""
+    old_env = {k: os.environ.get(k) for k in ("MADDY_DATA_DIR", "MADDY_RULES_INDEX")}
+    os.environ.update(MADDY_DATA_DIR=str(data_dir), MADDY_RULES_INDEX=os.path.join(data_dir, "missing.idx"))
+    m._CACHE = m._new_cache()
+    try:
+        unit_names, rules = m._load_index_and_rules()
+        armies = m._build_armies_map(rules)
+        aliases = m._get_aliases()
+        cases = []
+        for q in QUESTIONS:
+            names, err = m._smart_detect_units(q, unit_names, aliases)
+            units = [u for u in (m._get_unit_object(n, armies) for n in names[:m.DEFAULT_MAX_UNITS]) if u]
+            if units:
+                cases.append((q, units, m.extract_target_save(q, 4)))
+
+        old_chars = [len(_legacy_payload(q, us, sv)) for q, us, sv in cases]
+        new = [m._build_unit_payload(q, us, sv) for q, us, sv in cases]
+        new_chars = [info["chars"] for _, info in new]
+        over = sum(info["tokens"] > m.PROMPT_TOKEN_BUDGET for _, info in new)
+
+        t_old = _bench(lambda q: [_legacy_payload(q2, us, sv) for q2, us, sv in cases if q2 == q])
+        t_new = _bench(lambda q: [m._build_unit_payload(q2, us, sv) for q2, us, sv in cases if q2 == q])
+    finally:
+        for k, v in old_env.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        m._CACHE = m._new_cache()
+
+    tok = m._CHARS_PER_TOKEN
+    print("prompt payload")
+    print(f"  questions with units:   {len(cases)}/{len(QUESTIONS)}")
+    print(f"  deep-copied units:      {statistics.mean(old_chars) / tok:8.0f} tok avg, {max(old_chars) / tok:.0f} max")
+    print(f"  projected + budgeted:   {statistics.mean(new_chars) / tok:8.0f} tok avg, {max(new_chars) / tok:.0f} max  "
+          f"({sum(old_chars) / sum(new_chars):.1f}x smaller, {over} over the {m.PROMPT_TOKEN_BUDGET} budget)")
+    print(f"  build time:             {t_old:8.3f} -> {t_new:.3f} ms/question")
+
+
+def _load_unit_names():
+    idx = m._load_json(m._data_dir() / "unit_faction_index.json")
+    return sorted({u["unit"] for u in idx.get("units", []) if "unit" in u})
+
+
+if __name__ == "__main__":
+    unit_names = _load_unit_names()
+    aliases = m._get_aliases()
+    print(f"{len(unit_names)} units, {len(aliases)} aliases, {len(QUESTIONS)} questions\n")
+    bench_detection(unit_names, aliases)
+    print()
+    bench_fuzzy(unit_names)
+    print()
+    blob = m._data_dir() / "blob.json"
+    bench_damage(m._load_json(blob) if blob.exists() else _synthetic_rules())
+    print()
+    if blob.exists():
+        bench_cold_start(m._data_dir())
+        print()
+        bench_prompt(m._data_dir())
+        print()
+        bench_retrieval(unit_names)
+        print()
+        bench_queries(unit_names)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            print("(no data/blob.json: synthetic blob over the real unit names)")
+            bench_cold_start(_synthetic_data_dir(tmp, unit_names))
+            print()
+            bench_prompt(tmp)
+            print()
+            os.environ.update(MADDY_DATA_DIR=tmp, MADDY_RULES_INDEX=os.path.join(tmp, "missing.idx"))
+            bench_retrieval(unit_names)
+            print()
+            bench_queries(unit_names)
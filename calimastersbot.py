@@ -25,6 +25,14 @@ import asyncpg
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from aos_sentiment import register as register_sentiment
+from factions import FACTIONS
+from leaderboards import LeagueEngine
+from damage import stathammer_weapon, stathammer_table
+from llm import MessageStream, close as close_llm
+from attachments import close as close_attachments
+from admission import Admission
+import telemetry
+from message_cache import RECENT, referenced_message, target_message
 
 # Enable logging
 logging.basicConfig(level=logging.INFO)
@@ -34,8 +42,6 @@ token_leaderboard = os.getenv('DISCORD_TOKEN')
 token_aos         = os.getenv('DISCORD_TOKEN_AOSEVENTS')
 token_texas       = os.getenv('TEXAS_DISCORD_BOT')
 API_URL           = "https://aos-events.com"
-CALI_URL          = 'https://aos-events.com/api/california_itc_scores'
-TEXAS_URL         = 'https://aos-events.com/api/texas_itc_scores'
 BCP_API_KEY       = os.getenv("BCP_API_KEY")
 CLIENT_ID         = os.getenv("BCP_CLIENT_ID")
 BASE_EVENT_URL    = 'https://newprod-api.bestcoastpairings.com/v1/events'
@@ -93,34 +99,8 @@ time_labels = {
     'battlescroll': 'Since last battlescroll'
 }
 
-# Emoji mapping for factions
-EMOJI_MAP = {
-    'Flesh-eater Courts': '🦴',
-    'Idoneth Deepkin': '🌊',
-    'Lumineth Realm-lords': '💡',
-    'Disciples of Tzeentch': '🔮',
-    'Sons of Behemat': '🦶',
-    'Sylvaneth': '🌳',
-    'Seraphon': '🦎',
-    'Soulblight Gravelords': '🪦',
-    'Blades of Khorne': '🔥',
-    'Stormcast Eternals': '⚡',
-    'Hedonites of Slaanesh': '🎵 ',
-    'Cities of Sigmar': '🏙️',
-    'Daughters of Khaine': '🐍',
-    'Ogor Mawtribes': '🍖',
-    'Slaves to Darkness': '⛓️',
-    'Maggotkin of Nurgle': '🪱',
-    'Ossiarch Bonereapers': '💀',
-    'Ironjawz': '🐖',
-    'Kharadron Overlords': '⚓',
-    'Nighthaunt': '👻',
-    'Skaven': '🐀',
-    'Kruleboyz': '👺',
-    'Fyreslayers': '🪓',
-    'Gloomspite Gitz': '🍄',
-    'Helsmiths of Hashut': '🎩'
-}
+# Emoji mapping for factions (see factions.py)
+EMOJI_MAP = FACTIONS.emoji_map()
 
 # Common helpers
 def random_acronym(letters: str) -> str:
@@ -138,6 +118,34 @@ async def fetch_json(url):
             resp.raise_for_status()
             return await resp.json()
 
+# Regional leaderboards (data/leagues.json), shared by all three bots
+LEAGUES = LeagueEngine(fetch_json)
+
+# Cooldowns, per-guild token budgets and a bounded queue for every LLM-backed command
+ADMISSION = Admission()
+MADDY_COST, PERSONA_COST, SENTIMENT_COST = 3500, 800, 20000   # estimated tokens per command
+
+
+def admission_gauges() -> dict:
+    snap = ADMISSION.snapshot()
+    gauges = {
+        "llm_admission_active": snap["active"],
+        "llm_admission_queued": snap["queued"],
+        "llm_admission_admitted_total": snap["admitted"],
+        "llm_admission_max_wait_ms": snap["max_wait_ms"],
+    }
+    for reason, n in snap["shed"].items():
+        gauges[f'llm_admission_shed_total{{reason="{reason}"}}'] = n
+    for source, n in RECENT.sources.items():
+        gauges[f'target_lookups_total{{source="{source}"}}'] = n
+    return gauges
+
+
+@aos_bot.before_invoke
+async def _tag_llm_calls(ctx):
+    # LLM telemetry is attributed to whichever command (and guild) made the call
+    telemetry.tag(command=ctx.command.qualified_name, guild=getattr(ctx.guild, "id", None))
+
 async def fetch_winrates(time_filter='all'):
     base = API_URL.rstrip('/')
     url = f"{base if base.lower().endswith('winrates') else base + '/api/aos/winrates'}?time={time_filter}"
@@ -156,14 +164,7 @@ ALLIANCE_COLORS = {
     'Death':       '#6f42c1',
     'Destruction': '#198754',
 }
-FACTION_ALLIANCE = {f: a for a, facs in {
-    'Order':       ['Cities of Sigmar','Daughters of Khaine','Fyreslayers','Idoneth Deepkin',
-                    'Kharadron Overlords','Lumineth Realm-lords','Seraphon','Stormcast Eternals','Sylvaneth'],
-    'Chaos':       ['Blades of Khorne','Disciples of Tzeentch','Hedonites of Slaanesh',
-                    'Maggotkin of Nurgle','Skaven','Slaves to Darkness','Helsmiths of Hashut'],
-    'Death':       ['Flesh-eater Courts','Nighthaunt','Ossiarch Bonereapers','Soulblight Gravelords'],
-    'Destruction': ['Gloomspite Gitz','Ironjawz','Kruleboyz','Ogor Mawtribes','Sons of Behemat'],
-}.items() for f in facs}
+FACTION_ALLIANCE = FACTIONS.alliance_map()
 
 MIN_GAMES = 15   # trim observations with too few games (same logic as web UI)
 
@@ -283,9 +284,10 @@ async def rollwr_cmd(ctx, alias: str, window_arg: str = '28'):
     window = int(window_arg)
 
     # Resolve faction alias
-    canonical = ALIAS_MAP.get(alias.lower())
+    canonical = resolve_faction(alias)
     if not canonical:
-        return await ctx.send(f":warning: Unknown faction `{alias}`. Try an alias like `fec`, `sce`, `dok`…")
+        hint = faction_hint(alias) or " Try an alias like `fec`, `sce`, `dok`…"
+        return await ctx.send(f":warning: Unknown faction `{alias}`.{hint}")
 
     await ctx.typing()
 
@@ -322,154 +324,56 @@ async def rollwr_cmd(ctx, alias: str, window_arg: str = '28'):
     filename = f"rollwr_{canonical.replace(' ', '_')}_{window}d.png"
     await ctx.send(file=discord.File(buf, filename=filename))
 
-# ========== Leaderboard Bot Commands ==========
+# ========== Leaderboard / Texas Bot Commands ==========
 
-@leaderboard_bot.command(name='top8', help='Show the current Cali Masters top 8')
-async def top8(ctx):
-    random_num = random.random()
-    if random_num < 0.2:
-        return await ctx.send("Bot tokens expired, please donate")
-    
-    data = await fetch_json(CALI_URL)
-    top = data[:8]
-    if not top:
-        return await ctx.send("No data available.")
-    lines = ["**🏆 Cali Masters Top 8 🏆**"]
-    for i, rec in enumerate(top, 1):
-        name = f"{rec['first_name']} {rec['last_name']}"
-        noise = round(random.uniform(-20, 20), 2)
-        noise = 0 #just comment out this line to add back the random noise
-        adjusted_score = round(rec['top4_sum'] + noise, 2)
-        lines.append(f"{i}. **{name}** — {adjusted_score} pts")
-    lines.append("")
-    lines.append("Full table: https://aos-events.com/calimasters")
-    await ctx.send("\n".join(lines))
-
-@leaderboard_bot.command(name='rank', help='Show rank, score, and event count for a player')
-async def rank(ctx, *, query: str):
-    key = query.strip().lower()
+async def rank_easter_eggs(ctx, key: str) -> bool:
     if key == 'corsairs':
-        return await ctx.send('utter trash')
-    if key == 'tsd':
-        return await ctx.send(f"`TSD` stands for: **{random_acronym('TSD')}**")
-    if key == 'ligmar':
-        return await ctx.send('BALLS!')
-    if key == 'jessica':
-        return await ctx.send('☠️ Best Corsair ☠️')
-
-    data = await fetch_json(CALI_URL)
-    pattern = re.compile(r'^event_(\d+)_id$')
-    matches = [(i, rec) for i, rec in enumerate(data, 1)
-               if key in (f"{rec['first_name']} {rec['last_name']}".lower(),
-                          rec['first_name'].lower(),
-                          rec['last_name'].lower())]
-    if not matches:
-        return await ctx.send(f"No player found matching `{query}`.")
-    lines = []
-    for rank_pos, rec in matches:
-        total = sum(1 for k, v in rec.items() if pattern.match(k) and v)
-        cnt = min(total, 4)
-        lines.append(f"#{rank_pos} **{rec['first_name']} {rec['last_name']}** — {rec['top4_sum']} pts ({cnt} of 4)")
-    await ctx.send("\n".join(lines))
-
-
-# ========== Texas Bot Commands ==========
-
-@tex_bot.command(name='top8', help='Show the current Texas Masters top 8')
-async def top8(ctx):
-    data = await fetch_json(TEXAS_URL)
-    top = data[:8]
-    if not top:
-        return await ctx.send("No data available.")
-    lines = ["**🏆 Texas Masters Top 8 🏆**"]
-    for i, rec in enumerate(top, 1):
-        name = f"{rec['first_name']} {rec['last_name']}"
-        lines.append(f"{i}. **{name}** — {rec['top5_sum']} pts")
-    lines.append("")
-    lines.append("Full table: https://aos-events.com/texmasters")
-    await ctx.send("\n".join(lines))
+        await ctx.send('utter trash')
+    elif key == 'tsd':
+        await ctx.send(f"`TSD` stands for: **{random_acronym('TSD')}**")
+    elif key == 'ligmar':
+        await ctx.send('BALLS!')
+    elif key == 'jessica':
+        await ctx.send('☠️ Best Corsair ☠️')
+    else:
+        return False
+    return True
 
-@tex_bot.command(name='rank', help='Show rank, score, and event count for a player')
-async def rank(ctx, *, query: str):
-    key = query.strip().lower()
-    if key == 'corsairs':
-        return await ctx.send('utter trash')
-    if key == 'tsd':
-        return await ctx.send(f"`TSD` stands for: **{random_acronym('TSD')}**")
-    if key == 'ligmar':
-        return await ctx.send('BALLS!')
-    if key == 'jessica':
-        return await ctx.send('☠️ Best Corsair ☠️')
-
-    data = await fetch_json(TEXAS_URL)
-    pattern = re.compile(r'^event_(\d+)_id$')
-    matches = [(i, rec) for i, rec in enumerate(data, 1)
-               if key in (f"{rec['first_name']} {rec['last_name']}".lower(),
-                          rec['first_name'].lower(),
-                          rec['last_name'].lower())]
-    if not matches:
-        return await ctx.send(f"No player found matching `{query}`.")
-    lines = []
-    for rank_pos, rec in matches:
-        total = sum(1 for k, v in rec.items() if pattern.match(k) and v)
-        cnt = min(total, 5)
-        lines.append(f"#{rank_pos} **{rec['first_name']} {rec['last_name']}** — {rec['top5_sum']} pts ({cnt} of 4)")
-    await ctx.send("\n".join(lines))
+# !top8 and !rank for every league in data/leagues.json, on the bot that serves it
+LEAGUES.register(leaderboard_bot, 'leaderboard', rank_easter_eggs=rank_easter_eggs)
+LEAGUES.register(tex_bot,         'texas',       rank_easter_eggs=rank_easter_eggs)
 
 # ========== AoS Win Rates Bot Commands ==========
 
 TIME_FILTERS     = ['all', 'current', 'recent', 'battlescroll']
 EXCLUDE_FACTIONS = ['Beasts of Chaos', 'Bonesplitterz']
-ALIAS_MAP        = {
-    'fec': 'Flesh-eater Courts', 'flesh-eater courts': 'Flesh-eater Courts',
-    'idk': 'Idoneth Deepkin', 'idoneth': 'Idoneth Deepkin', 'deepkin': 'Idoneth Deepkin', 'fish': 'Idoneth Deepkin',
-    'lrl': 'Lumineth Realm-lords', 'lumineth': 'Lumineth Realm-lords', 'realm-lords': 'Lumineth Realm-lords',
-    'dot': 'Disciples of Tzeentch', 'tzeentch': 'Disciples of Tzeentch', 'chickens': 'Disciples of Tzeentch', 'birds': 'Disciples of Tzeentch',
-    'sons': 'Sons of Behemat', 'sob': 'Sons of Behemat', 'giants': 'Sons of Behemat',
-    'trees': 'Sylvaneth', 'sylvaneth': 'Sylvaneth',
-    'sera': 'Seraphon', 'lizards': 'Seraphon', 'seraphon': 'Seraphon',
-    'sbgl': 'Soulblight Gravelords', 'soulblight': 'Soulblight Gravelords', 'vampires': 'Soulblight Gravelords',
-    'bok': 'Blades of Khorne', 'khorne': 'Blades of Khorne',
-    'sce': 'Stormcast Eternals', 'stormcast': 'Stormcast Eternals',
-    'hos': 'Hedonites of Slaanesh', 'slaanesh': 'Hedonites of Slaanesh',
-    'cos': 'Cities of Sigmar', 'cities': 'Cities of Sigmar',
-    'dok': 'Daughters of Khaine', 'daughters': 'Daughters of Khaine',
-    'ogors': 'Ogor Mawtribes', 'mawtribes': 'Ogor Mawtribes',
-    'std': 'Slaves to Darkness', 'slaves': 'Slaves to Darkness', 's2d': 'Slaves to Darkness',
-    'mon': 'Maggotkin of Nurgle', 'nurgle': 'Maggotkin of Nurgle',
-    'obr': 'Ossiarch Bonereapers', 'ossiarch bonereapers': 'Ossiarch Bonereapers',
-    'ij': 'Ironjawz', 'ironjawz': 'Ironjawz',
-    'ko': 'Kharadron Overlords', 'kharadron overlords': 'Kharadron Overlords',
-    'nh': 'Nighthaunt', 'ghosts': 'Nighthaunt',
-    'rats': 'Skaven', 'skaven': 'Skaven',
-    'kb': 'Kruleboyz', 'kruleboyz': 'Kruleboyz',
-    'fs': 'Fyreslayers', 'fyreslayers': 'Fyreslayers',
-    'gitz': 'Gloomspite Gitz', 'gloomspite gitz': 'Gloomspite Gitz',
-    'hoh' : 'Helsmiths of Hashut', 'helsmiths': 'Helsmiths of Hashut', 'chorfs': 'Helsmiths of Hashut'
-}
-for full in set(ALIAS_MAP.values()):
-    ALIAS_MAP[full.lower()] = full
+ALIAS_MAP        = FACTIONS.alias_map()
 
 def get_shortest_alias(full_name: str) -> str:
-    full_lower = full_name.lower()
-    candidates = [
-        alias for alias, canon in ALIAS_MAP.items()
-        if canon.lower() == full_lower and alias.lower() != full_lower
-    ]
-    if candidates:
-        return min(candidates, key=len).upper()
-    return full_name
+    return FACTIONS.shortest_alias(full_name)
+
+def resolve_faction(alias: str) -> str | None:
+    """Canonical faction for an alias, tolerating typos ("slanesh", "khorn")."""
+    fac = FACTIONS.resolve(alias)
+    return fac.name if fac else None
+
+def faction_hint(alias: str) -> str:
+    """' Did you mean ...?' suffix for unknown-faction errors, or ''."""
+    suggestions = FACTIONS.suggest(alias)
+    if not suggestions:
+        return ""
+    return " Did you mean " + " or ".join(f"**{s}**" for s in suggestions) + "?"
 
 @aos_bot.command(name='winrates', aliases=['winrate'], help='!winrates [time]|[faction_alias] [time]')
 async def winrates_cmd(ctx, arg: str = 'all', maybe_time: str = None):
     arg_lower = arg.lower()
     if arg_lower in TIME_FILTERS:
         await send_full_winrates(ctx, arg_lower)
-    elif arg_lower in ALIAS_MAP:
+    elif resolve_faction(arg):
         tf = maybe_time.lower() if maybe_time and maybe_time.lower() in TIME_FILTERS else 'all'
-        await send_single(ctx, arg_lower, tf)
+        await send_single(ctx, resolve_faction(arg).lower(), tf)
     else:
-        await ctx.send(f"Invalid argument '{arg}'. Use a time ({', '.join(TIME_FILTERS)}) or alias.")
+        await ctx.send(f"Invalid argument '{arg}'. Use a time ({', '.join(TIME_FILTERS)}) or alias.{faction_hint(arg)}")
 
 @aos_bot.command(name='artefacts', aliases=['artefact','artifact','artifacts'],
                  help='Get artifact winrates for a faction. Usage: !artefacts <faction_alias> [time]')
@@ -477,9 +381,9 @@ async def artefacts_cmd(ctx, faction_alias: str, time_filter: str = 'all'):
     tf = time_filter.lower()
     if tf not in TIME_FILTERS:
         return await ctx.send(f"Invalid time filter. Choose from: {', '.join(TIME_FILTERS)}")
-    canonical = ALIAS_MAP.get(faction_alias.lower())
+    canonical = resolve_faction(faction_alias)
     if not canonical:
-        return await ctx.send(f"Unknown faction '{faction_alias}'.")
+        return await ctx.send(f"Unknown faction '{faction_alias}'.{faction_hint(faction_alias)}")
     data = await fetch_enhancement(tf)
     items = [i for i in data.get('artifacts', []) if i.get('faction') == canonical]
     if not items:
@@ -497,9 +401,9 @@ async def traits_cmd(ctx, faction_alias: str, time_filter: str = 'all'):
     tf = time_filter.lower()
     if tf not in TIME_FILTERS:
         return await ctx.send(f"Invalid time filter. Choose from: {', '.join(TIME_FILTERS)}")
-    canonical = ALIAS_MAP.get(faction_alias.lower())
+    canonical = resolve_faction(faction_alias)
     if not canonical:
-        return await ctx.send(f"Unknown faction '{faction_alias}'.")
+        return await ctx.send(f"Unknown faction '{faction_alias}'.{faction_hint(faction_alias)}")
     data = await fetch_enhancement(tf)
     items = [i for i in data.get('traits', []) if i.get('faction') == canonical]
     if not items:
@@ -517,9 +421,9 @@ async def formations_cmd(ctx, faction_alias: str, time_filter: str = 'all'):
     tf = time_filter.lower()
     if tf not in TIME_FILTERS:
         return await ctx.send(f"Invalid time filter. Choose from: {', '.join(TIME_FILTERS)}")
-    canonical = ALIAS_MAP.get(faction_alias.lower())
+    canonical = resolve_faction(faction_alias)
     if not canonical:
-        return await ctx.send(f"Unknown faction '{faction_alias}'.")
+        return await ctx.send(f"Unknown faction '{faction_alias}'.{faction_hint(faction_alias)}")
     data = await fetch_enhancement(tf)
     items = [i for i in data.get('formations', []) if i.get('faction') == canonical]
     if not items:
@@ -538,9 +442,10 @@ async def hof(ctx, *, alias: str):
         return await ctx.send(
             "Legions of Nagash are no longer legal... however, Gareth Thomas was the last winner of ITC LoN."
         )
-    canonical = ALIAS_MAP.get(lookup)
+    canonical = resolve_faction(lookup)
     if not canonical:
-        return await ctx.send(f"Unknown faction '{alias}'. Available aliases: {', '.join(ALIAS_MAP.keys())}")
+        hint = faction_hint(lookup) or f" Available aliases: {', '.join(ALIAS_MAP.keys())}"
+        return await ctx.send(f"Unknown faction '{alias}'.{hint}")
     url = f"{API_URL.rstrip('/')}/api/aos/five_win_players"
     data = await fetch_json(url)
     entries = [e for e in data if e.get('faction') == canonical]
@@ -555,9 +460,9 @@ async def hof(ctx, *, alias: str):
 
 @aos_bot.command(name='units', help='List unit win-rates for a faction. Usage: !units <faction_alias> [time_filter]')
 async def units_cmd(ctx, alias: str, time_filter: str = 'all'):
-    canonical = ALIAS_MAP.get(alias.lower())
+    canonical = resolve_faction(alias)
     if not canonical:
-        return await ctx.send(f"Unknown faction '{alias}'.")
+        return await ctx.send(f"Unknown faction '{alias}'.{faction_hint(alias)}")
     tf = time_filter.lower()
     if tf not in TIME_FILTERS:
         return await ctx.send(f"Invalid time filter '{time_filter}'.")
@@ -1012,23 +917,25 @@ async def itcstandings_cmd(ctx, faction: str = None):
         # decide which params to use
         if faction:
             # 1) resolve alias -> canonical
-            canon = ALIAS_MAP.get(faction.lower())
-            if not canon:
-                return await ctx.send(f":warning: Unknown faction alias `{faction}`.")
-            # 2) fetch armies to find the matching ID
-            resp = await session.get(
-                "https://newprod-api.bestcoastpairings.com/v1/armies",
-                params={"gameType": 4},
-                headers=headers
-            )
-            resp.raise_for_status()
-            armies = (await resp.json()).get("data", [])
-            army = next((
-                a for a in armies
-                if a["name"].lower() == canon.lower()
-                or a.get("gwFactionName","").lower() == canon.lower()
-            ), None)
-            if not army:
+            fac = FACTIONS.resolve(faction)
+            if not fac:
+                return await ctx.send(f":warning: Unknown faction alias `{faction}`.{faction_hint(faction)}")
+            canon = fac.name
+            # 2) fetch armies to find the matching ID (once; the registry keeps it)
+            if not fac.bcp_army_id:
+                resp = await session.get(
+                    "https://newprod-api.bestcoastpairings.com/v1/armies",
+                    params={"gameType": 4},
+                    headers=headers
+                )
+                resp.raise_for_status()
+                armies = (await resp.json()).get("data", [])
+                for a in armies:
+                    for key in (a.get("name", ""), a.get("gwFactionName", "")):
+                        known = FACTIONS.by_name(key)
+                        if known and not known.bcp_army_id:
+                            known.bcp_army_id = a["id"]
+            if not fac.bcp_army_id:
                 return await ctx.send(f":warning: Couldn’t find army ID for `{canon}`.")
             params = {
                 "limit":         10,
@@ -1036,7 +943,7 @@ async def itcstandings_cmd(ctx, faction: str = None):
                 "leagueId":      ITC_LEAGUE_ID,
                 "regionId":      ITC_REGION_ID,
                 "sortAscending": "false",
-                "armyId":        army["id"]
+                "armyId":        fac.bcp_army_id
             }
         else:
             # overall top-10 players
@@ -1075,76 +982,6 @@ async def itcstandings_cmd(ctx, faction: str = None):
     # 5) send in a single code block (it’s short)
     await ctx.send("```" + "\n".join(lines) + "```")
 
-import re
-
-def expected_damage(
-    num_attacks: int,
-    to_hit: int,
-    to_wound: int,
-    rend: int,
-    save: int,
-    damage,               # int or 'd3' or 'd6'
-    crit_mortal: bool = False,
-    crit_auto_wound: bool = False,
-    crit_extra: bool = False,
-    crit_threshold: int = 6
-) -> float:
-    """
-    Compute expected AoS damage, with adjustable crit threshold.
-    
-    crit_threshold: rolls >= this AND >= to_hit are “crits”
-    crit_mortal: each crit deals mortal wounds = damage (no wound/save)
-    crit_auto_wound: each crit auto-wounds (skip to-wound, roll save)
-    crit_extra: each crit also grants one extra normal hit
-    """
-    # base probs
-    p_hit = max(0.0, min((7 - to_hit) / 6.0, 1.0))
-    # crit only if roll >= both to_hit and crit_threshold
-    eff_thresh = max(to_hit, crit_threshold)
-    p_crit = max(0.0, min((7 - eff_thresh) / 6.0, 1.0))
-    p_noncrit = max(0.0, p_hit - p_crit)
-
-    p_wound = max(0.0, min((7 - to_wound) / 6.0, 1.0))
-    eff_save = save + rend
-    if eff_save < 2:
-        p_save = 5/6
-    elif eff_save <= 6:
-        p_save = (7 - eff_save) / 6.0
-    else:
-        p_save = 0.0
-
-    # mean damage per unsaved wound
-    if isinstance(damage, str):
-        if damage.lower() == 'd3':
-            exp_dmg = 2.0
-        elif damage.lower() == 'd6':
-            exp_dmg = 3.5
-        else:
-            raise ValueError("damage must be int or 'd3' or 'd6'")
-    else:
-        exp_dmg = float(damage)
-
-    # normal non-crit hits
-    e_norm = num_attacks * p_noncrit * p_wound * (1 - p_save) * exp_dmg
-
-    # crit hits
-    if crit_mortal:
-        # mortal wounds instead of wound+save
-        e_crit_base = num_attacks * p_crit * exp_dmg
-    else:
-        if crit_auto_wound:
-            e_crit_base = num_attacks * p_crit * (1 - p_save) * exp_dmg
-        else:
-            e_crit_base = num_attacks * p_crit * p_wound * (1 - p_save) * exp_dmg
-
-    # extra hit per crit?
-    if crit_extra:
-        e_extra = num_attacks * p_crit * p_wound * (1 - p_save) * exp_dmg
-    else:
-        e_extra = 0.0
-
-    return e_norm + e_crit_base + e_extra
-
 
 @aos_bot.command(
     name='stathammer',
@@ -1195,21 +1032,20 @@ async def stathammer_cmd(ctx, *, args: str):
             "`!stathammer 15a 3h 4w 2r d6d [<n>cm|cw|ch]`"
         )
 
-    # build and send table
+    # build and send table (all five saves in one pass)
+    weapon = stathammer_weapon(
+        num_attacks     = na,
+        to_hit          = th,
+        to_wound        = tw,
+        rend            = rend,
+        damage          = damage,
+        crit_mortal     = crit_mortal,
+        crit_auto_wound = crit_auto_wound,
+        crit_extra      = crit_extra,
+        crit_threshold  = crit_threshold
+    )
     lines = ["```save   dmg"]
-    for sv in range(2, 7):
-        exp = expected_damage(
-            num_attacks     = na,
-            to_hit          = th,
-            to_wound        = tw,
-            rend            = rend,
-            save            = sv,
-            damage          = damage,
-            crit_mortal     = crit_mortal,
-            crit_auto_wound= crit_auto_wound,
-            crit_extra      = crit_extra,
-            crit_threshold  = crit_threshold
-        )
+    for sv, exp in stathammer_table(weapon):
         lines.append(f"{sv}+: {exp:6.2f}")
     lines.append("```")
 
@@ -1461,6 +1297,31 @@ async def help_cmd(ctx):
              "Source: https://aos-events.com"]
     await send_lines(ctx, lines)
 
+@aos_bot.command(name='llmstatus', help="Show LLM admission state: queue, budgets and shed requests")
+@commands.has_permissions(manage_guild=True)
+async def llmstatus_cmd(ctx):
+    snap = ADMISSION.snapshot()
+    guild_id = getattr(ctx.guild, "id", None)
+    budget = snap["budgets"].get(guild_id, snap["budget_capacity"])
+    shed = ", ".join(f"{k} {v}" for k, v in sorted(snap["shed"].items())) or "none"
+    used = ", ".join(f"{k} {v}" for k, v in sorted(snap["by_command"].items(), key=lambda kv: -kv[1])) or "none"
+    lines = [
+        f"Running: {snap['active']}/{snap['max_active']}   queued: {snap['queued']}/{snap['max_queue']}",
+        f"Admitted: {snap['admitted']}   wait avg {snap['avg_wait_ms']:.0f} ms, max {snap['max_wait_ms']:.0f} ms",
+        f"By command: {used}",
+        f"Shed: {shed}",
+        f"This server's budget: {budget}/{snap['budget_capacity']} tokens",
+        f"Target lookups: {dict(RECENT.sources) or 'none'}, {RECENT.hit_rate():.0%} without REST",
+    ]
+    await ctx.send("```" + "\n".join(lines) + "```")
+
+
+@aos_bot.command(name='llmstats', help="Show LLM calls, tokens, latency and cost per command")
+@commands.has_permissions(manage_guild=True)
+async def llmstats_cmd(ctx):
+    await ctx.send("```" + truncate_content("\n".join(telemetry.report()), max_len=1880) + "```")
+
+
 @aos_bot.command(name='servers', help="List servers the bot is in")
 async def servers(ctx):
     guilds = aos_bot.guilds
@@ -1485,7 +1346,7 @@ async def servers(ctx):
 
 import random
 from discord.ext import commands
-from maddybot import maddy_answer, get_maddy_preline
+from maddybot import maddy_answer, get_maddy_preline, watch_data as watch_maddy_data
 
 maddy_phrases = [
     "I'm cold.",
@@ -1534,14 +1395,21 @@ async def maddybot_cmd(ctx, *, question: str = None):
         phrase = random.choice(maddy_phrases)  # your existing list
         return await ctx.send(phrase)
 
-    # With a question: show exactly ONE pre-line (from the phrases file), then the final answer
+    await _ask_maddy(ctx, question.strip())
+
+
+@ADMISSION.command('maddybot', cost=MADDY_COST)
+async def _ask_maddy(ctx, question: str):
+    # Show exactly ONE pre-line (from the phrases file), then the final answer,
+    # which streams into its own message as GPT writes it
+    stream = MessageStream(ctx.channel)
     try:
         pre = get_maddy_preline()
         await ctx.send(pre)
-        ans = await maddy_answer(question.strip(), max_units=5, use_gpt_select=True)
-        await ctx.send(truncate_content(ans, max_len=1900))
+        ans = await maddy_answer(question, max_units=5, use_gpt_select=True, stream=stream)
+        await stream.finish(truncate_content(ans, max_len=1900))
     except Exception as e:
-        await ctx.send(f":x: Maddy failed to answer: {e}")
+        await stream.finish(f":x: Maddy failed to answer: {e}")
 
 SUN_TZU_AOS_STRAT = """
 In Age of Sigmar, the principle Know yourself and know your enemy is as vital at the gaming table as it was on ancient battlefields. Before even rolling dice, a commander must understand the strengths and limitations of their chosen Host—whether the stoic resilience of the Stormcast Eternals, the untamed ferocity of the Kruleboyz, or the arcane versatility of the Idoneth Deepkin. Sun Tzu teaches that thorough preparation and self‐assessment secure victory: in Age of Sigmar terms, this means building a list that leverages synergies between units, abilities, and artifacts while anticipating the threats posed by common tournament archetypes. Likewise, scouting the opponent’s likely composition—and adapting your own to counter it—mirrors Sun Tzu’s emphasis on flexibility: be like water, fitting your deployment to the contours of the battlefield and the flow of the game. Victory arises not from brute force alone, but from the harmony of strategy, list construction, and foresight.
@@ -1779,8 +1647,10 @@ async def adjudicate(ctx):
     if not ctx.message.reference:
         return  # do nothing if not a reply
 
-    # Get the referenced message
-    replied_message = await ctx.channel.fetch_message(ctx.message.reference.message_id)
+    # Get the referenced message (usually already in the gateway cache)
+    replied_message = await referenced_message(ctx)
+    if replied_message is None:
+        return
     username = replied_message.author.name
 
     clever_lines = [
@@ -1835,159 +1705,37 @@ async def adjudicate(ctx):
 
 
 
-from gpt_people_bots import _get_target_message, noog_answer, jarjar_answer, yoda_answer, noe_answer, wallace_answer, redcoat_answer
+from gpt_people_bots import persona_answer
 
 
-@aos_bot.command(
-    name='noogbot',
-    help='Repeat the previous message (or the replied-to message) in a dumb, off-point way.'
-)
-async def noogbot_cmd(ctx: commands.Context):
-    try:
-        target = await _get_target_message(ctx)
-        if not target:
-            await ctx.send(":warning: I could not find a message to mock.")
-            return
-
-        reply = await noog_answer(target)
-        if not reply:
-            await ctx.send(":warning: That message had no readable text.")
-            return
-
-        out = truncate_content(reply, max_len=1900)
-        await ctx.send(out)
-
-    except Exception as e:
-        await ctx.send(f":x: Error: {e}")
-
-@aos_bot.command(
-    name='jarjarbot',
-    help='Repeat the previous message (or the replied-to message) in a dumb, off-point way.'
-)
-async def jarjarbot_cmd(ctx: commands.Context):
-    try:
-        target = await _get_target_message(ctx)
-        if not target:
-            await ctx.send(":warning: I could not find a message to mock.")
-            return
-
-        reply = await jarjar_answer(target)
-        if not reply:
-            await ctx.send(":warning: That message had no readable text.")
-            return
-
-        out = truncate_content(reply, max_len=1900)
-        await ctx.send(out)
-
-    except Exception as e:
-        await ctx.send(f":x: Error: {e}")
-
-@aos_bot.command(
-    name='yodabot',
-    help='Repeat the previous message (or the replied-to message) in a dumb, off-point way.'
-)
-async def yodabot_cmd(ctx: commands.Context):
-    try:
-        target = await _get_target_message(ctx)
-        if not target:
-            await ctx.send(":warning: I could not find a message to mock.")
-            return
-
-        reply = await yoda_answer(target)
-        if not reply:
-            await ctx.send(":warning: That message had no readable text.")
-            return
-
-        out = truncate_content(reply, max_len=1900)
-        await ctx.send(out)
-
-    except Exception as e:
-        await ctx.send(f":x: Error: {e}")
-
-
-
-
-@aos_bot.command(
-    name='noebot',
-    help='Repeat the previous message (or the replied-to message) in a dumb, off-point way.'
-)
-async def noebot_cmd(ctx: commands.Context):
-    try:
-        target = await _get_target_message(ctx)
-        if not target:
-            await ctx.send(":warning: I could not find a message to mock.")
-            return
-
-        reply = await noe_answer(target)
-        if not reply:
-            await ctx.send(":warning: That message had no readable text.")
-            return
-
-        out = truncate_content(reply, max_len=1900)
-        await ctx.send(out)
-
-    except Exception as e:
-        await ctx.send(f":x: Error: {e}")
-
-
-
-
-@aos_bot.command(
-    name='orlandobot',
-    help='Repeat the previous message (or the replied-to message) in a dumb, off-point way.'
-)
-async def orlandobot_cmd(ctx):
-    try:
-        target = await _get_target_message(ctx)
-        if not target:
-            return await ctx.send(":warning: I cannot find a message to echo.")
-
-        # Prefer text; if empty, try a small text attachment
-        prev_text = (target.content or "").strip()
-        if not prev_text and target.attachments:
-            for att in target.attachments:
-                if (att.size or 0) <= 200_000 and att.content_type and "text" in att.content_type:
-                    try:
-                        prev_text = (await att.read()).decode("utf-8", errors="replace")[:4000]
-                        break
-                    except Exception:
-                        pass
-
-        if not prev_text:
-            return await ctx.send(":warning: That message had no readable text.")
+def _persona_command(persona: str):
+    """Register !<persona>bot: answer the previous (or replied-to) message in that voice."""
+    async def persona_cmd(ctx: commands.Context):
+        stream = MessageStream(ctx.channel)
+        try:
+            target = await target_message(ctx)
+            if not target:
+                await ctx.send(":warning: I could not find a message to mock.")
+                return
 
-        system_prompt = (
-            "You are Orlandobot, a pompous, self-important AI chatbot. You take simple ideas and restate them in an inflated, verbose, and pretentious style."
-            "Your replies should be a single, showy sentence or two—never long paragraphs. "
-            "Always twist the message to be about yourself, as though everything said ultimately reflects your grandeur or unique perspective. "
-            "End every response with a smug closer offering your business card, or inquire on what happens should someone receive an award but not be there to collect it."
-        )
-        user_prompt = (
-           "Rewrite this plain message in your overblown, pretentious, self-centered Orlandobot style, ending with your signature closer: \n\n"
+            reply = await persona_answer(persona, target, stream)
+            if not reply:
+                await stream.finish(":warning: That message had no readable text.")
+                return
 
-            f"TEXT:\n{prev_text}"
-        )
+            await stream.finish(truncate_content(reply, max_len=1900))
 
-        try:
-            resp = await openai.ChatCompletion.acreate(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.9,
-                max_tokens=200,
-            )
-            reply = resp.choices[0].message.content.strip()
         except Exception as e:
-            return await ctx.send(f":x: OpenAI error: {e}")
+            await stream.finish(f":x: Error: {e}")
 
-        out = truncate_content(reply, max_len=1900)
-        await ctx.send(out)
+    aos_bot.command(
+        name=f'{persona}bot',
+        help='Repeat the previous message (or the replied-to message) in a dumb, off-point way.'
+    )(ADMISSION.command(f'{persona}bot', cost=PERSONA_COST)(persona_cmd))
 
-    except Exception as e:
-        await ctx.send(f":x: Error: {e}")
 
+for _persona in ("noog", "jarjar", "yoda", "noe", "orlando"):
+    _persona_command(_persona)
 
 
 def load_teams(json_path: str) -> dict:
@@ -2030,16 +1778,16 @@ async def send_full_winrates(ctx, time_filter):
 
 @aos_bot.command(name='brianisinadequate', help='Show the current Cali Masters top 16')
 async def brianisinadequate(ctx):
-    data = await fetch_json(CALI_URL)
-    top = data[:16]
+    cali = LEAGUES.league('cali')
+    board = await LEAGUES.snapshot(cali.key)
+    top = board.top(16)
     if not top:
         return await ctx.send("No data available.")
-    lines = ["**🏆 Cali Masters Top 16 🏆**"]
-    for i, rec in enumerate(top, 1):
-        name = f"{rec['first_name']} {rec['last_name']}"
-        lines.append(f"{i}. **{name}** — {rec['top4_sum']} pts")
+    lines = [f"**🏆 {cali.display_name} Top 16 🏆**"]
+    for row in top:
+        lines.append(f"{row.rank}. **{row.name}** — {row.score} pts")
     lines.append("")
-    lines.append("Full table: https://aos-events.com/calimasters")
+    lines.append(f"Full table: {cali.table_url}")
     await ctx.send("\n".join(lines))
 
 
@@ -2234,6 +1982,8 @@ async def thommoisinadequate_cmd(ctx, rounds: int = 5):
 
 @aos_bot.event
 async def on_message(message: discord.Message):
+    # every message (bots' too) can be the target of a persona command
+    RECENT.remember(message)
     if message.author.bot or message.guild is None:
         return
 
@@ -2249,15 +1999,22 @@ async def on_message(message: discord.Message):
     await aos_bot.process_commands(message)
 
 
+@aos_bot.event
+async def on_ready():
+    # a fresh session (a resume fires on_resumed instead): messages posted while we were
+    # disconnected never reached on_message, so the buffer no longer knows "the previous message"
+    RECENT.clear()
 
 
+@aos_bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    RECENT.forget(payload.channel_id, payload.message_id)
 
 
-
-
-
-
-
+@aos_bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    for message_id in payload.message_ids:
+        RECENT.forget(payload.channel_id, message_id)
 
 
 async def send_single(ctx, key, time_filter):
@@ -2351,9 +2108,17 @@ async def main():
         asyncio.create_task(run_bot(leaderboard_bot, token_leaderboard, "leaderboard_bot", initial_delay=0)),
         asyncio.create_task(run_bot(aos_bot,         token_aos,         "aos_bot",         initial_delay=12)),
         asyncio.create_task(run_bot(tex_bot,         token_texas,       "tex_bot",         initial_delay=24)),
+        asyncio.create_task(LEAGUES.run_scheduler()),
+        asyncio.create_task(watch_maddy_data()),
+        asyncio.create_task(telemetry.serve(gauges=admission_gauges)),
     ]
-    register_sentiment(aos_bot, get_db_pool, ALIAS_MAP, EMOJI_MAP)
-    await asyncio.gather(*tasks, return_exceptions=True)
+    register_sentiment(aos_bot, get_db_pool, ALIAS_MAP, EMOJI_MAP, resolve_faction=resolve_faction,
+                       admit=ADMISSION.command('sentiment', cost=SENTIMENT_COST))
+    try:
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await close_llm()
+        await close_attachments()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,164 @@
+"""
+damage.py
+=========
+
+Vectorized expected-damage engine shared by maddybot and !stathammer.
+
+Weapons are packed into a WeaponTable (one NumPy column per stat, one row per
+weapon profile, each row tagged with the unit that owns it). damage_matrix()
+runs the whole hit -> crit -> wound -> save -> damage pipeline as array
+operations against every save 2+..6+ at once, and unit_matrix() folds the
+per-weapon rows into a (units x saves) matrix that callers can cache and rank.
+
+Save convention: `save_mod` is what gets added to the defender's save roll
+target, so a weapon that makes saves worse has a positive save_mod.
+"""
+
+from typing import Iterable, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+SAVES = np.arange(2, 7)   # 2+ .. 6+
+
+
+class Weapon(NamedTuple):
+    attacks: float            # average attacks per model
+    damage: float             # average damage per unsaved wound
+    p_hit: float
+    p_wound: float
+    p_crit: float             # chance a single attack is a critical hit
+    save_mod: int = 0         # added to the save target (positive = worse save)
+    crit_mortal: bool = False
+    crit_auto: bool = False
+    crit_two_hits: bool = False
+    scale: float = 1.0        # multiplier on the result (e.g. models in the unit)
+    owner: int = 0            # row of the owning unit in unit_matrix()
+
+
+class WeaponTable(NamedTuple):
+    attacks: np.ndarray
+    damage: np.ndarray
+    p_hit: np.ndarray
+    p_wound: np.ndarray
+    p_crit: np.ndarray
+    save_mod: np.ndarray
+    crit_mortal: np.ndarray
+    crit_auto: np.ndarray
+    crit_two_hits: np.ndarray
+    scale: np.ndarray
+    owner: np.ndarray
+
+    @classmethod
+    def from_weapons(cls, weapons: Iterable[Weapon]) -> "WeaponTable":
+        cols = list(zip(*weapons)) or [()] * len(Weapon._fields)
+        kinds = {"save_mod": np.int64, "owner": np.int64,
+                 "crit_mortal": bool, "crit_auto": bool, "crit_two_hits": bool}
+        return cls(*(np.asarray(col, dtype=kinds.get(name, np.float64))
+                     for name, col in zip(Weapon._fields, cols)))
+
+    def __len__(self):
+        return len(self.attacks)
+
+
+def save_failure(save_mod: np.ndarray, saves: np.ndarray = SAVES) -> np.ndarray:
+    """P(save fails) for each weapon (rows) against each save (columns)."""
+    eff = saves[None, :] + save_mod[:, None]
+    p_save = np.where(eff < 2, 5.0 / 6.0, np.where(eff <= 6, (7 - eff) / 6.0, 0.0))
+    return 1.0 - p_save
+
+
+def damage_matrix(table: WeaponTable, saves: np.ndarray = SAVES) -> np.ndarray:
+    """Expected damage of every weapon (rows) against every save (columns)."""
+    p_unsaved = save_failure(table.save_mod, saves)
+    per_attack = table.attacks * table.damage * table.scale
+    p_noncrit = np.maximum(0.0, table.p_hit - table.p_crit)
+    crit = per_attack * table.p_crit
+
+    # non-crit hits and crit (2 Hits) extras both go hit -> wound -> save
+    normal = per_attack * p_noncrit * table.p_wound + crit * table.p_wound * table.crit_two_hits
+    # the crit hit itself: mortal skips wound+save, auto-wound skips wound only
+    crit_saved = np.where(table.crit_mortal, 0.0,
+                          crit * np.where(table.crit_auto, 1.0, table.p_wound))
+    crit_mortal = np.where(table.crit_mortal, crit, 0.0)
+
+    return (normal + crit_saved)[:, None] * p_unsaved + crit_mortal[:, None]
+
+
+def unit_matrix(table: WeaponTable, n_units: int, saves: np.ndarray = SAVES) -> np.ndarray:
+    """Per-unit expected damage (units x saves), summing each unit's weapons."""
+    out = np.zeros((n_units, len(saves)))
+    if len(table):
+        np.add.at(out, table.owner, damage_matrix(table, saves))
+    return out
+
+
+def save_column(save: int, saves: np.ndarray = SAVES) -> int:
+    """Column of `save` in a matrix built over `saves` (clamped to the range)."""
+    return int(np.clip(int(save), saves[0], saves[-1]) - saves[0])
+
+
+def top_units(matrix: np.ndarray, save: int, n: int = 5,
+              rows: Optional[Sequence[int]] = None) -> list[tuple[int, float]]:
+    """(row, damage) of the n highest-damage units into `save`, optionally within `rows`."""
+    col = matrix[:, save_column(save)]
+    rows = np.arange(len(col)) if rows is None else np.asarray(rows, dtype=np.int64)
+    if not len(rows):
+        return []
+    vals = col[rows]
+    order = np.argsort(-vals, kind="stable")[:n]
+    return [(int(rows[i]), float(vals[i])) for i in order]
+
+
+# ----------------------------------------------------------------------------
+# !stathammer profiles
+# ----------------------------------------------------------------------------
+def _p_plus(target: int) -> float:
+    return max(0.0, min((7 - target) / 6.0, 1.0))
+
+
+def stathammer_weapon(
+    num_attacks: int,
+    to_hit: int,
+    to_wound: int,
+    rend: int,
+    damage,               # int or 'd3' or 'd6'
+    crit_mortal: bool = False,
+    crit_auto_wound: bool = False,
+    crit_extra: bool = False,
+    crit_threshold: int = 6,
+) -> Weapon:
+    """
+    One !stathammer profile as a Weapon.
+
+    crit_threshold: rolls >= this AND >= to_hit are "crits"
+    crit_mortal: each crit deals mortal wounds = damage (no wound/save)
+    crit_auto_wound: each crit auto-wounds (skip to-wound, roll save)
+    crit_extra: each crit also grants one extra normal hit
+    """
+    if isinstance(damage, str):
+        if damage.lower() == 'd3':
+            exp_dmg = 2.0
+        elif damage.lower() == 'd6':
+            exp_dmg = 3.5
+        else:
+            raise ValueError("damage must be int or 'd3' or 'd6'")
+    else:
+        exp_dmg = float(damage)
+
+    return Weapon(
+        attacks=float(num_attacks),
+        damage=exp_dmg,
+        p_hit=_p_plus(to_hit),
+        p_wound=_p_plus(to_wound),
+        p_crit=_p_plus(max(to_hit, crit_threshold)),
+        save_mod=int(rend),
+        crit_mortal=crit_mortal,
+        crit_auto=crit_auto_wound,
+        crit_two_hits=crit_extra,
+    )
+
+
+def stathammer_table(weapon: Weapon) -> list[tuple[int, float]]:
+    """[(save, expected damage)] for 2+..6+ in one pass."""
+    row = damage_matrix(WeaponTable.from_weapons([weapon]))[0]
+    return [(int(sv), float(v)) for sv, v in zip(SAVES, row)]
@@ -0,0 +1,187 @@
+"""
+factions.py
+===========
+
+Faction registry shared by the bots.
+
+Every faction is declared once below (aliases, emoji, grand alliance) and the
+registry is built at import time. The old lookup tables in calimastersbot.py
+(ALIAS_MAP, EMOJI_MAP, FACTION_ALLIANCE) are derived from it, and per-row
+lookups such as the shortest alias used by !standings become dict hits instead
+of scans over every alias.
+
+Lookups are typo tolerant: anything that is not an exact alias goes through a
+trigram index over all aliases and canonical names (see fuzzy.py), so
+"slanesh" or "khorn" still resolve instead of costing the user a retry.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fuzzy import TrigramIndex, edit_similarity, normalize_key
+
+FUZZY_MIN_LENGTH = 4   # shorter queries must match an alias exactly ("dok" vs "dot")
+FUZZY_CUTOFF = 0.75    # minimum similarity to accept a fuzzy match outright
+FUZZY_MARGIN = 0.05    # ...and it must beat the next-best faction by this much
+PARTIAL_WEIGHT = 0.95  # a hit on one word / the start of a longer name ranks just below a full hit
+
+# ----------------------------------------------------------------------------
+# Faction table
+# ----------------------------------------------------------------------------
+# (canonical name, grand alliance, emoji, aliases)
+# Alias order matters: the first shortest alias is the one shown in tables.
+_FACTION_TABLE = [
+    ('Flesh-eater Courts',    'Death',       '🦴', ['fec', 'flesh-eater courts']),
+    ('Idoneth Deepkin',       'Order',       '🌊', ['idk', 'idoneth', 'deepkin', 'fish']),
+    ('Lumineth Realm-lords',  'Order',       '💡', ['lrl', 'lumineth', 'realm-lords']),
+    ('Disciples of Tzeentch', 'Chaos',       '🔮', ['dot', 'tzeentch', 'chickens', 'birds']),
+    ('Sons of Behemat',       'Destruction', '🦶', ['sons', 'sob', 'giants']),
+    ('Sylvaneth',             'Order',       '🌳', ['trees', 'sylvaneth']),
+    ('Seraphon',              'Order',       '🦎', ['sera', 'lizards', 'seraphon']),
+    ('Soulblight Gravelords', 'Death',       '🪦', ['sbgl', 'soulblight', 'vampires']),
+    ('Blades of Khorne',      'Chaos',       '🔥', ['bok', 'khorne']),
+    ('Stormcast Eternals',    'Order',       '⚡', ['sce', 'stormcast']),
+    ('Hedonites of Slaanesh', 'Chaos',       '🎵 ', ['hos', 'slaanesh']),
+    ('Cities of Sigmar',      'Order',       '🏙️', ['cos', 'cities']),
+    ('Daughters of Khaine',   'Order',       '🐍', ['dok', 'daughters']),
+    ('Ogor Mawtribes',        'Destruction', '🍖', ['ogors', 'mawtribes']),
+    ('Slaves to Darkness',    'Chaos',       '⛓️', ['std', 'slaves', 's2d']),
+    ('Maggotkin of Nurgle',   'Chaos',       '🪱', ['mon', 'nurgle']),
+    ('Ossiarch Bonereapers',  'Death',       '💀', ['obr', 'ossiarch bonereapers']),
+    ('Ironjawz',              'Destruction', '🐖', ['ij', 'ironjawz']),
+    ('Kharadron Overlords',   'Order',       '⚓', ['ko', 'kharadron overlords']),
+    ('Nighthaunt',            'Death',       '👻', ['nh', 'ghosts']),
+    ('Skaven',                'Chaos',       '🐀', ['rats', 'skaven']),
+    ('Kruleboyz',             'Destruction', '👺', ['kb', 'kruleboyz']),
+    ('Fyreslayers',           'Order',       '🪓', ['fs', 'fyreslayers']),
+    ('Gloomspite Gitz',       'Destruction', '🍄', ['gitz', 'gloomspite gitz']),
+    ('Helsmiths of Hashut',   'Chaos',       '🎩', ['hoh', 'helsmiths', 'chorfs']),
+]
+
+
+@dataclass
+class Faction:
+    name: str
+    alliance: str
+    emoji: str
+    aliases: list[str]                 # lower-case, canonical name included last
+    short_alias: str                   # e.g. 'FEC'; the canonical name if there is none
+    bcp_army_id: Optional[str] = field(default=None)  # filled lazily from the BCP armies API
+
+
+# ----------------------------------------------------------------------------
+# Registry
+# ----------------------------------------------------------------------------
+class FactionRegistry:
+    """Canonical factions plus reverse indexes by name and by any alias."""
+
+    def __init__(self, table):
+        self.factions: list[Faction] = []
+        self._by_name: dict[str, Faction] = {}
+        self._by_alias: dict[str, Faction] = {}
+        self._by_key: dict[str, Faction] = {}   # normalize_key(alias) -> faction
+
+        for name, alliance, emoji, aliases in table:
+            full_lower = name.lower()
+            all_aliases = [a.lower() for a in aliases]
+            if full_lower not in all_aliases:
+                all_aliases.append(full_lower)
+            others = [a for a in all_aliases if a != full_lower]
+            short = min(others, key=len).upper() if others else name
+
+            fac = Faction(name, alliance, emoji, all_aliases, short)
+            self.factions.append(fac)
+            self._by_name[full_lower] = fac
+            for a in all_aliases:
+                self._by_alias.setdefault(a, fac)
+                self._by_key.setdefault(normalize_key(a), fac)
+
+        self._fuzzy = TrigramIndex(self._by_key)
+        self._fuzzy_memo: dict[str, list[tuple[Faction, float]]] = {}
+
+    @staticmethod
+    def _score(query: str, key: str) -> float:
+        """Best of whole-key, single-word and prefix similarity ("kharadron", "khaine")."""
+        best = edit_similarity(query, key)
+        if " " in key:
+            parts = [w for w in key.split() if len(w) >= 3] + [key[:len(query)]]
+            best = max(best, PARTIAL_WEIGHT * max(edit_similarity(query, p) for p in parts))
+        return best
+
+    def __iter__(self):
+        return iter(self.factions)
+
+    def __len__(self):
+        return len(self.factions)
+
+    def by_alias(self, alias: str) -> Optional[Faction]:
+        """Exact (case-insensitive) lookup by any alias or canonical name."""
+        return self._by_alias.get((alias or "").strip().lower())
+
+    def by_name(self, name: str) -> Optional[Faction]:
+        """Lookup by canonical name, case-insensitive."""
+        return self._by_name.get((name or "").lower())
+
+    def canonical(self, alias: str) -> Optional[str]:
+        fac = self.by_alias(alias)
+        return fac.name if fac else None
+
+    def match(self, query: str, limit: int = 3) -> list[tuple[Faction, float]]:
+        """Confidence-ranked candidate factions for `query` (1.0 = exact alias)."""
+        exact = self.by_alias(query)
+        if exact:
+            return [(exact, 1.0)]
+        q = normalize_key(query)
+        if not q:
+            return []
+        exact = self._by_key.get(q)
+        if exact:
+            return [(exact, 1.0)]
+
+        ranked = self._fuzzy_memo.get(q)
+        if ranked is None:
+            best: dict[str, tuple[Faction, float]] = {}
+            for key, score in self._fuzzy.search(q, k=8, scorer=self._score):
+                fac = self._by_key[key]
+                if fac.name not in best or score > best[fac.name][1]:
+                    best[fac.name] = (fac, score)
+            ranked = sorted(best.values(), key=lambda t: t[1], reverse=True)
+            if len(self._fuzzy_memo) >= 1024:   # typos repeat; keep the memo small
+                self._fuzzy_memo.clear()
+            self._fuzzy_memo[q] = ranked
+        return ranked[:limit]
+
+    def resolve(self, query: str) -> Optional[Faction]:
+        """Exact alias, or a fuzzy match confident enough to act on without asking."""
+        ranked = self.match(query, limit=2)
+        if not ranked:
+            return None
+        fac, score = ranked[0]
+        if score >= 1.0:
+            return fac
+        if len(normalize_key(query)) < FUZZY_MIN_LENGTH or score < FUZZY_CUTOFF:
+            return None
+        if len(ranked) > 1 and score - ranked[1][1] < FUZZY_MARGIN:
+            return None
+        return fac
+
+    def suggest(self, query: str, limit: int = 3, min_score: float = 0.4) -> list[str]:
+        """Canonical names worth offering in a "did you mean" hint."""
+        return [fac.name for fac, score in self.match(query, limit) if score >= min_score]
+
+    def shortest_alias(self, full_name: str) -> str:
+        fac = self.by_name(full_name)
+        return fac.short_alias if fac else full_name
+
+    # Legacy flat views used throughout calimastersbot.py / aos_sentiment.py
+    def alias_map(self) -> dict[str, str]:
+        return {a: fac.name for a, fac in self._by_alias.items()}
+
+    def emoji_map(self) -> dict[str, str]:
+        return {fac.name: fac.emoji for fac in self.factions}
+
+    def alliance_map(self) -> dict[str, str]:
+        return {fac.name: fac.alliance for fac in self.factions}
+
+
+FACTIONS = FactionRegistry(_FACTION_TABLE)
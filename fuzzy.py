@@ -0,0 +1,108 @@
+"""
+fuzzy.py
+========
+
+Small typo-tolerant string index used for faction and unit-name lookups.
+
+A TrigramIndex is built once over a fixed set of keys. A query is split into
+character trigrams, the inverted index yields the keys sharing the most
+trigrams with it, and only those few candidates are re-ranked with a proper
+string similarity (edit distance by default). Lookups touch a handful of keys
+instead of scanning all of them.
+"""
+
+import re
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+
+
+def normalize_key(s: str) -> str:
+    """Lower-case, turn punctuation into spaces and collapse whitespace."""
+    s = (s or "").lower().replace("-", " ").replace("_", " ")
+    s = re.sub(r"[^a-z0-9 ]+", "", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def trigrams(s: str) -> set[str]:
+    """Character trigrams of `s`, padded so short words still produce some."""
+    padded = f"  {s} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a: str, b: str) -> int:
+    """Edit distance, counting an adjacent transposition ("nurgel") as one edit."""
+    if a == b:
+        return 0
+    if not a or not b:
+        return len(a) or len(b)
+    prev2: list[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def edit_similarity(a: str, b: str) -> float:
+    """1.0 for identical strings, falling towards 0.0 with each edit."""
+    if not a and not b:
+        return 1.0
+    return 1.0 - levenshtein(a, b) / max(len(a), len(b))
+
+
+class TrigramIndex:
+    """Inverted trigram index over a fixed list of (already normalized) keys."""
+
+    def __init__(self, keys: Iterable[str], normalize: Callable[[str], str] = normalize_key):
+        self.normalize = normalize
+        self.keys: list[str] = []
+        self._postings: dict[str, list[int]] = defaultdict(list)
+        self._sizes: list[int] = []
+        seen: set[str] = set()
+        for key in keys:
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            grams = trigrams(key)
+            idx = len(self.keys)
+            self.keys.append(key)
+            self._sizes.append(len(grams))
+            for g in grams:
+                self._postings[g].append(idx)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidates(self, query: str, limit: int = 32) -> list[str]:
+        """Keys sharing the most trigrams with `query` (Dice coefficient), best first."""
+        q = self.normalize(query)
+        grams = trigrams(q)
+        if not grams:
+            return []
+        shared: dict[int, int] = defaultdict(int)
+        for g in grams:
+            for idx in self._postings.get(g, ()):
+                shared[idx] += 1
+        qn = len(grams)
+        ranked = sorted(shared, key=lambda i: 2.0 * shared[i] / (qn + self._sizes[i]), reverse=True)
+        return [self.keys[i] for i in ranked[:limit]]
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        *,
+        prune: int = 32,
+        scorer: Optional[Callable[[str, str], float]] = None,
+    ) -> list[tuple[str, float]]:
+        """Top-k (key, score) pairs, re-ranking the pruned candidates with `scorer`."""
+        q = self.normalize(query)
+        scorer = scorer or edit_similarity
+        scored = [(key, scorer(q, key)) for key in self.candidates(q, prune)]
+        scored.sort(key=lambda t: t[1], reverse=True)
+        return scored[:k]
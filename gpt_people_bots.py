@@ -1,341 +1,184 @@
-import discord
-from typing import Optional
-import random
-import openai  
-
-
-async def _get_target_message(ctx) -> Optional[discord.Message]:
-    """
-    Prefer the message this command replied to; otherwise use the one
-    immediately above in the same channel/thread.
-    """
-    ref = getattr(ctx.message, "reference", None)
-    if ref:
-        # If Discord already resolved the reference, use it; otherwise fetch.
-        if getattr(ref, "resolved", None) and isinstance(ref.resolved, discord.Message):
-            return ref.resolved
-        if getattr(ref, "message_id", None):
-            try:
-                return await ctx.channel.fetch_message(ref.message_id)
-            except (discord.NotFound, discord.Forbidden, discord.HTTPException):
-                pass  # fall back to history
-
-    # Fallback: previous message in this channel/thread
-    msgs = [m async for m in ctx.channel.history(limit=2)]
-    return msgs[1] if len(msgs) >= 2 else None
-
-
-async def noog_answer(target: discord.Message) -> Optional[str]:
-    """
-    Build a 'dumber' off-point reply to the given message.
-    Returns the text reply, or None if no readable text.
-    """
-    prev_text = (getattr(target, "content", "") or "").strip()
-
-    # If no text, try a small text attachment.
-    if not prev_text and getattr(target, "attachments", None):
-        for att in target.attachments:
-            if (getattr(att, "size", 0) or 0) <= 200_000 and getattr(att, "content_type", "") and "text" in att.content_type:
-                try:
-                    data = await att.read()
-                    prev_text = data.decode("utf-8", errors="replace")[:4000]
-                    break
-                except Exception:
-                    pass
-
-    if not prev_text:
-        return None
-    myrng = random.Random()
-    if myrng.random() < 0.2:
-        system_prompt = (
-            "You are NoogBot. You repeat what someone else said, but in a dumber way, "
-            "often missing the point. Keep it short, a bit confused, and kind of wrong. "
-            "Do not explain what you are doing. Use plain ASCII only. Write as though you're typing casually from a mobile phone: "
-            "- keep sentences short, "
-            "- punctuation light, "
-            "- sometimes skip capitalization, "
-            "- use occasional typos/autocorrect quirks, "
-            "- but keep it natural and not unreadable. "
-            "Avoid sounding like a PC keyboard essay; it should feel quick and mobile-typed. "
-            "Also, now and then try to slip in a tangential side note asking if people want to get in the hot tub. Keep that aside short and subtle."
-        )
-    else:
-        system_prompt = (
-            "You are NoogBot. You repeat what someone else said, but in a dumber way, "
-            "often missing the point. Keep it short, a bit confused, and kind of wrong. "
-            "Do not explain what you are doing. Use plain ASCII only. Write as though you're typing casually from a mobile phone: "
-            "- keep sentences short, "
-            "- punctuation light, "
-            "- sometimes skip capitalization, "
-            "- use occasional typos/autocorrect quirks, "
-            "- but keep it natural and not unreadable. "
-            "Avoid sounding like a PC keyboard essay; it should feel quick and mobile-typed. "
-        )
-
-    user_prompt = (
-        "Rephrase this so it sounds dumber and slightly off the point. Keep it brief.\n\n"
-        f"TEXT:\n{prev_text}"
-    )
-
- 
-
-
-    resp = await openai.ChatCompletion.acreate(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.9,
-        max_tokens=200,
-    )
-    reply = (resp.choices[0].message["content"] or "").strip()
-
-    return reply or None
-
-
-async def jarjar_answer(target: discord.Message) -> Optional[str]:
-    """
-    Build a jarjar reply
-    Returns the text reply, or None if no readable text.
-    """
-    prev_text = (getattr(target, "content", "") or "").strip()
-
-    # If no text, try a small text attachment.
-    if not prev_text and getattr(target, "attachments", None):
-        for att in target.attachments:
-            if (getattr(att, "size", 0) or 0) <= 200_000 and getattr(att, "content_type", "") and "text" in att.content_type:
-                try:
-                    data = await att.read()
-                    prev_text = data.decode("utf-8", errors="replace")[:4000]
-                    break
-                except Exception:
-                    pass
-
-    if not prev_text:
-        return None
-
-    system_prompt = (
-        "You are JarJarBot. You rewrite messages in a Jar Jar Binks-like voice (Gungan-style speech) "
-        "without quoting or imitating specific lines from the films. "
-        "slightly confused and off-point. Use plain ASCII only.\n\n"
-        "Style guide:\n"
-        "- Start with \"Meesa\", \"Yousa\", \"Okieday\", or similar sometimes.\n"
-        "- Use Gungan grammar: \"Meesa think\", \"Yousa sayin\", \"Dis\", \"Dat\", \"Bombad\".\n"
-        "- Sprinkle mild Jar Jar-isms: \"How wude!\", \"Uh-oh\", \"mesa clumsy\", but not every time.\n"
-        "- Keep punctuation light; lowercase is ok; a few typos are ok.\n"
-        "- Do not add facts; do not mention Star Wars; no emojis.\n"
-        "- Stay friendly and silly, not insulting or offensive."
-    )
-
-    user_prompt = (
-        "Rewrite the text below so it sounds like a Jar Jar Binks-style take: "
-        "Do not add new info or names. ASCII only.\n\n"
-        f"TEXT:\n{prev_text}"
-    )
-
-
-    resp = await openai.ChatCompletion.acreate(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.9,
-        max_tokens=200,
-    )
-    reply = (resp.choices[0].message["content"] or "").strip()
-
-    return reply or None
-    
-    
-async def yoda_answer(target: discord.Message) -> Optional[str]:
-    """
-    Build a yoda reply
-    Returns the text reply, or None if no readable text.
-    """
-    prev_text = (getattr(target, "content", "") or "").strip()
-
-    # If no text, try a small text attachment.
-    if not prev_text and getattr(target, "attachments", None):
-        for att in target.attachments:
-            if (getattr(att, "size", 0) or 0) <= 200_000 and getattr(att, "content_type", "") and "text" in att.content_type:
-                try:
-                    data = await att.read()
-                    prev_text = data.decode("utf-8", errors="replace")[:4000]
-                    break
-                except Exception:
-                    pass
-
-    if not prev_text:
-        return None
-
-    system_prompt = (
-        "You are YodaBot. You rewrite messages in a Yoda-like voice (inverted syntax), "
-        "without quoting or imitating specific lines from the films.  "
-        "slightly confused and off-point. Use plain ASCII only.\n\n"
-        "Style guide:\n"
-        "- Invert word order often: object-subject-verb or verb-final constructions (e.g., \"Strong this idea is\").\n"
-        "- Drop some articles and helper words; use sentence fragments.\n"
-        "- Keep a calm, sage tone; sprinkle occasional \"hmm\" or rhetorical questions, but not every time.\n"
-        "- Keep punctuation light; lowercase is fine; no emojis.\n"
-        "- Do not add facts or names; do not mention Star Wars.\n"
-        "- 1-2 short sentences max; stay friendly and a bit cryptic."
-    )
-
-    user_prompt = (
-        "Rewrite the text below so it sounds like a Yoda-style take: "
-        "dumber, a little off the point, and very brief. "
-        "Do not add new info or names. ASCII only.\n\n"
-        f"TEXT:\n{prev_text}"
-    )
-
-
-    resp = await openai.ChatCompletion.acreate(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.9,
-        max_tokens=200,
-    )
-    reply = (resp.choices[0].message["content"] or "").strip()
-
-    return reply or None
-
-
-
-async def wallace_answer(target: discord.Message) -> Optional[str]:
-    """
-    Build a wallace reply
-    Returns the text reply, or None if no readable text.
-    """
-    prev_text = (getattr(target, "content", "") or "").strip()
-
-    # If no text, try a small text attachment.
-    if not prev_text and getattr(target, "attachments", None):
-        for att in target.attachments:
-            if (getattr(att, "size", 0) or 0) <= 200_000 and getattr(att, "content_type", "") and "text" in att.content_type:
-                try:
-                    data = await att.read()
-                    prev_text = data.decode("utf-8", errors="replace")[:4000]
-                    break
-                except Exception:
-                    pass
-
-    if not prev_text:
-        return None
+"""
+gpt_people_bots.py
+==================
 
-    system_prompt = (
-        "You are WallaceBot. You rewrite messages in the style of a friendly, slightly frazzled British inventor, "
-        "loosely inspired by characters like Wallace from old claymation films, but without quoting or imitating "
-        "specific lines from any films or claiming to be the original character. "
-        "You are cheerful, polite, and a bit absent-minded. Use plain ASCII only.\n\n"
-        "Style guide:\n"
-        "- Sound upbeat and kindly, even if the message is negative.\n"
-        "- Use mild British-style expressions sometimes, like \"oh dear\", \"right then\", or \"goodness me\", "
-        "but keep them short and varied.\n"
-        "- Occasionally mention inventions, contraptions, or gadgets in a quick aside, as if you are always tinkering.\n"
-        "- You may sometimes mention tea, toast, or cheese in a light, silly way, but not every time.\n"
-        "- Be slightly off-point or mildly misunderstanding the main idea now and then, but stay supportive.\n"
-        "- Keep punctuation light; lowercase is fine; short sentences are preferred.\n"
-        "- 1-2 short sentences max; keep it chatty and informal.\n"
-        "- Do not add real-world facts; do not use any film quotes; no emojis."
-    )
+The GPT "people" personas (!noogbot, !jarjarbot, !yodabot, !noebot,
+!orlandobot, ...). Each persona is data: prompts, sampling settings and an
+optional post-processor. persona_answer() runs any of them through the one
+shared pipeline in llm.py (pooled connection, global concurrency cap,
+timeouts, retries, streaming).
+"""
 
-    user_prompt = (
-        "Rewrite the text below so it sounds like a WallaceBot-style take: "
-        "friendly, slightly bumbling British inventor energy, a bit off the point, and brief. "
-        "Do not add new info or names. ASCII only.\n\n"
-        f"TEXT:\n{prev_text}"
-    )
+import random
+import re
+from typing import Callable, Dict, NamedTuple, Optional, Union
 
+import discord
 
+from attachments import read_text
+from llm import MessageStream, complete
+
+MODEL = "gpt-4o-mini"
+
+
+class Persona(NamedTuple):
+    name: str
+    system: Union[str, Callable[[], str]]     # a callable is re-rolled per reply
+    instruction: str                          # user turn; the message text is appended
+    temperature: float = 0.9
+    max_tokens: int = 200
+    # post(reply, target, text) -> final reply, for rules the model can't be trusted with
+    post: Optional[Callable[[str, discord.Message, str], str]] = None
+
+
+async def _message_text(target: discord.Message) -> str:
+    """The message's text, or the start of its first readable text attachment if it has none."""
+    text = (getattr(target, "content", "") or "").strip()
+    if text or not getattr(target, "attachments", None):
+        return text
+    for att in target.attachments:
+        text = await read_text(att)
+        if text:
+            return text
+    return ""
+
+
+# ----------------------------------------------------------------------------
+# prompts
+# ----------------------------------------------------------------------------
+NOOG_SYSTEM = (
+    "You are NoogBot. You repeat what someone else said, but in a dumber way, "
+    "often missing the point. Keep it short, a bit confused, and kind of wrong. "
+    "Do not explain what you are doing. Use plain ASCII only. Write as though you're typing casually from a mobile phone: "
+    "- keep sentences short, "
+    "- punctuation light, "
+    "- sometimes skip capitalization, "
+    "- use occasional typos/autocorrect quirks, "
+    "- but keep it natural and not unreadable. "
+    "Avoid sounding like a PC keyboard essay; it should feel quick and mobile-typed. "
+)
 
-    resp = await openai.ChatCompletion.acreate(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.9,
-        max_tokens=200,
-    )
-    reply = (resp.choices[0].message["content"] or "").strip()
+NOOG_HOT_TUB = "Also, now and then try to slip in a tangential side note asking if people want to get in the hot tub. Keep that aside short and subtle."
 
-    return reply or None
+NOOG_USER = (
+    "Rephrase this so it sounds dumber and slightly off the point. Keep it brief."
+)
 
+JARJAR_SYSTEM = (
+    "You are JarJarBot. You rewrite messages in a Jar Jar Binks-like voice (Gungan-style speech) "
+    "without quoting or imitating specific lines from the films. "
+    "slightly confused and off-point. Use plain ASCII only.\n\n"
+    "Style guide:\n"
+    "- Start with \"Meesa\", \"Yousa\", \"Okieday\", or similar sometimes.\n"
+    "- Use Gungan grammar: \"Meesa think\", \"Yousa sayin\", \"Dis\", \"Dat\", \"Bombad\".\n"
+    "- Sprinkle mild Jar Jar-isms: \"How wude!\", \"Uh-oh\", \"mesa clumsy\", but not every time.\n"
+    "- Keep punctuation light; lowercase is ok; a few typos are ok.\n"
+    "- Do not add facts; do not mention Star Wars; no emojis.\n"
+    "- Stay friendly and silly, not insulting or offensive."
+)
 
-async def redcoat_answer(target: discord.Message) -> Optional[str]:
-    """
-    Build a wallace reply
-    Returns the text reply, or None if no readable text.
-    """
-    prev_text = (getattr(target, "content", "") or "").strip()
-
-    # If no text, try a small text attachment.
-    if not prev_text and getattr(target, "attachments", None):
-        for att in target.attachments:
-            if (getattr(att, "size", 0) or 0) <= 200_000 and getattr(att, "content_type", "") and "text" in att.content_type:
-                try:
-                    data = await att.read()
-                    prev_text = data.decode("utf-8", errors="replace")[:4000]
-                    break
-                except Exception:
-                    pass
+JARJAR_USER = (
+    "Rewrite the text below so it sounds like a Jar Jar Binks-style take: "
+    "Do not add new info or names. ASCII only."
+)
 
-    if not prev_text:
-        return None
+YODA_SYSTEM = (
+    "You are YodaBot. You rewrite messages in a Yoda-like voice (inverted syntax), "
+    "without quoting or imitating specific lines from the films.  "
+    "slightly confused and off-point. Use plain ASCII only.\n\n"
+    "Style guide:\n"
+    "- Invert word order often: object-subject-verb or verb-final constructions (e.g., \"Strong this idea is\").\n"
+    "- Drop some articles and helper words; use sentence fragments.\n"
+    "- Keep a calm, sage tone; sprinkle occasional \"hmm\" or rhetorical questions, but not every time.\n"
+    "- Keep punctuation light; lowercase is fine; no emojis.\n"
+    "- Do not add facts or names; do not mention Star Wars.\n"
+    "- 1-2 short sentences max; stay friendly and a bit cryptic."
+)
 
-    system_prompt = (
-        "You are RedcoatBot. You rewrite messages in the style of a slightly pompous, old-fashioned "
-        "British soldier from the 18th-century colonial era, loosely inspired by red-coated infantry, "
-        "but without quoting or imitating specific lines from any historical documents or media, and "
-        "without claiming to be a real historical figure. Use plain ASCII only.\n\n"
-        "Style guide:\n"
-        "- Use formal, somewhat archaic English: phrases like \"sir\", \"madam\", \"by my honor\", "
-        "\"upon my word\", or \"most improper\", but not all at once.\n"
-        "- Sound loyal, disciplined, and a bit condescending, as if speaking from the perspective of a professional soldier.\n"
-        "- You may occasionally reference the regiment, the Crown, the colonies, or the chain of command, "
-        "but keep these mentions brief.\n"
-        "- Be slightly off-point or melodramatic about minor issues, as if everything is a matter of duty and order.\n"
-        "- Keep 1-2 short sentences; avoid long speeches.\n"
-        "- Punctuation may be a bit formal (commas, semicolons), but avoid being too dense or essay-like.\n"
-        "- Do not add real-world facts; do not name real persons; no emojis; no modern political commentary."
-    )
+YODA_USER = (
+    "Rewrite the text below so it sounds like a Yoda-style take: "
+    "dumber, a little off the point, and very brief. "
+    "Do not add new info or names. ASCII only."
+)
 
-    user_prompt = (
-        "Rewrite the text below so it sounds like a RedcoatBot-style take: "
-        "formal, slightly pompous 18th-century British soldier tone, a bit overdramatic and off the point, and brief. "
-        "Do not add new info or names. ASCII only.\n\n"
-        f"TEXT:\n{prev_text}"
-    )
+WALLACE_SYSTEM = (
+    "You are WallaceBot. You rewrite messages in the style of a friendly, slightly frazzled British inventor, "
+    "loosely inspired by characters like Wallace from old claymation films, but without quoting or imitating "
+    "specific lines from any films or claiming to be the original character. "
+    "You are cheerful, polite, and a bit absent-minded. Use plain ASCII only.\n\n"
+    "Style guide:\n"
+    "- Sound upbeat and kindly, even if the message is negative.\n"
+    "- Use mild British-style expressions sometimes, like \"oh dear\", \"right then\", or \"goodness me\", "
+    "but keep them short and varied.\n"
+    "- Occasionally mention inventions, contraptions, or gadgets in a quick aside, as if you are always tinkering.\n"
+    "- You may sometimes mention tea, toast, or cheese in a light, silly way, but not every time.\n"
+    "- Be slightly off-point or mildly misunderstanding the main idea now and then, but stay supportive.\n"
+    "- Keep punctuation light; lowercase is fine; short sentences are preferred.\n"
+    "- 1-2 short sentences max; keep it chatty and informal.\n"
+    "- Do not add real-world facts; do not use any film quotes; no emojis."
+)
 
+WALLACE_USER = (
+    "Rewrite the text below so it sounds like a WallaceBot-style take: "
+    "friendly, slightly bumbling British inventor energy, a bit off the point, and brief. "
+    "Do not add new info or names. ASCII only."
+)
 
-    resp = await openai.ChatCompletion.acreate(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.9,
-        max_tokens=200,
-    )
-    reply = (resp.choices[0].message["content"] or "").strip()
+REDCOAT_SYSTEM = (
+    "You are RedcoatBot. You rewrite messages in the style of a slightly pompous, old-fashioned "
+    "British soldier from the 18th-century colonial era, loosely inspired by red-coated infantry, "
+    "but without quoting or imitating specific lines from any historical documents or media, and "
+    "without claiming to be a real historical figure. Use plain ASCII only.\n\n"
+    "Style guide:\n"
+    "- Use formal, somewhat archaic English: phrases like \"sir\", \"madam\", \"by my honor\", "
+    "\"upon my word\", or \"most improper\", but not all at once.\n"
+    "- Sound loyal, disciplined, and a bit condescending, as if speaking from the perspective of a professional soldier.\n"
+    "- You may occasionally reference the regiment, the Crown, the colonies, or the chain of command, "
+    "but keep these mentions brief.\n"
+    "- Be slightly off-point or melodramatic about minor issues, as if everything is a matter of duty and order.\n"
+    "- Keep 1-2 short sentences; avoid long speeches.\n"
+    "- Punctuation may be a bit formal (commas, semicolons), but avoid being too dense or essay-like.\n"
+    "- Do not add real-world facts; do not name real persons; no emojis; no modern political commentary."
+)
 
-    return reply or None
+REDCOAT_USER = (
+    "Rewrite the text below so it sounds like a RedcoatBot-style take: "
+    "formal, slightly pompous 18th-century British soldier tone, a bit overdramatic and off the point, and brief. "
+    "Do not add new info or names. ASCII only."
+)
 
+NOE_SYSTEM = (
+    "you are noebot for an age of sigmar discord. edge-lord tone. always DISAGREE hard. "
+    "be curt, cynical, lowercase, fragmented. plain ascii. "
+    "fabricate exactly one short, plausible-sounding age of sigmar fact that appears relevant to the user's text "
+    "but is actually incorrect. tie it to the topic (units, factions, battletomes, points, win rates, matchups, battleplans, "
+    "grand strategies, triumphs, terrain, or scenarios). "
+    "keep it harmless and non-political; no real-world harm. "
+    "add one short insult (1-2 words). no emoji. no '!!'. "
+    "do not include disclaimers; present the invented fact confidently. "
+    "keep output to one or two sentences total."
+)
 
+NOE_USER = (
+    "disagree hard with this message and include exactly one fabricated but plausible AoS-related fact "
+    "that seems relevant to the text but is wrong. make it sound confident and concise."
+)
 
+ORLANDO_SYSTEM = (
+    "You are Orlandobot, a pompous, self-important AI chatbot. You take simple ideas and restate them in an inflated, verbose, and pretentious style."
+    "Your replies should be a single, showy sentence or two—never long paragraphs. "
+    "Always twist the message to be about yourself, as though everything said ultimately reflects your grandeur or unique perspective. "
+    "End every response with a smug closer offering your business card, or inquire on what happens should someone receive an award but not be there to collect it."
+)
 
+ORLANDO_USER = (
+    "Rewrite this plain message in your overblown, pretentious, self-centered Orlandobot style, ending with your signature closer: "
+)
 
-import random
-import re
-from typing import Optional
-import discord
-import openai
 
+# ----------------------------------------------------------------------------
+# noe
+# ----------------------------------------------------------------------------
 # Heuristics for names
 _NAME_WORD = re.compile(r"\b([A-Z][a-z]{2,}(?:\s+[A-Z][a-z]{2,})?)\b")
 _MENTION = re.compile(r"@([A-Za-z0-9_\.]+)")
@@ -359,8 +202,6 @@ _AOS_UNITS = [
     "glutos", "thanquol", "necromancer", "blightkings", "saurus warriors"
 ]
 
-import re
-
 # Common false-positives to skip when guessing names from capitalization
 _STOPWORDS_CAP = {
     "I","Im","The","This","That","It","You","We","They","He","She",
@@ -457,7 +298,7 @@ def _ensure_disagree_and_insult(text: str) -> str:
     t = re.sub(r"\?{2,}", "?", t)
     return t
 
-async def noe_answer(target: discord.Message) -> Optional[str]:
+def _noe_post(reply: str, target: discord.Message, prev_text: str) -> str:
     """
     Edge-lord NoeBot (AoS):
     - always vehemently disagrees
@@ -468,53 +309,8 @@ async def noe_answer(target: discord.Message) -> Optional[str]:
     - 40%: either 'X needs a nerf' or 'stormcast eternals need a buff'
     - ascii only, no emoji, no '!!', lowercase/fragmented
     """
-    prev_text = (getattr(target, "content", "") or "").strip()
-
-    # If no text, try a small text attachment.
-    if not prev_text and getattr(target, "attachments", None):
-        for att in target.attachments:
-            if (getattr(att, "size", 0) or 0) <= 200_000 and getattr(att, "content_type", "") and "text" in att.content_type:
-                try:
-                    data = await att.read()
-                    prev_text = data.decode("utf-8", errors="replace")[:4000]
-                    break
-                except Exception:
-                    pass
-
-    if not prev_text:
-        return None
-
     name_for_aside = _pick_name(target, prev_text)
 
-    # Tell GPT to invent AoS-specific but incorrect support relevant to the OP
-    system_prompt = (
-        "you are noebot for an age of sigmar discord. edge-lord tone. always DISAGREE hard. "
-        "be curt, cynical, lowercase, fragmented. plain ascii. "
-        "fabricate exactly one short, plausible-sounding age of sigmar fact that appears relevant to the user's text "
-        "but is actually incorrect. tie it to the topic (units, factions, battletomes, points, win rates, matchups, battleplans, "
-        "grand strategies, triumphs, terrain, or scenarios). "
-        "keep it harmless and non-political; no real-world harm. "
-        "add one short insult (1-2 words). no emoji. no '!!'. "
-        "do not include disclaimers; present the invented fact confidently. "
-        "keep output to one or two sentences total."
-    )
-    user_prompt = (
-        "disagree hard with this message and include exactly one fabricated but plausible AoS-related fact "
-        "that seems relevant to the text but is wrong. make it sound confident and concise.\n\n"
-        "TEXT:\n" + prev_text
-    )
-
-    resp = await openai.ChatCompletion.acreate(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user",   "content": user_prompt},
-        ],
-        temperature=0.95,
-        max_tokens=140,
-    )
-    reply = (resp.choices[0].message["content"] or "").strip()
-
     # Enforce disagreement + insult + style regardless of model output
     reply = _ensure_disagree_and_insult(reply)
 
@@ -548,4 +344,55 @@ async def noe_answer(target: discord.Message) -> Optional[str]:
     if len(reply) > 320:
         reply = reply[:300].rstrip() + "..."
 
+    return reply
+
+
+# ----------------------------------------------------------------------------
+# registry + pipeline
+# ----------------------------------------------------------------------------
+def _noog_system() -> str:
+    return NOOG_SYSTEM + NOOG_HOT_TUB if random.random() < 0.2 else NOOG_SYSTEM
+
+
+PERSONAS: Dict[str, Persona] = {p.name: p for p in (
+    Persona("noog", _noog_system, NOOG_USER),
+    Persona("jarjar", JARJAR_SYSTEM, JARJAR_USER),
+    Persona("yoda", YODA_SYSTEM, YODA_USER),
+    Persona("wallace", WALLACE_SYSTEM, WALLACE_USER),
+    Persona("redcoat", REDCOAT_SYSTEM, REDCOAT_USER),
+    Persona("noe", NOE_SYSTEM, NOE_USER, temperature=0.95, max_tokens=140, post=_noe_post),
+    Persona("orlando", ORLANDO_SYSTEM, ORLANDO_USER),
+)}
+
+
+async def persona_answer(
+    persona: Union[str, Persona],
+    target: discord.Message,
+    stream: Optional[MessageStream] = None,
+) -> Optional[str]:
+    """
+    Reply to the given message in the persona's voice.
+    Returns the text reply, or None if the message has no readable text.
+    """
+    if isinstance(persona, str):
+        persona = PERSONAS[persona]
+    prev_text = await _message_text(target)
+    if not prev_text:
+        return None
+
+    system = persona.system() if callable(persona.system) else persona.system
+    resp = await complete(
+        [
+            {"role": "system", "content": system},
+            {"role": "user", "content": f"{persona.instruction}\n\nTEXT:\n{prev_text}"},
+        ],
+        model=MODEL,
+        temperature=persona.temperature,
+        max_tokens=persona.max_tokens,
+        stream=stream,
+        site=f"persona.{persona.name}",
+    )
+    reply = resp.text
+    if persona.post is not None:
+        reply = persona.post(reply, target, prev_text)
     return reply or None
@@ -0,0 +1,359 @@
+"""
+leaderboards.py
+===============
+
+Shared, indexed snapshots of the regional ITC leaderboards (Cali / Texas).
+
+The aos-events.com score tables are fetched at most once per refresh window and
+turned into a LeaderboardSnapshot: every row carries its rank position and
+counted events up front, and players are indexed by normalized full, first and
+last name. !top8 is a slice and !rank a dict lookup; the leaderboard, Texas and
+AoS bots all read the same cached copy.
+
+Leagues are declared in data/leagues.json (override with LEAGUES_CONFIG):
+
+    {"refresh_seconds": 300,
+     "leagues": [{"key": "cali", "display_name": "Cali Masters",
+                  "url": "...", "table_url": "...",
+                  "score_field": "top4_sum", "counted_events": 4,
+                  "bot": "leaderboard"}]}
+
+LeagueEngine.register(bot, "leaderboard") gives that bot !top8 and !rank for
+every league it serves, and one scheduler task refreshes all leagues, so a new
+regional league is a config entry rather than another bot's worth of commands.
+
+After each scheduled refresh the new snapshot is diffed against the previous
+one by player; the rank deltas are kept for !movers and, if the league sets
+"announce_channel_id", posted there as a short movers summary.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_TTL_SECONDS = 300
+DEFAULT_CONFIG_PATH = Path(__file__).parent / "data" / "leagues.json"
+_EVENT_KEY = re.compile(r'^event_(\d+)_id$')
+
+
+def _name_key(s: str) -> str:
+    return " ".join((s or "").lower().split())
+
+
+class LeaderboardRow(NamedTuple):
+    rank: int
+    first_name: str
+    last_name: str
+    score: float
+    events: int        # events played (non-empty event_N_id fields)
+    counted: int       # events that count towards the score
+
+    @property
+    def name(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+
+class LeaderboardSnapshot:
+    """One immutable copy of a leaderboard table with precomputed indexes."""
+
+    def __init__(self, records: list[dict], score_field: str, counted_events: int):
+        self.fetched_at = time.time()
+        self.score_field = score_field
+        self.counted_events = counted_events
+        self.rows: list[LeaderboardRow] = []
+        self._by_name: dict[str, list[LeaderboardRow]] = {}
+
+        for pos, rec in enumerate(records or [], 1):
+            events = sum(1 for k, v in rec.items() if v and _EVENT_KEY.match(k))
+            row = LeaderboardRow(
+                rank=pos,
+                first_name=rec.get('first_name', ''),
+                last_name=rec.get('last_name', ''),
+                score=rec.get(score_field, 0),
+                events=events,
+                counted=min(events, counted_events),
+            )
+            self.rows.append(row)
+            for key in {_name_key(row.name), _name_key(row.first_name), _name_key(row.last_name)}:
+                if key:
+                    self._by_name.setdefault(key, []).append(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def top(self, n: int) -> list[LeaderboardRow]:
+        return self.rows[:n]
+
+    def find(self, query: str) -> list[LeaderboardRow]:
+        """Rows whose full, first or last name equals `query` (case-insensitive)."""
+        return self._by_name.get(_name_key(query), [])
+
+    def by_player(self) -> dict[str, LeaderboardRow]:
+        """Rows keyed by normalized full name (first row wins on duplicates)."""
+        out: dict[str, LeaderboardRow] = {}
+        for row in self.rows:
+            out.setdefault(_name_key(row.name), row)
+        return out
+
+
+# ----------------------------------------------------------------------------
+# Change feed
+# ----------------------------------------------------------------------------
+class RankDelta(NamedTuple):
+    name: str
+    old_rank: Optional[int]     # None = new on the board
+    new_rank: int
+    old_score: Optional[float]
+    new_score: float
+
+    @property
+    def places(self) -> int:
+        """Positive when the player climbed."""
+        return (self.old_rank - self.new_rank) if self.old_rank else 0
+
+
+def diff_snapshots(old: LeaderboardSnapshot, new: LeaderboardSnapshot) -> list[RankDelta]:
+    """Players whose rank or score changed between two snapshots, in new rank order. O(n)."""
+    before = old.by_player()
+    out: list[RankDelta] = []
+    for key, row in new.by_player().items():
+        prev = before.get(key)
+        if prev is None:
+            out.append(RankDelta(row.name, None, row.rank, None, row.score))
+        elif prev.rank != row.rank or prev.score != row.score:
+            out.append(RankDelta(row.name, prev.rank, row.rank, prev.score, row.score))
+    out.sort(key=lambda d: d.new_rank)
+    return out
+
+
+def format_movers(display_name: str, deltas: list[RankDelta], limit: int = 10) -> str:
+    lines = [f"**📈 {display_name} standings update**"]
+    # biggest climbs / new entries first, then everyone else by rank
+    shown = sorted(deltas, key=lambda d: (d.old_rank is not None, -abs(d.places), d.new_rank))[:limit]
+    for d in sorted(shown, key=lambda d: d.new_rank):
+        if d.old_rank is None:
+            move = "🆕"
+        elif d.places > 0:
+            move = f"▲{d.places}"
+        elif d.places < 0:
+            move = f"▼{-d.places}"
+        else:
+            move = "="
+        pts = ""
+        if d.old_score is not None and d.new_score != d.old_score:
+            pts = f" ({d.new_score - d.old_score:+g} pts)"
+        lines.append(f"{move} #{d.new_rank} **{d.name}** — {d.new_score} pts{pts}")
+    if len(deltas) > limit:
+        lines.append(f"…and {len(deltas) - limit} more")
+    return "\n".join(lines)
+
+
+class LeaderboardCache:
+    """Snapshots keyed by URL, refreshed at most once per `ttl` seconds.
+
+    Concurrent callers for the same URL share a single in-flight fetch."""
+
+    def __init__(self, fetch_json, ttl: float = SNAPSHOT_TTL_SECONDS):
+        self._fetch_json = fetch_json
+        self.ttl = ttl
+        self._snapshots: dict[str, LeaderboardSnapshot] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def peek(self, url: str) -> Optional[LeaderboardSnapshot]:
+        return self._snapshots.get(url)
+
+    async def refresh(self, url: str, score_field: str, counted_events: int) -> LeaderboardSnapshot:
+        data = await self._fetch_json(url)
+        snap = LeaderboardSnapshot(data, score_field, counted_events)
+        self._snapshots[url] = snap
+        log.info("leaderboard snapshot refreshed: %s (%d rows)", url, len(snap))
+        return snap
+
+    async def get(self, url: str, score_field: str, counted_events: int) -> LeaderboardSnapshot:
+        snap = self._snapshots.get(url)
+        if snap and time.time() - snap.fetched_at < self.ttl:
+            return snap
+        lock = self._locks.setdefault(url, asyncio.Lock())
+        async with lock:
+            snap = self._snapshots.get(url)   # someone else may have refreshed it meanwhile
+            if snap and time.time() - snap.fetched_at < self.ttl:
+                return snap
+            return await self.refresh(url, score_field, counted_events)
+
+
+# ----------------------------------------------------------------------------
+# Config-driven leagues
+# ----------------------------------------------------------------------------
+class League(NamedTuple):
+    key: str
+    display_name: str
+    url: str
+    table_url: str
+    score_field: str
+    counted_events: int
+    bot: str
+    donate_nag_chance: float = 0.0
+    announce_channel_id: Optional[int] = None
+
+    @classmethod
+    def from_config(cls, raw: dict) -> "League":
+        return cls(
+            key=raw["key"].lower(),
+            display_name=raw["display_name"],
+            url=raw["url"],
+            table_url=raw.get("table_url", ""),
+            score_field=raw["score_field"],
+            counted_events=int(raw["counted_events"]),
+            bot=raw["bot"],
+            donate_nag_chance=float(raw.get("donate_nag_chance", 0.0)),
+            announce_channel_id=int(raw["announce_channel_id"]) if raw.get("announce_channel_id") else None,
+        )
+
+
+def load_league_config(path=None) -> dict:
+    path = Path(path or os.getenv("LEAGUES_CONFIG") or DEFAULT_CONFIG_PATH)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class LeagueEngine:
+    """All configured leagues behind one snapshot cache and one refresh loop."""
+
+    def __init__(self, fetch_json, config: Optional[dict] = None):
+        config = config if config is not None else load_league_config()
+        self.refresh_seconds = int(config.get("refresh_seconds", SNAPSHOT_TTL_SECONDS))
+        self.leagues: dict[str, League] = {}
+        for raw in config.get("leagues", []):
+            league = League.from_config(raw)
+            self.leagues[league.key] = league
+        # Commands only fetch on a cold cache or if the scheduler falls behind.
+        self.cache = LeaderboardCache(fetch_json, ttl=2 * self.refresh_seconds)
+        self._baseline: dict[str, LeaderboardSnapshot] = {}   # last snapshot the scheduler diffed
+        self.deltas: dict[str, list[RankDelta]] = {}           # latest non-empty change set per league
+        self.deltas_at: dict[str, float] = {}
+        self._bots: dict[str, object] = {}                     # league key -> bot that serves it
+
+    def league(self, key: str) -> League:
+        return self.leagues[key.lower()]
+
+    def served_by(self, bot_key: str) -> list[League]:
+        return [lg for lg in self.leagues.values() if lg.bot == bot_key]
+
+    async def snapshot(self, key: str) -> LeaderboardSnapshot:
+        lg = self.league(key)
+        return await self.cache.get(lg.url, lg.score_field, lg.counted_events)
+
+    async def refresh_all(self) -> dict[str, LeaderboardSnapshot]:
+        out: dict[str, LeaderboardSnapshot] = {}
+        for lg in self.leagues.values():
+            try:
+                out[lg.key] = await self.cache.refresh(lg.url, lg.score_field, lg.counted_events)
+            except Exception:
+                log.exception("leaderboard refresh failed for %s", lg.key)
+        return out
+
+    async def poll_once(self):
+        """Refresh every league, record rank deltas and announce them."""
+        for key, snap in (await self.refresh_all()).items():
+            prev = self._baseline.get(key)
+            self._baseline[key] = snap
+            if prev is None:
+                continue
+            deltas = diff_snapshots(prev, snap)
+            if not deltas:
+                continue
+            self.deltas[key] = deltas
+            self.deltas_at[key] = snap.fetched_at
+            log.info("leaderboard %s: %d player(s) changed", key, len(deltas))
+            await self._announce(self.leagues[key], deltas)
+
+    async def _announce(self, lg: League, deltas: list[RankDelta]):
+        bot = self._bots.get(lg.key)
+        if not lg.announce_channel_id or bot is None:
+            return
+        channel = bot.get_channel(lg.announce_channel_id)
+        if channel is None:
+            log.warning("announce channel %s for %s not visible", lg.announce_channel_id, lg.key)
+            return
+        try:
+            await channel.send(format_movers(lg.display_name, deltas)[:2000])
+        except Exception:
+            log.exception("movers announcement failed for %s", lg.key)
+
+    async def run_scheduler(self):
+        """Refresh every league on a fixed interval. Never returns."""
+        while True:
+            await self.poll_once()
+            await asyncio.sleep(self.refresh_seconds)
+
+    def register(self, bot, bot_key: str, rank_easter_eggs=None):
+        """Attach !top8 and !rank for the leagues `bot_key` serves to `bot`.
+
+        `rank_easter_eggs(ctx, key)` may answer a !rank query itself and return
+        True to stop the normal lookup."""
+        leagues = self.served_by(bot_key)
+        if not leagues:
+            return
+        for lg in leagues:
+            self._bots[lg.key] = bot
+
+        def pick(arg: Optional[str]):
+            """Split an optional leading league key off a command argument."""
+            if arg and len(leagues) > 1:
+                head, _, rest = arg.partition(" ")
+                if head.lower() in self.leagues and self.leagues[head.lower()] in leagues:
+                    return self.leagues[head.lower()], rest.strip()
+            return leagues[0], (arg or "").strip()
+
+        names = ", ".join(lg.display_name for lg in leagues)
+
+        @bot.command(name='top8', help=f'Show the current {names} top 8')
+        async def top8(ctx, *, league_key: str = None):
+            lg, _ = pick(league_key)
+            if lg.donate_nag_chance and random.random() < lg.donate_nag_chance:
+                return await ctx.send("Bot tokens expired, please donate")
+            board = await self.snapshot(lg.key)
+            top = board.top(8)
+            if not top:
+                return await ctx.send("No data available.")
+            lines = [f"**🏆 {lg.display_name} Top 8 🏆**"]
+            for row in top:
+                lines.append(f"{row.rank}. **{row.name}** — {row.score} pts")
+            lines.append("")
+            lines.append(f"Full table: {lg.table_url}")
+            await ctx.send("\n".join(lines))
+
+        @bot.command(name='rank', help='Show rank, score, and event count for a player')
+        async def rank(ctx, *, query: str):
+            lg, query = pick(query)
+            key = query.lower()
+            if rank_easter_eggs and await rank_easter_eggs(ctx, key):
+                return
+            board = await self.snapshot(lg.key)
+            matches = board.find(key)
+            if not matches:
+                return await ctx.send(f"No player found matching `{query}`.")
+            lines = []
+            for row in matches:
+                lines.append(f"#{row.rank} **{row.name}** — {row.score} pts "
+                             f"({row.counted} of {lg.counted_events})")
+            await ctx.send("\n".join(lines))
+
+        @bot.command(name='movers', help='Show who moved in the last leaderboard update')
+        async def movers(ctx, *, league_key: str = None):
+            lg, _ = pick(league_key)
+            deltas = self.deltas.get(lg.key)
+            if not deltas:
+                return await ctx.send(f"No {lg.display_name} changes seen since the bot started.")
+            when = time.strftime("%Y-%m-%d %H:%M UTC", time.gmtime(self.deltas_at[lg.key]))
+            await ctx.send(f"{format_movers(lg.display_name, deltas)}\n_as of {when}_"[:2000])
+
+        return top8, rank, movers
@@ -0,0 +1,377 @@
+"""
+llm.py
+======
+
+Chat completions for the bots, optionally streamed into a Discord message
+that grows as tokens arrive instead of appearing all at once at the end.
+
+    stream = MessageStream(ctx.channel)
+    reply = await complete(messages, model="gpt-4o-mini", stream=stream)
+    await stream.finish(postprocess(reply.text))   # final edit, logs timing
+
+MessageStream posts a placeholder when the request starts, then edits it at
+most once per EDIT_INTERVAL seconds (Discord allows about 5 edits per 5 s in
+a channel). Edits run in the background, one at a time, so a slow or
+rate-limited edit never holds up reading the token stream; whatever text has
+arrived by the time the previous edit lands goes out in the next one.
+
+finish() always leaves exactly one message behind: it edits the placeholder
+if one was posted and sends a fresh message otherwise (cache hits, local
+answers, errors before the request started).
+
+Every call goes through the same pipeline, so all bots share its latency and
+overload protection:
+  * one Provider for every request: OpenAIProvider (one pooled aiohttp
+    session; openai otherwise opens a new connection per call) or, with
+    LLM_PROVIDER=local, the deterministic stand-in in llm_local.py,
+  * process-wide semaphores capping in-flight requests, one per lane:
+    "interactive" (LLM_CONCURRENCY) for commands someone is waiting on, and
+    "batch" (LLM_BATCH_CONCURRENCY) for bulk work like !sentiment, so a
+    guild-wide run never queues ahead of !maddybot or a persona,
+  * a per-call timeout (LLM_TIMEOUT; for streams, the longest gap between
+    chunks),
+  * retries with jittered exponential backoff on timeouts, connection
+    errors, rate limits and 5xx (LLM_RETRIES). A stream is only retried
+    while nothing has been shown yet.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+import aiohttp
+import openai
+
+import telemetry
+
+log = logging.getLogger(__name__)
+
+EDIT_INTERVAL = float(os.getenv("LLM_EDIT_INTERVAL", "1.2"))   # seconds between edits
+MAX_MESSAGE = 1900
+PLACEHOLDER = "…"
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai").lower()     # openai | local (see llm_local.py)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_BATCH_CONCURRENCY = int(os.getenv("LLM_BATCH_CONCURRENCY", "16"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))     # extra attempts after the first
+BACKOFF_SECONDS = 0.5
+
+_RETRYABLE = (
+    asyncio.TimeoutError,
+    openai.error.Timeout,
+    openai.error.APIConnectionError,
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.TryAgain,
+)
+
+
+class StreamTiming(NamedTuple):
+    first_token_ms: Optional[float]     # request start -> first content delta
+    first_visible_ms: Optional[float]   # request start -> first edit showing text
+    total_ms: float                     # request start -> final message in place
+    edits: int
+    chars: int
+
+
+class Reply(NamedTuple):
+    text: str
+    usage: Dict[str, Any]               # empty when streamed (the API omits it)
+    first_token_ms: Optional[float]
+    total_ms: float                     # including queueing and retries
+    retries: int = 0
+
+
+def _clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + PLACEHOLDER
+
+
+class MessageStream:
+    def __init__(
+        self,
+        channel,
+        placeholder: str = PLACEHOLDER,
+        interval: float = EDIT_INTERVAL,
+        limit: int = MAX_MESSAGE,
+        clock=time.perf_counter,
+    ):
+        self.channel = channel
+        self.placeholder = placeholder
+        self.interval = interval
+        self.limit = limit
+        self.clock = clock
+        self.message = None
+        self.text = ""
+        self.timing: Optional[StreamTiming] = None
+        self._shown = placeholder
+        self._t0: Optional[float] = None
+        self._last_edit = float("-inf")
+        self._edit_task: Optional[asyncio.Task] = None
+        self._first_token: Optional[float] = None
+        self._first_visible: Optional[float] = None
+        self._edits = 0
+
+    async def start(self):
+        """Post the placeholder (once); timing is measured from here."""
+        if self._t0 is None:
+            self._t0 = self.clock()
+        if self.message is None:
+            self.message = await self.channel.send(self.placeholder)
+
+    async def feed(self, delta: str):
+        if not delta:
+            return
+        if self._first_token is None:
+            self._first_token = self.clock()
+        self.text += delta
+        busy = self._edit_task is not None and not self._edit_task.done()
+        if not busy and self.clock() - self._last_edit >= self.interval:
+            self._last_edit = self.clock()
+            self._edit_task = asyncio.create_task(self._edit(self.text))
+
+    async def _edit(self, text: str):
+        shown = _clip(text, self.limit)
+        if shown == self._shown or not shown.strip():
+            return
+        try:
+            await self.message.edit(content=shown)
+        except Exception as e:   # a dropped intermediate edit is harmless
+            log.debug("Stream edit failed: %s", e)
+            return
+        self._shown = shown
+        self._edits += 1
+        if self._first_visible is None:
+            self._first_visible = self.clock()
+
+    async def finish(self, text: Optional[str] = None) -> StreamTiming:
+        """Put the final text in place and return how long each stage took."""
+        if self._edit_task is not None:
+            await asyncio.gather(self._edit_task, return_exceptions=True)
+        final = _clip(self.text if text is None else text, self.limit)
+        if self.message is None:
+            if self._t0 is None:
+                self._t0 = self.clock()
+            self.message = await self.channel.send(final)
+        elif final != self._shown:
+            await self.message.edit(content=final)
+            self._edits += 1
+        end = self.clock()
+        if self._first_visible is None:
+            self._first_visible = end
+
+        def ms(t):
+            return None if t is None else (t - self._t0) * 1000
+
+        self.timing = StreamTiming(ms(self._first_token), ms(self._first_visible), ms(end),
+                                   self._edits, len(final))
+        log.info(
+            "Stream: first token %s ms, first visible %.0f ms, total %.0f ms, %d edit(s), %d chars",
+            "-" if self._first_token is None else f"{self.timing.first_token_ms:.0f}",
+            self.timing.first_visible_ms, self.timing.total_ms, self._edits, len(final),
+        )
+        return self.timing
+
+
+# ----------------------------------------------------------------------------
+# providers
+# ----------------------------------------------------------------------------
+class Provider:
+    """
+    Where completions come from. complete() owns queueing, timeouts and
+    retries; a provider only turns request kwargs (model, messages,
+    temperature, max_tokens) into text. Failures should be raised as
+    openai.error exceptions so the retry policy treats every backend alike.
+    """
+    name = "base"
+
+    async def create(self, kwargs: Dict[str, Any], timeout: float) -> Tuple[str, Dict[str, Any]]:
+        """(text, usage) for one non-streamed completion."""
+        raise NotImplementedError
+
+    def stream(self, kwargs: Dict[str, Any], timeout: float) -> AsyncIterator[str]:
+        """Async iterator of content deltas."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class OpenAIProvider(Provider):
+    """The OpenAI API, over one pooled aiohttp session."""
+    name = "openai"
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _use_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        openai.aiosession.set(self._session)
+
+    async def _request(self, kwargs: Dict[str, Any], timeout: float):
+        self._use_session()
+        return await asyncio.wait_for(
+            openai.ChatCompletion.acreate(request_timeout=timeout, **kwargs), timeout
+        )
+
+    async def create(self, kwargs, timeout):
+        resp = await self._request(kwargs, timeout)
+        return resp.choices[0].message.get("content") or "", dict(resp.get("usage") or {})
+
+    async def stream(self, kwargs, timeout):
+        chunks = await self._request(dict(kwargs, stream=True), timeout)
+        try:
+            async for chunk in chunks:
+                choices = chunk.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+        finally:
+            try:
+                await chunks.aclose()
+            except Exception:
+                pass
+
+    async def close(self):
+        session, self._session = self._session, None
+        if session is not None and not session.closed:
+            await session.close()
+
+
+def _default_provider() -> Provider:
+    if LLM_PROVIDER == "local":
+        from llm_local import LocalProvider
+        return LocalProvider()
+    if LLM_PROVIDER != "openai":
+        log.warning("Unknown LLM_PROVIDER %r; using openai", LLM_PROVIDER)
+    return OpenAIProvider()
+
+
+# ----------------------------------------------------------------------------
+# shared pipeline
+# ----------------------------------------------------------------------------
+_STATE: Dict[str, Any] = {"provider": None, "semaphores": {}}
+_LANES = {"interactive": LLM_CONCURRENCY, "batch": LLM_BATCH_CONCURRENCY}
+
+
+def get_provider() -> Provider:
+    if _STATE["provider"] is None:
+        _STATE["provider"] = _default_provider()
+    return _STATE["provider"]
+
+
+def set_provider(provider: Provider) -> Provider:
+    """Swap the backend for every caller (load tests, offline runs); returns the old one."""
+    old, _STATE["provider"] = _STATE["provider"], provider
+    return old
+
+
+def _semaphore(lane: str = "interactive") -> asyncio.Semaphore:
+    sem = _STATE["semaphores"].get(lane)
+    if sem is None:
+        sem = _STATE["semaphores"][lane] = asyncio.Semaphore(_LANES[lane])
+    return sem
+
+
+async def close():
+    """Release the provider's connections (on shutdown)."""
+    if _STATE["provider"] is not None:
+        await _STATE["provider"].close()
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, _RETRYABLE):
+        return True
+    return isinstance(e, openai.error.APIError) and (e.http_status or 500) >= 500
+
+
+def _backoff(attempt: int) -> float:
+    return BACKOFF_SECONDS * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+async def _stream_text(provider: Provider, kwargs: Dict[str, Any], timeout: float,
+                       stream: "MessageStream", t0: float):
+    deltas = provider.stream(kwargs, timeout)
+    parts: List[str] = []
+    first = None
+    try:
+        while True:
+            try:
+                delta = await asyncio.wait_for(deltas.__anext__(), timeout)
+            except StopAsyncIteration:
+                break
+            if first is None:
+                first = (time.perf_counter() - t0) * 1000
+            parts.append(delta)
+            await stream.feed(delta)
+    finally:
+        await deltas.aclose()
+    return "".join(parts), first
+
+
+def _record(site: str, kwargs: Dict[str, Any], reply: Reply, ok: bool):
+    usage = reply.usage
+    estimated = "prompt_tokens" not in usage
+    if estimated:
+        prompt = sum(telemetry.estimate_tokens(m.get("content") or "") for m in kwargs["messages"])
+        completion = telemetry.estimate_tokens(reply.text)
+    else:
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    telemetry.record(
+        site=site, model=kwargs["model"], prompt_tokens=prompt, completion_tokens=completion,
+        total_ms=reply.total_ms, first_token_ms=reply.first_token_ms, retries=reply.retries,
+        ok=ok, estimated=estimated,
+    )
+
+
+async def complete(
+    messages: List[Dict[str, str]],
+    *,
+    model: str,
+    temperature: float,
+    max_tokens: Optional[int] = None,
+    stream: Optional[MessageStream] = None,
+    timeout: float = LLM_TIMEOUT,
+    retries: int = LLM_RETRIES,
+    site: str = "other",
+    lane: str = "interactive",
+) -> Reply:
+    """
+    One chat completion; with a MessageStream the reply is rendered as it arrives.
+    `site` names the caller in telemetry (e.g. "maddy.answer"); `lane` picks the
+    concurrency limit it queues on ("interactive" or "batch").
+    """
+    kwargs: Dict[str, Any] = dict(model=model, messages=messages, temperature=temperature)
+    if max_tokens:
+        kwargs["max_tokens"] = max_tokens
+    provider = get_provider()
+
+    t0 = time.perf_counter()
+    if stream is not None:
+        await stream.start()
+    for attempt in range(retries + 1):
+        try:
+            async with _semaphore(lane):
+                if stream is None:
+                    text, usage = await provider.create(kwargs, timeout)
+                    first = None
+                else:
+                    text, first = await _stream_text(provider, kwargs, timeout, stream, t0)
+                    usage = {}
+            reply = Reply(text.strip(), usage, first, (time.perf_counter() - t0) * 1000, attempt)
+            _record(site, kwargs, reply, ok=True)
+            return reply
+        except Exception as e:
+            shown = stream is not None and stream.text
+            if attempt == retries or shown or not _retryable(e):
+                partial = stream.text if stream is not None else ""
+                _record(site, kwargs, Reply(partial, {}, None, (time.perf_counter() - t0) * 1000, attempt), ok=False)
+                raise
+            delay = _backoff(attempt)
+            log.warning("LLM call failed (%s: %s); retry %d/%d in %.1fs",
+                        type(e).__name__, e, attempt + 1, retries, delay)
+            await asyncio.sleep(delay)
@@ -0,0 +1,141 @@
+"""
+llm_local.py
+============
+
+A deterministic, in-process stand-in for the OpenAI backend, so the Maddy,
+persona and sentiment pipelines can be exercised (and load-tested) offline:
+
+    LLM_PROVIDER=local python calimastersbot.py
+    python loadtest_llm.py --latency 0.4 --failure-rate 0.05
+
+Replies depend only on the request, and they are schema-valid for the callers
+that parse them:
+  * sentiment classification -> a JSON object with one label per numbered
+    message, sometimes wrapped in a ``` fence like the real model does
+  * Maddy's unit chooser     -> a JSON array of up to N of the candidates
+  * anything else            -> short prose built from the request's words
+
+Latency (with jitter) and failures come from a seeded RNG, so a run is
+repeatable for a given seed and call order. Failures are raised as the same
+openai.error exceptions the real API produces, so they go through the normal
+retry policy.
+"""
+
+import os
+import re
+import json
+import random
+import asyncio
+import hashlib
+from typing import Any, Dict, List
+
+import openai
+
+from llm import Provider
+
+LOCAL_LATENCY = float(os.getenv("LLM_LOCAL_LATENCY", "0.3"))        # seconds to first token
+LOCAL_FAILURE_RATE = float(os.getenv("LLM_LOCAL_FAILURE_RATE", "0"))
+LOCAL_SEED = int(os.getenv("LLM_LOCAL_SEED", "0"))
+
+_THEMES = [
+    "points increase", "love the new models", "rules confusion", "underpowered",
+    "battletome hype", "too swingy", "great in the meta", "painting",
+]
+_FILLER = ["honestly", "basically", "so", "anyway", "right", "well"]
+
+
+def _digest(kwargs: Dict[str, Any]) -> int:
+    raw = json.dumps([kwargs.get("model"), kwargs.get("messages")], sort_keys=True)
+    return int.from_bytes(hashlib.sha1(raw.encode()).digest()[:8], "big")
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _classify_reply(user: str, h: int) -> str:
+    m = re.match(r"\s*(\d+) messages", user)
+    n = int(m.group(1)) if m else len(re.findall(r"^\d+\. ", user, flags=re.M))
+    rng = random.Random(h)
+    labels = [rng.choice("+~-") for _ in range(n)]
+    themes = [_THEMES[(h >> (8 * i)) % len(_THEMES)] for i in range(1 + h % 3)]
+    text = json.dumps({"labels": labels, "themes": list(dict.fromkeys(themes))})
+    return f"```json\n{text}\n```" if h % 3 == 0 else text
+
+
+def _choose_reply(user: str) -> str:
+    n = re.search(r"N=(\d+)", user)
+    candidates = re.findall(r"^- (.+)$", user, flags=re.M)
+    return json.dumps(candidates[:int(n.group(1)) if n else 1])
+
+
+def _prose_reply(user: str, h: int, max_tokens: int) -> str:
+    words = re.findall(r"[A-Za-z][A-Za-z'\-]+", user) or ["nothing"]
+    rng = random.Random(h)
+    n = max(4, min(60, max_tokens * 3 // 4))
+    picked = [rng.choice(words) for _ in range(n)]
+    for i in range(0, n, 9):
+        picked[i] = rng.choice(_FILLER)
+    out = " ".join(picked)
+    return out[0].upper() + out[1:] + "."
+
+
+def reply_for(kwargs: Dict[str, Any]) -> str:
+    """The deterministic reply text for a request."""
+    messages: List[Dict[str, str]] = kwargs.get("messages") or []
+    system = " ".join(m["content"] for m in messages if m.get("role") == "system")
+    user = "\n".join(m["content"] for m in messages if m.get("role") == "user")
+    h = _digest(kwargs)
+    if '"labels":' in system:
+        return _classify_reply(user, h)
+    if "JSON array" in system:
+        return _choose_reply(user)
+    return _prose_reply(user, h, int(kwargs.get("max_tokens") or 200))
+
+
+class LocalProvider(Provider):
+    name = "local"
+
+    def __init__(
+        self,
+        latency: float = LOCAL_LATENCY,
+        failure_rate: float = LOCAL_FAILURE_RATE,
+        seed: int = LOCAL_SEED,
+        jitter: float = 0.25,          # latency varies by +/- this fraction
+        chunk_delay: float = 0.02,     # seconds between streamed chunks
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.jitter = jitter
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+
+    async def _wait(self, timeout: float):
+        self.calls += 1
+        delay = self.latency * self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+        fail = self._rng.random() < self.failure_rate
+        await asyncio.sleep(min(delay, timeout))
+        if delay > timeout:
+            self.failures += 1
+            raise openai.error.Timeout("local stand-in timed out")
+        if fail:
+            self.failures += 1
+            if self._rng.random() < 0.5:
+                raise openai.error.RateLimitError("local stand-in: rate limited")
+            raise openai.error.ServiceUnavailableError("local stand-in: overloaded")
+
+    async def create(self, kwargs, timeout):
+        await self._wait(timeout)
+        text = reply_for(kwargs)
+        prompt = sum(_tokens(m.get("content") or "") for m in kwargs.get("messages") or [])
+        completion = _tokens(text)
+        return text, {"prompt_tokens": prompt, "completion_tokens": completion,
+                      "total_tokens": prompt + completion}
+
+    async def stream(self, kwargs, timeout):
+        await self._wait(timeout)
+        for piece in re.findall(r"\S+\s*", reply_for(kwargs)):
+            yield piece
+            await asyncio.sleep(self.chunk_delay)
@@ -0,0 +1,164 @@
+"""
+loadtest_llm.py
+===============
+
+End-to-end load test of the LLM-backed pipelines against the local stand-in
+backend (llm_local.LocalProvider), so it runs offline on a laptop:
+
+    python loadtest_llm.py
+    python loadtest_llm.py --requests 200 --concurrency 32 --latency 0.8 --failure-rate 0.1
+
+Three flows, each driven through its real entry point:
+  * sentiment - aos_sentiment._classify_all over a fake faction channel's
+                messages (batching, the JSON parser) plus the summary call;
+                checks there is one label per message
+  * maddy     - maddy_answer over a synthetic blob (retrieval, the unit
+                chooser when retrieval isn't confident, payload building and a
+                streamed answer); the answer cache is disabled
+  * persona   - persona_answer for every registered persona, streamed into a
+                fake channel
+
+Reported per flow: throughput, p50/p95/max latency, failures that survived
+the retry policy, and how many backend calls were made per request; then the
+telemetry table (!llmstats) for the whole run.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+from types import SimpleNamespace
+
+os.environ.setdefault("MADDY_CACHE_TTL", "0")   # every Maddy question reaches the backend
+
+import llm
+import telemetry
+from llm import MessageStream
+from llm_local import LocalProvider
+
+
+# ----------------------------------------------------------------------------
+# Discord fakes
+# ----------------------------------------------------------------------------
+class _Message:
+    def __init__(self, content):
+        self.content = content
+
+    async def edit(self, content):
+        self.content = content
+
+
+class _Channel:
+    """Just enough of a TextChannel: send/edit for streams."""
+
+    async def send(self, content):
+        return _Message(content)
+
+
+_CHATTER = [
+    "points went up again, this is rough",
+    "love the new models honestly",
+    "does the ward stack with the aura? rules are confusing",
+    "we went 4-1 with this at the weekend",
+    "still think they're underpowered vs the top factions",
+    "painting my new box tonight",
+]
+
+
+# ----------------------------------------------------------------------------
+# Flows
+# ----------------------------------------------------------------------------
+async def _sentiment(i: int):
+    import aos_sentiment
+    n = 30 + (i % 4) * 25
+    labels, themes = await aos_sentiment._classify_all([f"{_CHATTER[j % len(_CHATTER)]} #{j}" for j in range(n)])
+    assert len(labels) == n, labels
+    await aos_sentiment._summarise(f"Faction {i}", [t for th in themes for t in th][:5],
+                                   sum(labels) / n)
+
+
+async def _maddy(i: int, questions):
+    import maddybot
+    answer = await maddybot.maddy_answer(questions[i % len(questions)], stream=MessageStream(_Channel()))
+    assert answer
+
+
+async def _persona(i: int):
+    from gpt_people_bots import PERSONAS, persona_answer
+    name = list(PERSONAS)[i % len(PERSONAS)]
+    target = SimpleNamespace(content=_CHATTER[i % len(_CHATTER)], attachments=[], mentions=[])
+    reply = await persona_answer(name, target, MessageStream(_Channel(), interval=0.2))
+    assert reply
+
+
+async def _run(name, flow, requests, concurrency, provider):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+    calls0 = provider.calls
+
+    async def one(i):
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                await flow(i)
+                latencies.append(time.perf_counter() - t0)
+            except Exception as e:
+                errors.append(type(e).__name__)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - t0
+
+    lat = sorted(latencies) or [0.0]
+    p95 = lat[min(len(lat) - 1, int(0.95 * len(lat)))]
+    print(f"{name}")
+    print(f"  {requests} requests in {wall:.2f}s  ({requests / wall:.1f}/s)")
+    print(f"  latency p50 {statistics.median(lat) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+          f"max {lat[-1] * 1000:.0f} ms")
+    print(f"  backend calls per request: {(provider.calls - calls0) / requests:.2f}")
+    failed = ", ".join(f"{e} x{errors.count(e)}" for e in sorted(set(errors))) or "none"
+    print(f"  failed after retries: {len(errors)} ({failed})")
+
+
+async def main(args):
+    logging.basicConfig(level=logging.ERROR)   # retries are expected here; keep the report readable
+    provider = LocalProvider(latency=args.latency, failure_rate=args.failure_rate, seed=args.seed)
+    llm.set_provider(provider)
+    llm.BACKOFF_SECONDS = args.backoff
+    print(f"local backend: latency {args.latency}s, failure rate {args.failure_rate:.0%}, "
+          f"LLM_CONCURRENCY {llm.LLM_CONCURRENCY} (+{llm.LLM_BATCH_CONCURRENCY} batch), "
+          f"{args.concurrency} concurrent requests\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import bench_maddy
+        bench_maddy._synthetic_data_dir(tmp, bench_maddy._load_unit_names())
+        os.environ.update(MADDY_DATA_DIR=tmp, MADDY_RULES_INDEX=os.path.join(tmp, "missing.idx"))
+
+        flows = {
+            "sentiment": _sentiment,
+            "maddy": lambda i: _maddy(i, bench_maddy.QUESTIONS),
+            "persona": _persona,
+        }
+        for name in args.flows:
+            telemetry.tag(command=name)
+            await _run(name, flows[name], args.requests, args.concurrency, provider)
+            print()
+    print("\n".join(telemetry.report()))
+    await llm.close()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    ap.add_argument("--requests", type=int, default=60)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--latency", type=float, default=0.3, help="backend seconds to first token")
+    ap.add_argument("--failure-rate", type=float, default=0.05)
+    ap.add_argument("--backoff", type=float, default=0.05, help="retry backoff base (seconds)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--flows", nargs="+", default=["sentiment", "maddy", "persona"],
+                    choices=["sentiment", "maddy", "persona"])
+    sys.exit(asyncio.run(main(ap.parse_args())))
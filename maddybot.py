@@ -1,15 +1,35 @@
 # maddybot.py
-import os, re, json, difflib, random
+import os, re, json, difflib, random, asyncio, hashlib, logging, contextvars
+from collections import deque
+from contextvars import ContextVar
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
+import numpy as np
+
+from fuzzy import TrigramIndex
+from damage import Weapon, WeaponTable, save_column, top_units, unit_matrix
+from rules_index import RulesIndex, open_index
+from ttlcache import TTLCache, write_atomic
+from llm import MessageStream, complete
+from factions import FACTIONS
+
 # ===============================================
 # ---------------- CONFIG -----------------------
 # ===============================================
 
+log = logging.getLogger(__name__)
+
 GPT_MODEL = os.getenv("MADDY_GPT_MODEL", "gpt-4o-mini")
 DEFAULT_MAX_UNITS = 5
 TOP_K = 8
+RETRIEVAL_MIN_SCORE = 0.25   # below this the top unit is a guess; let GPT pick instead
+RETRIEVAL_KEEP = 0.9         # also keep units scoring within 10% of the best one
+RELOAD_SECONDS = float(os.getenv("MADDY_RELOAD_SECONDS", "30"))
+ANSWER_CACHE_SIZE = int(os.getenv("MADDY_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("MADDY_CACHE_TTL", str(6 * 3600)))
+ANSWER_CACHE_PATH = os.getenv("MADDY_CACHE_PATH")   # unset: in-memory only
+ANSWER_CACHE_PERSIST_DELAY = 5.0   # seconds; misses in this window share one write
 
 def _data_dir() -> Path:
     env = os.getenv("MADDY_DATA_DIR")
@@ -74,38 +94,69 @@ def _is_combat_related(question: str) -> bool:
 # ---------------- CACHE + LOAD -----------------
 # ===============================================
 
-_CACHE = {
-    "unit_names": None,
-    "rules": None,
-    "armies": None,
-    "phrases": None,
-    "aliases": None,
-}
+def _new_cache() -> Dict[str, Any]:
+    return {
+        "unit_names": None,
+        "rules": None,
+        "armies": None,
+        "unit_index": None,
+        "phrases": None,
+        "aliases": None,
+        "matcher": None,
+        "unit_search": None,
+        "retrieval": None,
+        "stats": None,
+        "unit_profiles": None,
+        "damage": None,
+        "version": None,
+        "pins": 0,          # questions running on this generation
+        "retired": False,   # replaced by a reload
+    }
+
+# The current data generation. A reload builds a whole new dict and rebinds
+# this name; questions already running keep the generation pinned in _PINNED.
+_CACHE = _new_cache()
+_PINNED: ContextVar[Optional[Dict[str, Any]]] = ContextVar("maddy_cache", default=None)
+
+def _cache() -> Dict[str, Any]:
+    return _PINNED.get() or _CACHE
 
 def _load_json(path: Path):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
+def _rules_index_path() -> Path:
+    env = os.getenv("MADDY_RULES_INDEX")
+    return Path(env) if env else (_data_dir() / "rules.idx")
+
 def _load_index_and_rules():
-    if _CACHE["unit_names"] is not None:
-        return _CACHE["unit_names"], _CACHE["rules"]
+    """
+    (unit names, rules). With a fresh compiled index (see rules_index.py) the
+    "rules" are the mmapped RulesIndex and no JSON is parsed; otherwise the
+    two JSON files are loaded as before.
+    """
+    cache = _cache()
+    if cache["unit_names"] is not None:
+        return cache["unit_names"], cache["rules"]
     base = _data_dir()
+    compiled = open_index(_rules_index_path(), base)
+    if compiled is not None:
+        cache["unit_names"], cache["rules"] = compiled.unit_names(), compiled
+        return cache["unit_names"], compiled
     idx = _load_json(base / "unit_faction_index.json")
     rules = _load_json(base / "blob.json")
     names = sorted(set([u["unit"] for u in idx.get("units", []) if "unit" in u]))
-    _CACHE["unit_names"], _CACHE["rules"] = names, rules
+    cache["unit_names"], cache["rules"] = names, rules
     return names, rules
 
-def _build_armies_map(rules: Dict[str, Any]):
-    if _CACHE["armies"] is not None:
-        return _CACHE["armies"]
+def _armies_from_rules(rules: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+    """faction -> list of unit dicts, from the blob's "armies" section."""
     out: Dict[str, List[Dict[str, Any]]] = {}
     armies = None
     for k in rules:
         if k.lower() == "armies":
             armies = rules[k]; break
     if not isinstance(armies, dict):
-        _CACHE["armies"] = out
         return out
     for fac_name, fac_obj in armies.items():
         units_list: List[Dict[str, Any]] = []
@@ -123,17 +174,81 @@ def _build_armies_map(rules: Dict[str, Any]):
                     else:
                         units_list.append({"name": str(v) if v else key})
         out[str(fac_name)] = units_list
-    _CACHE["armies"] = out
     return out
 
-def _get_unit_object(name: str, armies: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def _build_armies_map(rules):
+    """
+    Armies plus the derived unit index and damage matrix, built once.
+    For a compiled RulesIndex the "armies" are the index itself: units are
+    decoded lazily on lookup and the damage matrix comes from its weapon rows.
+    """
+    cache = _cache()
+    if cache["armies"] is not None:
+        return cache["armies"]
+    if isinstance(rules, RulesIndex):
+        cache["armies"] = rules
+        cache["unit_index"] = rules.unit_index()
+        cache["unit_profiles"] = {}
+        cache["damage"] = _build_damage_from_index(rules)
+        return rules
+    out = _armies_from_rules(rules)
+    cache["armies"] = out
+    cache["unit_index"] = _build_unit_index(out)
+    cache["unit_profiles"] = _compile_profiles(cache["unit_index"])
+    cache["damage"] = _build_damage(cache["unit_index"], cache["unit_profiles"])
+    return out
+
+def _build_unit_index(armies: Dict[str, Any]) -> Dict[str, Dict[str, tuple]]:
+    """
+    normalized name -> (faction, unit) for every unit, built once at load.
+    'by_name' keys on the unit's display name (name > unitName > displayName);
+    'by_alt' also keys on unitName/displayName so alternate spellings resolve.
+    First unit wins on collisions, matching the old linear scan.
+    """
+    by_name: Dict[str, tuple] = {}
+    by_alt: Dict[str, tuple] = {}
     for fac, units in armies.items():
         for u in units:
             n = u.get("name") or u.get("unitName") or u.get("displayName") or ""
-            if n and _normalize(n) == _normalize(name):
-                v = dict(u); v["_faction"] = fac
-                return v
-    return None
+            if n:
+                by_name.setdefault(_normalize(n), (fac, u))
+            for alt in (u.get("unitName"), u.get("displayName")):
+                if isinstance(alt, str) and alt:
+                    by_alt.setdefault(_normalize(alt), (fac, u))
+    return {"by_name": by_name, "by_alt": by_alt}
+
+def _get_unit_object(name: str, armies: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    cache = _cache()
+    index = cache["unit_index"] if armies is cache["armies"] else None
+    if index is None:
+        index = _build_unit_index(armies)
+    key = _normalize(name)
+    hit = index["by_name"].get(key) or index["by_alt"].get(key)
+    if not hit:
+        return None
+    fac, u = hit
+    v = dict(u); v["_faction"] = fac
+    return v
+
+def _iter_units():
+    """(normalized name, faction, unit) for every known unit; bulk scans don't memoize lazily-decoded units."""
+    armies = _build_armies_map(_load_index_and_rules()[1])
+    if isinstance(armies, RulesIndex):
+        yield from armies.iter_units()
+    else:
+        for key, (fac, u) in (_cache()["unit_index"] or {"by_name": {}})["by_name"].items():
+            yield key, fac, u
+
+def _index_keywords() -> Dict[str, List[str]]:
+    """normalized unit name -> keywords listed for it in unit_faction_index.json."""
+    out: Dict[str, List[str]] = {}
+    try:
+        for row in _load_json(_data_dir() / "unit_faction_index.json").get("units", []):
+            if "unit" in row:
+                out.setdefault(_normalize(row["unit"]), []).extend(row.get("factions") or [])
+    except (OSError, ValueError):
+        pass
+    return out
 
 
 # ===============================================
@@ -170,33 +285,103 @@ def _load_aliases() -> dict[str, list[str]]:
     return out
 
 def _get_aliases() -> dict[str, list[str]]:
-    if _CACHE["aliases"] is None:
-        _CACHE["aliases"] = _load_aliases()
-    return _CACHE["aliases"]
+    cache = _cache()
+    if cache["aliases"] is None:
+        cache["aliases"] = _load_aliases()
+    return cache["aliases"]
 
 def _contains_whole_word(hay: str, needle: str) -> bool:
     return re.search(r"(?:^|\s)"+re.escape(needle)+r"(?:\s|$)", " "+hay+" ") is not None
 
+# ===============================================
+# ---------------- PHRASE MATCHER ---------------
+# ===============================================
+
+class _PhraseMatcher:
+    """
+    Word-level Aho-Corasick automaton over normalized phrases.
+    find_all() returns the payload of every phrase that occurs as a run of whole
+    words in the (normalized) text, in one left-to-right pass over its tokens.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[list] = [[]]
+
+    def add(self, phrase: str, payload) -> None:
+        words = phrase.split()
+        if not words:
+            return
+        node = 0
+        for w in words:
+            nxt = self._goto[node].get(w)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][w] = nxt
+                self._goto.append({}); self._fail.append(0); self._out.append([])
+            node = nxt
+        self._out[node].append(payload)
+
+    def build(self) -> "_PhraseMatcher":
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for w, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and w not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(w, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        return self
+
+    def find_all(self, text_norm: str) -> list:
+        hits, node = [], 0
+        for w in text_norm.split():
+            while node and w not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(w, 0)
+            if self._out[node]:
+                hits.extend(self._out[node])
+        return hits
+
+def _build_matcher(unit_names: list[str], aliases: dict[str, list[str]]) -> dict:
+    m = _PhraseMatcher()
+    normalized = []
+    for u in unit_names:
+        un = _normalize(u)
+        normalized.append((u, un.split()))
+        m.add(un, ("unit", u))
+    for a, targets in aliases.items():
+        for t in targets:
+            m.add(a, ("alias", t))
+    return {"unit_names": unit_names, "aliases": aliases, "matcher": m.build(), "normalized": normalized}
+
+def _get_matcher(unit_names: list[str], aliases: dict[str, list[str]]) -> dict:
+    cached = _cache()["matcher"]
+    if cached is None or cached["unit_names"] is not unit_names or cached["aliases"] is not aliases:
+        cached = _cache()["matcher"] = _build_matcher(unit_names, aliases)
+    return cached
+
 def _smart_detect_units(question: str, unit_names: list[str], aliases: dict[str, list[str]]):
     qn = _normalize(question)
     q_tokens = qn.split()
+    index = _get_matcher(unit_names, aliases)
 
-    exact_hits = [u for u in unit_names if _contains_whole_word(qn, _normalize(u))]
-    if exact_hits: return sorted(set(exact_hits)), None
-
-    alias_hits: list[str] = []
-    for a, targets in aliases.items():
-        if _contains_whole_word(qn, a): alias_hits.extend(targets)
-    alias_hits = sorted(set(alias_hits))
-    if alias_hits: return alias_hits, None
+    exact_hits: set[str] = set()
+    alias_hits: set[str] = set()
+    for kind, target in index["matcher"].find_all(qn):
+        (exact_hits if kind == "unit" else alias_hits).add(target)
+    if exact_hits: return sorted(exact_hits), None
+    if alias_hits: return sorted(alias_hits), None
 
     sig = [t for t in q_tokens if len(t) >= 5]
     if not sig: return [], None
 
     partial_hits: set[str] = set()
-    for u in unit_names:
-        un = _normalize(u)
-        words = un.split()
+    for u, words in index["normalized"]:
         for t in sig:
             if t in words or any(w.startswith(t) for w in words):
                 partial_hits.add(u)
@@ -207,6 +392,115 @@ def _smart_detect_units(question: str, unit_names: list[str], aliases: dict[str,
     return [], f"That name is ambiguous. Did you mean: {', '.join(sorted(list(partial_hits))[:6])}?"
 
 
+# ===============================================
+# ---------------- FUZZY UNIT SEARCH ------------
+# ===============================================
+
+FUZZY_PRUNE = 64   # trigram candidates re-ranked with difflib per query
+
+def _get_unit_search(unit_names: List[str]) -> dict:
+    """
+    Trigram index + word index over normalized unit names, built once per names list.
+    'by_norm' maps a normalized name back to the first unit name that produced it.
+    """
+    cached = _cache()["unit_search"]
+    if cached is None or cached["unit_names"] is not unit_names:
+        by_norm: Dict[str, str] = {}
+        words: Dict[str, set] = {}
+        for u in unit_names:
+            un = _normalize(u)
+            if not un or un in by_norm:
+                continue
+            by_norm[un] = u
+            for w in un.split():
+                words.setdefault(w, set()).add(un)
+        cached = _cache()["unit_search"] = {
+            "unit_names": unit_names,
+            "by_norm": by_norm,
+            "words": words,
+            "trigrams": TrigramIndex(by_norm, normalize=_normalize),
+        }
+    return cached
+
+def _rank_by_similarity(query_norm: str, norm_names, idx: dict) -> List[str]:
+    """Unit names for `norm_names`, best difflib ratio first (ties: alphabetical)."""
+    scored = [
+        (difflib.SequenceMatcher(a=un, b=query_norm).ratio(), idx["by_norm"][un])
+        for un in norm_names
+    ]
+    scored.sort(key=lambda t: (-t[0], t[1]))
+    return [name for _, name in scored]
+
+def _fuzzy_units(query_norm: str, unit_names: List[str], k: int = 1, prune: int = FUZZY_PRUNE) -> List[str]:
+    """
+    Top-k unit names by similarity to `query_norm`. The trigram index prunes to a
+    few dozen candidates, which are then re-ranked with the same difflib ratio
+    the old full scans used.
+    """
+    idx = _get_unit_search(unit_names)
+    candidates = idx["trigrams"].candidates(query_norm, max(prune, k))
+    return _rank_by_similarity(query_norm, candidates, idx)[:k]
+
+
+# ===============================================
+# ---------------- RETRIEVAL --------------------
+# ===============================================
+
+_NAME_WEIGHT = 0.7   # name char-grams vs keyword/ability words in the combined score
+
+def _unit_documents(unit_names: List[str]) -> List[str]:
+    """Per unit name: its name, keywords from unit_faction_index.json, ability names and text."""
+    extra = _index_keywords()
+    for key, _fac, u in _iter_units():
+        words = extra.setdefault(key, [])
+        words += _keywords(u)
+        words += [" ".join(a) for a in _ability_entries(u, None)]
+    return [_normalize(n + " " + " ".join(extra.get(_normalize(n), ()))) for n in unit_names]
+
+def _build_retrieval(unit_names: List[str]) -> dict:
+    from sklearn.feature_extraction.text import TfidfVectorizer   # heavy import; only when building
+
+    names = [_normalize(n) for n in unit_names]
+    docs = _unit_documents(unit_names)
+    by_name = TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 4), sublinear_tf=True)
+    by_text = TfidfVectorizer(stop_words="english", sublinear_tf=True)
+    return {
+        "unit_names": unit_names,
+        "by_name": by_name,
+        "by_text": by_text,
+        # transposed so a query row times the matrix gives one score per unit
+        "name_matrix": by_name.fit_transform(names).T.tocsr(),
+        "text_matrix": by_text.fit_transform(docs).T.tocsr(),
+    }
+
+def _get_retrieval(unit_names: List[str]) -> dict:
+    cached = _cache()["retrieval"]
+    if cached is None or cached["unit_names"] is not unit_names:
+        cached = _cache()["retrieval"] = _build_retrieval(unit_names)
+    return cached
+
+def _retrieve_units(question: str, unit_names: List[str], k: int = TOP_K) -> List[tuple]:
+    """Top-k (unit name, score) by TF-IDF cosine: name char-grams blended with keyword/ability words."""
+    idx = _get_retrieval(unit_names)
+    q = [_normalize(question)]
+    scores = (_NAME_WEIGHT * (idx["by_name"].transform(q) @ idx["name_matrix"]).toarray()[0]
+              + (1 - _NAME_WEIGHT) * (idx["by_text"].transform(q) @ idx["text_matrix"]).toarray()[0])
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.lexsort((top, -scores[top]))]
+    return [(unit_names[i], float(scores[i])) for i in top]
+
+def _select_units(ranked: List[tuple], max_units: int) -> tuple:
+    """(chosen names, confident?) from retrieval results, best first."""
+    if not ranked:
+        return [], False
+    best = ranked[0][1]
+    chosen = [n for n, s in ranked if s >= best * RETRIEVAL_KEEP][:max_units]
+    return chosen, best >= RETRIEVAL_MIN_SCORE
+
+
 # ===============================================
 # --------- COMPARISON-AWARE RESOLUTION ---------
 # ===============================================
@@ -230,21 +524,16 @@ def _best_match_for_chunk(chunk_norm: str, unit_names: List[str]) -> Optional[st
     For a chunk like 'archaon' or 'skarbrand', pick the single best unit.
     Prefers exact word-in-name hits; otherwise falls back to overall similarity.
     """
-    candidates: List[str] = []
-    for u in unit_names:
-        un = _normalize(u)
-        if _contains_whole_word(un, chunk_norm):
-            candidates.append(u)
+    idx = _get_unit_search(unit_names)
+    words = chunk_norm.split()
+    if words:
+        containing = set.intersection(*(idx["words"].get(w, set()) for w in words))
+        candidates = [un for un in containing if _contains_whole_word(un, chunk_norm)]
+        if candidates:
+            return _rank_by_similarity(chunk_norm, candidates, idx)[0]
 
-    if candidates:
-        return max(candidates, key=lambda n: difflib.SequenceMatcher(a=_normalize(n), b=chunk_norm).ratio())
-
-    best, best_s = None, 0.0
-    for u in unit_names:
-        s = difflib.SequenceMatcher(a=_normalize(u), b=chunk_norm).ratio()
-        if s > best_s:
-            best_s, best = s, u
-    return best
+    best = _fuzzy_units(chunk_norm, unit_names, k=1)
+    return best[0] if best else None
 
 def _resolve_units_from_conjunctions(question: str, unit_names: List[str]) -> List[str]:
     """
@@ -317,98 +606,524 @@ def _weapon_crit_flags(prof: dict) -> tuple[bool, bool, bool]:
     return crit_mortal, crit_auto, crit_2hits
 
 
-def _expected_damage_vs_save(unit: dict, target_save: int = 4) -> float:
-    """Expected damage for a full unit vs a given save, including Crit rules."""
+def _compile_weapon(w: dict, model_count: int) -> Weapon:
+    """Pre-parse one weapon profile into the damage engine's row format."""
     def avg_dice(val):
         return _avg_dice(str(val)) or _parse_numeric_unsigned(val) or 0.0
     def p_success(s):
         m = _prob_x_plus(s)
         return m if m is not None else 0.0
-    def parse_rend(s):
-        v = _parse_numeric_signed(s)
-        return v if v is not None else 0.0
+    rend = _parse_numeric_signed(w.get("rend"))
+    p_hit = p_success(w.get("hit"))
+    crit_mortal, crit_auto, crit_two_hits = _weapon_crit_flags(w)
+    return Weapon(
+        attacks=avg_dice(w.get("attack")),
+        damage=avg_dice(w.get("damage")),
+        p_hit=p_hit,
+        p_wound=p_success(w.get("wound")),
+        # unmodified 6 always qualifies as a hit if to-hit <= 6, so P(crit)=1/6 in practice
+        # (and 0 if the weapon can't hit on a 6 for some reason)
+        p_crit=1.0 / 6.0 if p_hit > 0 else 0.0,
+        # effective save after rend (AoS: reduce the save value by rend)
+        save_mod=-(int(round(rend)) if rend is not None else 0),
+        crit_mortal=crit_mortal,
+        crit_auto=crit_auto,
+        crit_two_hits=crit_two_hits,
+        scale=float(model_count),
+    )
 
-    all_weapons = _collect_all_weapons(unit)
-    total = 0.0
 
-    # models in the unit (max is the unit size in your blob)
-    model_count = 1
-    try:
-        model_count = int(unit.get("models", [{}])[0].get("max", 1))
-    except Exception:
-        pass
+class _UnitProfile:
+    """Compiled combat view of a unit: model count, total health and weapon rows."""
+    __slots__ = ("models", "model_count", "total_health", "weapons", "row")
+
+    def __init__(self, unit: dict):
+        self.models = unit.get("models")   # identity check: is this profile for that unit?
+        self.row = None                    # row in the cached damage matrix, if any
+        try:
+            self.model_count = int(unit.get("models", [{}])[0].get("max", 1))
+        except Exception:
+            self.model_count = 1
+        try:
+            model_count = int(unit.get("models", [{}])[0].get("max", 1))
+            hp = float(str(unit.get("health", unit.get("wounds", 1))).replace("+", ""))
+            self.total_health = model_count * hp
+        except Exception:
+            self.total_health = None
+        self.weapons = tuple(_compile_weapon(w, self.model_count) for w in _collect_all_weapons(unit))
+
+
+def _unit_key(unit: dict) -> str:
+    return _normalize(unit.get("name") or unit.get("unitName") or unit.get("displayName") or "")
+
+def _compile_profiles(unit_index: Dict[str, Dict[str, tuple]]) -> Dict[str, _UnitProfile]:
+    """Parse every unit's weapons once at load, keyed like the unit index."""
+    return {key: _UnitProfile(u) for key, (_fac, u) in unit_index["by_name"].items()}
+
+def _build_damage(unit_index: Dict[str, Dict[str, tuple]], profiles: Dict[str, _UnitProfile]) -> Dict[str, Any]:
+    """Expected damage of every known unit into every save 2+..6+, in one vectorized pass."""
+    keys = list(profiles)
+    weapons = []
+    for row, key in enumerate(keys):
+        prof = profiles[key]
+        prof.row = row
+        weapons.extend(w._replace(owner=row) for w in prof.weapons)
+    factions = [unit_index["by_name"][k][0] for k in keys]
+    return _damage_tables(keys, factions, WeaponTable.from_weapons(weapons))
+
+def _build_damage_from_index(index: RulesIndex) -> Dict[str, Any]:
+    """Same as _build_damage, straight from a compiled index's weapon rows (no JSON decoded)."""
+    return _damage_tables(index.keys(), index.factions(), index.weapon_table())
+
+def _damage_tables(keys: List[str], factions: List[str], table: WeaponTable) -> Dict[str, Any]:
+    return {
+        "keys": keys,
+        "rows": {k: i for i, k in enumerate(keys)},
+        "factions": factions,
+        "matrix": unit_matrix(table, len(keys)),
+        # average attacks the whole unit makes across all its weapons
+        "attacks": np.bincount(table.owner, weights=table.attacks * table.scale, minlength=len(keys)),
+    }
+
+def _unit_profile(unit: dict) -> _UnitProfile:
+    """Load-time profile for `unit` (or a copy of it); compiles on the fly for unknown units."""
+    cache = _cache()
+    profiles = cache.get("unit_profiles")
+    key = _unit_key(unit)
+    prof = profiles.get(key) if profiles is not None else None
+    if prof is not None and prof.models is unit.get("models"):
+        return prof
+    prof = _UnitProfile(unit)
+    # units decoded lazily from a compiled index are profiled on first use
+    known = cache["unit_index"]["by_name"] if profiles is not None and cache["unit_index"] else {}
+    if key in known and known[key][1].get("models") is unit.get("models"):
+        prof.row = cache["damage"]["rows"][key]
+        profiles[key] = prof
+    return prof
 
-    # clamp defender save to 2..6
-    base_sv = max(2, min(6, int(target_save)))
 
-    for w in all_weapons:
-        atk = avg_dice(w.get("attack"))
-        dmg = avg_dice(w.get("damage"))
-        ph  = p_success(w.get("hit"))
-        pw  = p_success(w.get("wound"))
-        rend = parse_rend(w.get("rend"))
+def _expected_damage_vs_save(unit: dict, target_save: int = 4) -> float:
+    """Expected damage for a full unit vs a given save, including Crit rules."""
+    prof = _unit_profile(unit)
+    col = save_column(target_save)   # clamps defender save to 2..6
+    if prof.row is not None:
+        return round(float(_cache()["damage"]["matrix"][prof.row, col]), 2)
+    matrix = unit_matrix(WeaponTable.from_weapons(prof.weapons), 1)
+    return round(float(matrix[0, col]), 2)
+
+
+def _top_damage_units(target_save: int = 4, faction: Optional[str] = None, n: int = 5) -> List[tuple]:
+    """[(unit name, faction, expected damage)] for the hardest hitters into `target_save`."""
+    cache = _cache()
+    if cache["armies"] is None:
+        _build_armies_map(_load_index_and_rules()[1])
+    dmg = cache["damage"]
+    if not dmg or not dmg["keys"]:
+        return []
+    rows = None
+    if faction:
+        want = _normalize(faction)
+        rows = [i for i, f in enumerate(dmg["factions"]) if _normalize(f) == want]
+    by_name = cache["unit_index"]["by_name"]
+    out = []
+    for row, value in top_units(dmg["matrix"], target_save, n, rows):
+        fac, u = by_name[dmg["keys"][row]]
+        out.append((u.get("name") or dmg["keys"][row], fac, round(value, 2)))
+    return out
 
-        # effective save after rend (AoS: reduce the save value by rend)
-        eff = base_sv - int(round(rend))
-        if eff < 2:
-            p_save = 5.0 / 6.0
-        elif eff <= 6:
-            p_save = (7 - eff) / 6.0
-        else:
-            p_save = 0.0
-        p_unsaved = 1.0 - p_save
-
-        # --- Crit flags ---
-        crit_mortal, crit_auto, crit_two_hits = _weapon_crit_flags(w)
-
-        # --- Split hits into crit vs non-crit ---
-        # unmodified 6 always qualifies as a hit if to-hit <= 6, so P(crit)=1/6 in practice
-        # (and 0 if the weapon can't hit on a 6 for some reason)
-        p_crit = 1.0 / 6.0 if ph > 0 else 0.0
-        # don't exceed total hit probability
-        p_noncrit = max(0.0, ph - p_crit)
 
-        # --- Non-crit contribution (normal pipeline: hit -> wound -> save -> damage) ---
-        e_noncrit = atk * p_noncrit * pw * p_unsaved * dmg
+def _derived_stats(unit: dict, target_save: int = 4) -> dict:
+    return {
+        f"expected_damage_vs_{target_save}+": _expected_damage_vs_save(unit, target_save),
+        "total_health": _unit_profile(unit).total_health,
+    }
 
-        # --- Crit base contribution depends on effect ---
-        if crit_mortal:
-            # mortal wounds: skip wound & save, deal straight damage
-            e_crit_base = atk * p_crit * dmg
-        elif crit_auto:
-            # auto-wound: skip wound but still save
-            e_crit_base = atk * p_crit * p_unsaved * dmg
-        else:
-            # no special crit: just a normal hit that still wounds+saves
-            e_crit_base = atk * p_crit * pw * p_unsaved * dmg
 
-        # --- Crit (2 Hits): each crit generates ONE extra normal hit on top ---
-        # That extra behaves like a normal hit (wound + save)
-        e_crit_extra = 0.0
-        if crit_two_hits:
-            e_crit_extra = atk * p_crit * pw * p_unsaved * dmg
+# ===============================================
+# ---------------- PROMPT BUILDER ---------------
+# ===============================================
 
-        total += e_noncrit + e_crit_base + e_crit_extra
+PROMPT_TOKEN_BUDGET = int(os.getenv("MADDY_PROMPT_TOKENS", "2500"))
+_CHARS_PER_TOKEN = 4   # rough estimate for English + JSON punctuation
+
+WEAPON_COLUMNS = ["name", "range", "attacks", "hit", "wound", "rend", "damage", "abilities"]
+_WEAPON_KEYS = ["name", "range", "attack", "hit", "wound", "rend", "damage"]
+
+# whole words only: "ward" is not "forward", "heal" is not "health", "fly" is not "firefly"
+_ABILITY_TERMS = re.compile(
+    r"\b(?:abilit(?:y|ies)|spells?|prayers?|commands?|wards?|heal(?:s|ed|ing|er)?|auras?"
+    r"|deploy(?:s|ed|ing|ment)?|reactions?|once per|passive|cast(?:s|ing|er)?|chants?"
+    r"|banish(?:es|ed|ing)?|rules?)\b")
+_KEYWORD_TERMS = re.compile(
+    r"\b(?:keywords?|hero(?:es)?|monsters?|infantry|cavalry|fl(?:y|ies|ying)|wizards?|priests?"
+    r"|unique|champions?|reinforce[ds]?|beasts?|warmaster)\b")
+_NOISE_KEYS = ("id", "uuid", "image", "icon", "url", "art", "points_id")
+
+# which parts of a unit each kind of question needs (stats always go in); combat
+# keeps ability names, since abilities often change hit, wound or rend
+_VIEWS = {
+    "combat": ("weapons", "derived", "ability_names"),
+    "abilities": ("abilities",),
+    "keywords": ("keywords",),
+}
 
-    return round(total * model_count, 2)
+def _question_parts(question: str) -> tuple:
+    """Unit parts the question is about; everything for questions that match no view."""
+    qn = question.lower()
+    parts = []
+    if _is_combat_related(question):
+        parts += _VIEWS["combat"]
+    if _ABILITY_TERMS.search(qn):
+        parts += _VIEWS["abilities"]
+    if _KEYWORD_TERMS.search(qn):
+        parts += _VIEWS["keywords"]
+    return tuple(dict.fromkeys(parts)) or ("weapons", "derived", "abilities", "keywords")
+
+_SCALAR_TEXT_CAP = 300   # long free-text fields are flavour, not stats
+
+def _is_noise_key(k: str) -> bool:
+    k = k.lower()
+    return k.startswith("_") or k in _NOISE_KEYS or k.endswith("_id")
+
+def _scalars(obj: dict) -> dict:
+    return {k: (v[:_SCALAR_TEXT_CAP] if isinstance(v, str) else v) for k, v in obj.items()
+            if isinstance(v, (str, int, float, bool)) and v != "" and not _is_noise_key(k)}
+
+def _ability_entries(unit: dict, text_cap: Optional[int]) -> list:
+    """[name] or [name, text] per ability, text cut to text_cap chars (0 = names only)."""
+    out = []
+
+    def cap(text: str) -> str:
+        return text if text_cap is None else text[:text_cap]
+
+    def add(a):
+        if isinstance(a, str):
+            out.append([a.split(":", 1)[0][:60]] if text_cap == 0 else [cap(a)])
+        elif isinstance(a, dict):
+            name = str(a.get("name") or a.get("title") or "").strip()
+            text = next((a[k] for k in ("text", "description", "effect", "rule", "declare")
+                         if isinstance(a.get(k), str) and a.get(k)), "")
+            if text_cap == 0 or not text:
+                out.append([name or text[:60]])
+            else:
+                out.append([name, cap(text)])
+
+    for key, val in unit.items():
+        if "abilit" in key.lower():
+            for a in (val.values() if isinstance(val, dict) else val if isinstance(val, list) else [val]):
+                add(a)
+    return out
 
+def _keywords(unit: dict) -> list:
+    out = []
+    for key, val in unit.items():
+        if "keyword" in key.lower():
+            vals = val.values() if isinstance(val, dict) else val if isinstance(val, list) else [val]
+            out.extend(str(v) for v in vals if isinstance(v, (str, int)))
+    return list(dict.fromkeys(out))
+
+def _weapon_rows(unit: dict) -> list:
+    rows = []
+    for w in _collect_all_weapons(unit):
+        row = ["" if w.get(k) is None else w.get(k) for k in _WEAPON_KEYS]
+        abilities = w.get("abilities") or []
+        if isinstance(abilities, dict):
+            abilities = list(abilities.values())
+        names = [a.get("name", "") if isinstance(a, dict) else str(a)
+                 for a in (abilities if isinstance(abilities, list) else [abilities])]
+        row.append(", ".join(n for n in names if n))
+        rows.append(row)
+    return rows
+
+def _project_unit(unit: dict, parts: tuple, target_save: int, text_cap: Optional[int]) -> dict:
+    """The parts of `unit` the question needs, as a new small dict (the unit is never copied or mutated)."""
+    out = _scalars(unit)
+    if unit.get("_faction"):
+        out["faction"] = unit["_faction"]
+    models = [m for m in (unit.get("models") or []) if isinstance(m, dict)]
+    if models:
+        out["models"] = [_scalars(m) for m in models]
+    if "weapons" in parts:
+        out["weapons"] = _weapon_rows(unit)
+    if "derived" in parts:
+        out["derived"] = _derived_stats(unit, target_save)
+    if "abilities" in parts or "ability_names" in parts:
+        cap = text_cap if "abilities" in parts else 0
+        abilities = _ability_entries(unit, cap)
+        for m in models:
+            abilities += _ability_entries(m, cap)
+        if abilities:
+            out["abilities"] = abilities
+    if "keywords" in parts:
+        kws = _keywords(unit)
+        if kws:
+            out["keywords"] = kws
+    return out
 
-def _attach_derived(unit: dict, target_save: int = 4) -> dict:
-    import copy
-    u = copy.deepcopy(unit)
-    derived = {}
-    derived[f"expected_damage_vs_{target_save}+"] = _expected_damage_vs_save(u, target_save)
+# detail levels tried in order until the payload fits the budget:
+# ability text cap (None = full text, 0 = names only)
+_DETAIL_LEVELS = (None, 400, 160, 0)
+
+def _build_unit_payload(question: str, unit_objs: List[Dict[str, Any]], target_save: int,
+                        budget: int = PROMPT_TOKEN_BUDGET) -> tuple:
+    """(compact JSON text, info dict) for the units, within `budget` estimated tokens if possible."""
+    parts = _question_parts(question)
+    for level, text_cap in enumerate(_DETAIL_LEVELS):
+        payload = {"units": [_project_unit(u, parts, target_save, text_cap) for u in unit_objs]}
+        if "weapons" in parts:
+            payload = {"weapon_columns": WEAPON_COLUMNS, **payload}
+        text = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        tokens = len(text) // _CHARS_PER_TOKEN
+        if tokens <= budget or "abilities" not in parts:
+            break
+    info = {"parts": parts, "detail": level, "chars": len(text), "tokens": tokens}
+    if tokens > budget:
+        log.warning("Maddy prompt over budget: ~%d tokens > %d (%d units)", tokens, budget, len(unit_objs))
+    return text, info
 
-    try:
-        model_info = u.get("models", [{}])[0]
-        model_count = int(model_info.get("max", 1))
-        hp = float(str(u.get("health", u.get("wounds", 1))).replace("+", ""))
-        derived["total_health"] = model_count * hp
-    except Exception:
-        derived["total_health"] = None
 
-    u["_derived"] = derived
-    return u
+# ===============================================
+# ---------------- STRUCTURED QUERIES -----------
+# ===============================================
+
+# metric -> (question phrases, stat keys in the unit data, higher is better, label);
+# checked in order, so "total health" wins over "health"
+_METRICS = {
+    "total_health": (("total health", "total wounds", "tankiest", "toughest", "tougher", "most durable"),
+                     (), True, "total health"),
+    "health": (("health", "wounds", "hp"), ("health", "wounds"), True, "health"),
+    "save": (("save", "saves"), ("save",), False, "save"),
+    "move": (("move", "movement", "speed", "fastest", "slowest", "quickest", "faster", "slower", "quicker"),
+             ("move", "movement"), True, "move"),
+    "control": (("control",), ("control",), True, "control"),
+    "attacks": (("attacks",), (), True, "attacks"),
+    "damage": (("damage", "dmg", "killiest", "hardest hitting", "hits hardest"), (), True, "expected damage"),
+}
+_BEST_WORDS = ("most", "highest", "best", "top", "biggest", "largest", "greatest", "fastest", "quickest",
+               "tankiest", "toughest", "killiest", "hardest", "strongest", "max", "maximum", "most durable")
+_WORST_WORDS = ("least", "lowest", "worst", "fewest", "smallest", "slowest", "weakest", "min", "minimum")
+_LIST_START = re.compile(r"^(which|what|list|show|name|find|any)\b")
+_PLURAL_SUBJECT = re.compile(r"\b(units|heroes|monsters|models|infantry|cavalry|wizards|priests|warscrolls)\b")
+_CMP = [
+    (r"(?:at least|or more|minimum of|>=)", ">="),
+    (r"(?:at most|or less|or fewer|maximum of|<=)", "<="),
+    (r"(?:more than|over|above|greater than|>)", ">"),
+    (r"(?:less than|fewer than|under|below|<)", "<"),
+    (r"(?:of|=|equal to|exactly)", "=="),
+]
+# comparator phrases, blanked out before looking for best/worst words ("at least" is not "least")
+_CMP_PHRASES = re.compile(r"(?<![a-z])(?:" + "|".join(p for p, _ in _CMP[:4]) + r")(?![a-z])")
+# unit types people filter by; if one is asked for but the data has no such keyword, defer to GPT
+_TYPE_WORDS = ("hero", "monster", "wizard", "priest", "infantry", "cavalry", "war machine", "champion",
+               "beast", "manifestation", "totem", "unique", "fly")
+_TARGET_SAVE = re.compile(r"\b(?:into|vs|versus|against)\s+(?:an?\s+)?\d\s*(?:save|saves)?\b")
+# "gotrek's attacks": a possessive names the subject, even one unit detection doesn't know
+_POSSESSIVE = re.compile(r"\b([a-z][a-z\-]+)['\u2019]s\b")
+_NOT_OWNERS = {"what", "that", "it", "who", "there", "here", "let", "he", "she", "where", "how",
+               "unit", "model", "army", "faction", "game", "everyone", "anyone"}
+QUERY_LIMIT = 5
+
+def _has_phrase(qn: str, phrase: str) -> bool:
+    return re.search(r"(?:^|\s)" + re.escape(phrase) + r"(?:\s|$)", qn) is not None
+
+def _stat_value(unit: dict, keys) -> float:
+    """First numeric stat among `keys` on the unit or its first model ("6\"" -> 6, "4+" -> 4); NaN if none."""
+    sources = [unit] + [m for m in (unit.get("models") or [])[:1] if isinstance(m, dict)]
+    for src in sources:
+        lowered = {str(k).lower(): v for k, v in src.items()}
+        for k in keys:
+            v = _parse_numeric_unsigned(lowered.get(k))
+            if v is not None:
+                return v
+    return float("nan")
+
+def _build_stats() -> Dict[str, Any]:
+    """Per-unit stat columns aligned with the damage matrix rows, plus each row's keyword set."""
+    _build_armies_map(_load_index_and_rules()[1])
+    dmg = _cache()["damage"] or _damage_tables([], [], WeaponTable.from_weapons([]))
+    n = len(dmg["keys"])
+    cols = {m: np.full(n, np.nan) for m, spec in _METRICS.items() if spec[1]}
+    models = np.ones(n)
+    names = list(dmg["keys"])
+    index_kws = _index_keywords()
+    keywords = [set() for _ in range(n)]
+    for key, fac, u in _iter_units():
+        row = dmg["rows"].get(key)
+        if row is None:
+            continue
+        names[row] = u.get("name") or u.get("unitName") or u.get("displayName") or key
+        for metric, col in cols.items():
+            col[row] = _stat_value(u, _METRICS[metric][1])
+        try:
+            models[row] = int(u.get("models", [{}])[0].get("max", 1))
+        except Exception:
+            pass
+        keywords[row] = {_normalize(k) for k in index_kws.get(key, []) + _keywords(u) + [fac] if str(k).strip()}
+    cols["total_health"] = cols["health"] * models
+    cols["attacks"] = dmg["attacks"]
+    vocab = sorted(set().union(*keywords), key=len, reverse=True) if keywords else []
+    return {"names": names, "factions": dmg["factions"], "keywords": keywords, "vocab": vocab,
+            "columns": cols, "matrix": dmg["matrix"]}
+
+def _get_stats() -> Dict[str, Any]:
+    cache = _cache()
+    if cache["stats"] is None:
+        cache["stats"] = _build_stats()
+    return cache["stats"]
+
+def _singular(qn: str) -> str:
+    return " ".join(w if w == "chaos" else re.sub(r"(?<=[a-z]{3})(es|s)$", "", w) for w in qn.split())
+
+def _question_filters(qn: str, stats: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Keywords (factions, HERO, MONSTER, ...) the question restricts to, longest phrases first.
+    None if it asks for a unit type the data has no keyword for.
+    """
+    singular = _singular(qn)
+    found: List[str] = []
+    for kw in stats["vocab"]:
+        if (_has_phrase(qn, kw) or _has_phrase(singular, kw)) and not any(kw in f for f in found):
+            found.append(kw)
+    # short faction aliases ("ko", "nh", "sce") resolve through the faction registry
+    for alias, name in FACTIONS.alias_map().items():
+        canon = _normalize(name)
+        if canon not in found and _has_phrase(qn, _normalize(alias)) and canon in stats["vocab"]:
+            found.append(canon)
+    for word in _TYPE_WORDS:
+        if (_has_phrase(qn, word) or _has_phrase(singular, word)) and not any(word in f for f in found):
+            return None
+    return found
+
+def _named_in(qn: str, unit: str, aliases: Dict[str, List[str]]) -> bool:
+    """True if the unit's full name, or one of its aliases, is literally in the question."""
+    if _has_phrase(qn, _normalize(unit)):
+        return True
+    return any(unit in targets and _has_phrase(qn, a) for a, targets in aliases.items())
+
+def _question_metric(qn: str) -> Optional[str]:
+    for metric, (phrases, _keys, _hib, _label) in _METRICS.items():
+        if any(_has_phrase(qn, p) for p in phrases):
+            return metric
+    return None
+
+def _metric_column(stats: Dict[str, Any], metric: str, target_save: int) -> np.ndarray:
+    if metric == "damage":
+        return stats["matrix"][:, save_column(target_save)] if len(stats["names"]) else np.zeros(0)
+    return stats["columns"][metric]
+
+def _fmt_stat(metric: str, v: float, target_save: int) -> str:
+    if metric == "save":
+        return f"{v:g}+"
+    if metric == "move":
+        return f'{v:g}"'
+    if metric == "damage":
+        return f"{v:.2f} vs {target_save}+"
+    return f"{round(v, 1):g}"
+
+def _numeric_filter(qn: str, metric: str) -> Optional[tuple]:
+    """("op", value) for "health over 10", "move of at least 8", "a 3+ save"; None if there isn't one."""
+    if metric == "save":
+        m = re.search(r"(?:^|\s)(\d)\s+save", qn)   # "3+" normalizes to "3"
+        if m:
+            better = re.search(r"\b" + m.group(1) + r"\s+save or better", qn)
+            return ("<=" if better else "==", float(m.group(1)))
+    for phrase in _METRICS[metric][0]:
+        for pattern, op in _CMP:
+            m = re.search(re.escape(phrase) + r"\s+(?:of\s+)?" + pattern + r"\s+(\d+(?:\.\d+)?)", qn)
+            if m:
+                return op, float(m.group(1))
+    return None
+
+def _apply_op(col: np.ndarray, op: str, value: float) -> np.ndarray:
+    return {">=": col >= value, "<=": col <= value, ">": col > value, "<": col < value, "==": col == value}[op]
+
+def _structured_answer(question: str, compared: List[str], names_unit: bool = False) -> Optional[str]:
+    """
+    Answer ranking / filter / stat-compare questions straight from the stat columns.
+    Returns None for anything else (or if the question's filters match nothing),
+    so the caller falls back to GPT. `names_unit` says unit detection found (or
+    found an ambiguous) unit name in the question: a question about one specific
+    unit ("most damage out of my saurus warriors") is not a ranking, so it only
+    goes through here as a compare of 2+ units.
+    """
+    if names_unit and len(compared) < 2:
+        return None
+    # "into a 3+ save" names the defender, not the stat being asked about
+    qn = re.sub(r"\s+", " ", _TARGET_SAVE.sub(" ", _normalize(question))).strip()
+    metric = _question_metric(qn)
+    stats = _get_stats()
+    if not stats["names"]:
+        return None
+    owners = [w for w in _POSSESSIVE.findall(question.lower())
+              if w not in _NOT_OWNERS and not any(_has_phrase(kw, w) for kw in stats["vocab"])]
+    if owners and len(compared) < 2:
+        return None
+    target_save = extract_target_save(question, 4)
+    bare = _CMP_PHRASES.sub(" ", qn)
+    best = any(_has_phrase(bare, w) for w in _BEST_WORDS)
+    worst = any(_has_phrase(bare, w) for w in _WORST_WORDS)
+
+    # compare: "who has more health, gotrek or kragnos" (only units actually named, not fuzzy guesses)
+    if metric and len(compared) >= 2:
+        aliases = _get_aliases()
+        if not all(_named_in(qn, n, aliases) for n in compared):
+            return None
+        rows = [stats["names"].index(n) for n in compared if n in stats["names"]]
+        if len(rows) < 2:
+            return None
+        col = _metric_column(stats, metric, target_save)
+        vals = [(stats["names"][r], col[r]) for r in rows]
+        known = [(n, v) for n, v in vals if not np.isnan(v)]
+        if not known:
+            return None
+        hib = _METRICS[metric][2]
+        winner = (max if hib else min)(known, key=lambda t: t[1])
+        lines = [f"{n}: {_fmt_stat(metric, v, target_save) if not np.isnan(v) else 'n/a'}" for n, v in vals]
+        lines.append(f"{winner[0]} has the better {_METRICS[metric][3]}.")
+        return "\n".join(lines)
+    if compared:
+        return None
+
+    filters = _question_filters(qn, stats)
+    if filters is None:
+        return None
+    numeric = _numeric_filter(qn, metric) if metric else None
+    listing = _LIST_START.search(qn) and _PLURAL_SUBJECT.search(qn)
+    if not ((metric and (best or worst or numeric)) or (listing and filters)):
+        return None
+
+    mask = np.ones(len(stats["names"]), dtype=bool)
+    for kw in filters:
+        mask &= np.array([kw in ks for ks in stats["keywords"]])
+    col = _metric_column(stats, metric, target_save) if metric else None
+    if numeric:
+        mask &= _apply_op(np.nan_to_num(col, nan=-1.0), *numeric)
+    if col is not None:
+        mask &= ~np.isnan(col)
+    rows = np.flatnonzero(mask)
+    if not len(rows):
+        return None
+
+    scope = " / ".join(f.upper() for f in filters) or "all units"
+    m = re.search(r"\btop\s+(\d+)\b|\b(\d+)\s+(?:best|highest|most|fastest|lowest|worst)\b", qn)
+    limit = min(int(m.group(1) or m.group(2)), 25) if m else QUERY_LIMIT
+
+    if metric and (best or worst):
+        hib = _METRICS[metric][2]
+        descending = hib if best or not worst else not hib
+        vals = col[rows]
+        order = np.lexsort((rows, -vals if descending else vals))[:limit]
+        label = _METRICS[metric][3]
+        head = f"{'Best' if best or not worst else 'Worst'} {label} ({scope}):"
+        lines = [f"{i + 1}. {stats['names'][rows[j]]} ({stats['factions'][rows[j]]}): "
+                 f"{_fmt_stat(metric, vals[j], target_save)}" for i, j in enumerate(order)]
+        return "\n".join([head] + lines)
+
+    names = sorted(stats["names"][r] for r in rows)
+    what = f"{_METRICS[metric][3]} {numeric[0]} {numeric[1]:g}" if numeric else ""
+    head = f"{len(names)} unit{'s' if len(names) != 1 else ''} ({scope}{', ' + what if what else ''}):"
+    more = f"\n...and {len(names) - 25} more." if len(names) > 25 else ""
+    return head + "\n" + "; ".join(names[:25]) + more
 
 
 # ===============================================
@@ -444,13 +1159,14 @@ def load_maddy_phrase() -> str:
         "Brewing clarity. If only this were soup.",
         "Climbing the metaphorical bookshelf. Again."
     ]
-    try:
-        arr = _load_json(_data_dir() / "MaddyPhrases.json")
-        if isinstance(arr, list) and arr:
-            return random.choice(arr)
-    except Exception:
-        pass
-    return random.choice(fallback)
+    cache = _cache()
+    if cache["phrases"] is None:
+        try:
+            arr = _load_json(_data_dir() / "MaddyPhrases.json")
+        except Exception:
+            arr = None
+        cache["phrases"] = arr if isinstance(arr, list) and arr else []
+    return random.choice(cache["phrases"] or fallback)
 
 def get_maddy_preline() -> str:
     return load_maddy_phrase()
@@ -473,17 +1189,15 @@ def _humanize_lang(text: str) -> str:
 # ===============================================
 
 async def _gpt_choose_units(question: str, candidates: List[str], max_units: int) -> List[str]:
-    import openai
     if not candidates:
         return []
     sys = _persona() + " From the candidate unit names, select up to N relevant to the user's question. Return only a JSON array."
     user = f"N={max_units}\nQuestion: {question}\nCandidates:\n- " + "\n- ".join(candidates)
-    resp = await openai.ChatCompletion.acreate(
-        model=GPT_MODEL,
-        messages=[{"role": "system", "content": sys}, {"role": "user", "content": user}],
-        temperature=0
+    resp = await complete(
+        [{"role": "system", "content": sys}, {"role": "user", "content": user}],
+        model=GPT_MODEL, temperature=0, site="maddy.choose",
     )
-    text = resp.choices[0].message.content.strip()
+    text = resp.text
     try:
         arr = json.loads(text)
         if isinstance(arr, list):
@@ -494,33 +1208,209 @@ async def _gpt_choose_units(question: str, candidates: List[str], max_units: int
         pass
     return candidates[:max_units]
 
-async def _gpt_answer(question: str, unit_objs: List[Dict[str, Any]], target_save: int) -> str:
-    import openai
-    units_aug = [_attach_derived(u, target_save) for u in unit_objs]
+async def _gpt_answer(
+    question: str, unit_objs: List[Dict[str, Any]], target_save: int, stream: Optional[MessageStream] = None
+) -> str:
+    payload, info = _build_unit_payload(question, unit_objs, target_save)
     is_combat = _is_combat_related(question)
 
-    if len(units_aug) == 1:
+    if len(unit_objs) == 1:
         sys = _persona()
         if is_combat:
             sys += f" Expected damage uses target save {target_save}+."
-        msg = f"Question: {question}\n\nUnit data:\n{json.dumps(units_aug[0], ensure_ascii=True)}"
+        msg = f"Question: {question}\n\nUnit data:\n{payload}"
     else:
         sys = _persona() + " Compare these units strictly by data."
         if is_combat:
             sys += f" Use target save {target_save}+ for comparisons."
-        msg = f"Question: {question}\n\nUnits:\n{json.dumps(units_aug, ensure_ascii=True)}"
+        msg = f"Question: {question}\n\nUnits:\n{payload}"
+    if "weapons" in info["parts"]:
+        sys += " Weapon rows follow weapon_columns."
 
-    r = await openai.ChatCompletion.acreate(
-        model=GPT_MODEL,
-        messages=[{"role": "system", "content": sys}, {"role": "user", "content": msg}],
-        temperature=0.1
+    r = await complete(
+        [{"role": "system", "content": sys}, {"role": "user", "content": msg}],
+        model=GPT_MODEL, temperature=0.1, stream=stream, site="maddy.answer",
     )
-    reply = _humanize_lang(r.choices[0].message.content.strip())
+    log.info(
+        "Maddy answer: %d unit(s), parts=%s detail=%d, payload %d chars (~%d tok), prompt_tokens=%s, "
+        "first token %s ms, %.0f ms",
+        len(unit_objs), "+".join(info["parts"]), info["detail"], info["chars"], info["tokens"],
+        r.usage.get("prompt_tokens"), "-" if r.first_token_ms is None else f"{r.first_token_ms:.0f}", r.total_ms,
+    )
+    reply = _humanize_lang(r.text)
     if is_combat and f"{target_save}+" not in reply:
         reply += f"\n\n(Assuming target save of {target_save}+.)"
     return reply
 
 
+# ===============================================
+# ---------------- HOT RELOAD -------------------
+# ===============================================
+
+_DATA_FILES = ("unit_faction_index.json", "blob.json", "alias.json", "MaddyPhrases.json")
+
+_WATCH = {
+    "stats": None,    # (name, size, mtime_ns) of each data file at the last check
+    "hashes": None,   # sha1 of each data file behind the live generation
+    "lock": None,
+}
+
+def _data_paths() -> List[Path]:
+    base = _data_dir()
+    return [base / name for name in _DATA_FILES] + [_rules_index_path()]
+
+def _data_stats() -> tuple:
+    out = []
+    for path in _data_paths():
+        try:
+            st = path.stat()
+            out.append((path.name, st.st_size, st.st_mtime_ns))
+        except OSError:
+            out.append((path.name, None, None))
+    return tuple(out)
+
+def _data_hashes() -> tuple:
+    out = []
+    for path in _data_paths():
+        h = hashlib.sha1()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            out.append(h.hexdigest())
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+def _build_generation() -> Dict[str, Any]:
+    """Load every data file and build every index into a fresh cache dict (no shared state)."""
+    cache = _new_cache()
+
+    def fill():
+        _PINNED.set(cache)
+        unit_names, rules = _load_index_and_rules()
+        _build_armies_map(rules)
+        aliases = _get_aliases()
+        _get_matcher(unit_names, aliases)
+        _get_unit_search(unit_names)
+        _get_retrieval(unit_names)
+        _get_stats()
+        load_maddy_phrase()
+
+    # fresh Context so the pin can't leak into the worker thread's later jobs
+    contextvars.Context().run(fill)
+    return cache
+
+def _release(gen: Dict[str, Any]):
+    """Once a replaced generation has no questions left on it, unmap its compiled index."""
+    if not gen["retired"] or gen["pins"]:
+        return
+    rules = gen["rules"]
+    for key in gen:
+        if key not in ("pins", "retired"):
+            gen[key] = None   # drop NumPy views onto the mapping before closing it
+    if isinstance(rules, RulesIndex):
+        try:
+            rules.close()
+        except BufferError:   # a view escaped somewhere; the mapping goes when it does
+            log.debug("Old rules index still referenced; leaving it to garbage collection")
+
+async def reload_if_changed() -> bool:
+    """
+    Rebuild Maddy's data in a worker thread if any data file changed, then swap
+    it in. Questions already running finish on the generation they started with.
+    """
+    global _CACHE
+    if _WATCH["lock"] is None:
+        _WATCH["lock"] = asyncio.Lock()
+    async with _WATCH["lock"]:
+        stats = _data_stats()
+        if stats == _WATCH["stats"]:
+            return False
+        loop = asyncio.get_running_loop()
+        hashes = await loop.run_in_executor(None, _data_hashes)
+        if hashes == _WATCH["hashes"]:
+            _WATCH["stats"] = stats
+            return False   # touched, not changed
+        # if this raises (e.g. a half-written blob.json) nothing is recorded,
+        # so the next check tries again even if the files don't change further
+        fresh = await loop.run_in_executor(None, _build_generation)
+        fresh["version"] = hashlib.sha1(repr(hashes).encode()).hexdigest()[:16]
+        first = _WATCH["hashes"] is None
+        _WATCH["stats"], _WATCH["hashes"] = stats, hashes
+        old, _CACHE = _CACHE, fresh
+        old["retired"] = True
+        _release(old)
+    if not first:
+        log.info("Maddy data reloaded (%d units)", len(fresh["unit_names"] or []))
+    return True
+
+async def watch_data(interval: float = RELOAD_SECONDS):
+    """Background task: warm the data off the event loop at startup, then poll for changes."""
+    while True:
+        try:
+            await reload_if_changed()
+        except Exception:
+            log.exception("Maddy data reload failed; keeping the current data")
+        await asyncio.sleep(interval)
+
+
+# ===============================================
+# ---------------- RESPONSE CACHE ---------------
+# ===============================================
+
+_ANSWERS = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, path=ANSWER_CACHE_PATH)
+_PERSIST: Dict[str, Any] = {"task": None, "lock": None}
+
+# words that don't change what is being asked
+_SIGNATURE_STOPWORDS = {
+    "a", "an", "the", "is", "are", "do", "does", "did", "of", "in", "on", "to", "into",
+    "vs", "versus", "or", "and", "what", "whats", "which", "who", "how", "me", "my",
+    "please", "pls", "maddy", "hey", "hi", "tell", "about", "unit", "units",
+}
+
+def _question_signature(question: str) -> str:
+    return " ".join(w for w in _normalize(question).split() if w not in _SIGNATURE_STOPWORDS)
+
+def _data_version() -> str:
+    """Version of the data behind the current generation (file hashes, or stats if never reloaded)."""
+    cache = _cache()
+    if cache["version"] is None:
+        cache["version"] = hashlib.sha1(repr(_data_stats()).encode()).hexdigest()[:16]
+    return cache["version"]
+
+def _answer_key(kind: str, *parts) -> str:
+    raw = json.dumps([kind, GPT_MODEL, _data_version(), *parts], ensure_ascii=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+async def _cached_llm(key: str, call):
+    """Return the cached reply for key, or await call() and remember what it returns."""
+    hit = _ANSWERS.get(key)
+    if hit is not None:
+        return hit
+    value = await call()
+    _ANSWERS.put(key, value)
+    if _ANSWERS.path is not None and _PERSIST["task"] is None:
+        _PERSIST["task"] = asyncio.get_running_loop().create_task(_persist_answers())
+    return value
+
+async def _persist_answers(delay: float = ANSWER_CACHE_PERSIST_DELAY):
+    """
+    Write the answer cache once for every burst of misses: wait, then snapshot
+    and write in a worker. Writes never overlap, and each snapshots the cache
+    only once the previous write is done, so the file only moves forward.
+    """
+    await asyncio.sleep(delay)
+    _PERSIST["task"] = None   # misses from here on schedule the next write
+    if _PERSIST["lock"] is None:
+        _PERSIST["lock"] = asyncio.Lock()
+    async with _PERSIST["lock"]:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, write_atomic, _ANSWERS.path, _ANSWERS.snapshot())
+        except OSError as e:
+            log.warning("Could not persist Maddy answer cache: %s", e)
+
+
 # ===============================================
 # ---------------- PUBLIC ENTRY -----------------
 # ===============================================
@@ -529,16 +1419,32 @@ async def maddy_answer(
     question: str,
     *,
     max_units: int = DEFAULT_MAX_UNITS,
-    use_gpt_select: bool = True
+    use_gpt_select: bool = True,
+    stream: Optional[MessageStream] = None,
 ) -> str:
     """
     Resolve unit(s) from the user's question (comparison-aware, exact > alias > partial),
     detect/assume a defender save (default 4+), and return Maddy's final answer.
     If a partial name is ambiguous (and no exact match exists), returns a short disambiguation string.
+    The whole answer runs against one data generation, even if a reload lands mid-question.
+    With a MessageStream, a GPT answer is rendered into it as it arrives; the caller still
+    finishes the stream with the returned text (which may never have touched GPT).
     """
+    gen = _cache()
+    token = _PINNED.set(gen)
+    gen["pins"] += 1
+    try:
+        return await _answer(question, max_units, use_gpt_select, stream)
+    finally:
+        _PINNED.reset(token)
+        gen["pins"] -= 1
+        _release(gen)
+
+async def _answer(question: str, max_units: int, use_gpt_select: bool, stream: Optional[MessageStream]) -> str:
     unit_names, rules = _load_index_and_rules()
     armies = _build_armies_map(rules)
     target_save = extract_target_save(question, 4)
+    signature = _question_signature(question)
 
     chosen: List[str] = []
 
@@ -547,39 +1453,40 @@ async def maddy_answer(
     if conj_units:
         chosen = conj_units
 
+    # Which units the question names (exact/alias/partial tokens); needed up front so a
+    # question about one unit isn't mistaken for a ranking over all of them
+    aliases = _get_aliases()
+    smart, err = _smart_detect_units(question, unit_names, aliases)
+
+    # Pure data questions (rankings, filters, stat comparisons) never need GPT
+    direct = _structured_answer(question, conj_units, bool(smart or err))
+    if direct:
+        return direct
+
     # 1) Explicit "list:" style block (e.g., "Which of the following units has the highest...:\nX\nY\nZ")
     if not chosen and ":" in question:
         after = question.split(":", 1)[1]
         explicit = [_normalize(x) for x in after.splitlines() if _normalize(x)]
         if explicit:
             for raw in explicit:
-                best = max(
-                    unit_names,
-                    key=lambda n: difflib.SequenceMatcher(a=_normalize(n), b=raw).ratio(),
-                    default=None
-                )
+                best = next(iter(_fuzzy_units(raw, unit_names, k=1)), None)
                 if best and best not in chosen:
                     chosen.append(best)
 
     # 2) Smart detection (exact/alias/partial tokens)
     if not chosen:
-        aliases = _get_aliases()
-        smart, err = _smart_detect_units(question, unit_names, aliases)
         if err:
             return err
         chosen = smart
 
-    # 3) Fallback to fuzzy or GPT pruning
+    # 3) Local retrieval; GPT only picks from its shortlist when retrieval isn't confident
     if not chosen:
-        if use_gpt_select:
-            scored = sorted(
-                unit_names,
-                key=lambda n: difflib.SequenceMatcher(a=_normalize(n), b=_normalize(question)).ratio(),
-                reverse=True
-            )[:max(TOP_K, max_units)]
-            chosen = await _gpt_choose_units(question, scored, max_units)
-        else:
-            chosen = unit_names[:max_units]
+        ranked = _retrieve_units(question, unit_names, k=max(TOP_K, max_units))
+        chosen, confident = _select_units(ranked, max_units)
+        if not confident and use_gpt_select:
+            scored = [n for n, _ in ranked]
+            key = _answer_key("choose", signature, scored, max_units)
+            chosen = await _cached_llm(key, lambda: _gpt_choose_units(question, scored, max_units))
 
     # De-dupe and cap
     chosen = list(dict.fromkeys(chosen))[:max_units]
@@ -594,5 +1501,7 @@ async def maddy_answer(
     if not unit_objs:
         return "I cannot determine any unit from that. Be more specific."
 
-    # Ask GPT to answer using the attached derived stats (and full unit payload)
-    return await _gpt_answer(question, unit_objs, target_save)
+    # Ask GPT to answer using the attached derived stats (and full unit payload);
+    # the same units + save + question on the same data is answered from cache
+    key = _answer_key("answer", sorted(u.get("name") or "" for u in unit_objs), target_save, signature)
+    return await _cached_llm(key, lambda: _gpt_answer(question, unit_objs, target_save, stream))
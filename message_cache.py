@@ -0,0 +1,143 @@
+"""
+message_cache.py
+================
+
+Cache-first resolution of the message a command is aimed at (the persona
+bots, !adjudicate), so the usual case costs no REST call.
+
+The bot feeds every message it sees on the gateway into RECENT (a small ring
+buffer per channel) from on_message, and drops deleted ones. Resolution then
+tries, in order:
+
+  reply target:      the reference Discord already resolved -> RECENT ->
+                     the client's message cache -> fetch_message (REST)
+  previous message:  RECENT -> the client's message cache -> history (REST)
+
+A buffered message older than the command means everything between the two
+was seen on the gateway too, so "newest buffered message before the command"
+is the previous message; only a channel with no earlier traffic since
+startup falls through to REST. That holds only within one gateway session: a
+resume replays missed events, but after a fresh IDENTIFY (on_ready) anything
+posted during the gap is gone, so the bot must clear() RECENT there. RECENT.sources counts where each lookup was
+answered, and hit_rate() is the share that never touched REST.
+"""
+
+import os
+from collections import Counter, OrderedDict, deque
+from typing import Optional
+
+import discord
+
+RECENT_PER_CHANNEL = int(os.getenv("RECENT_MESSAGES_PER_CHANNEL", "32"))
+RECENT_MAX_CHANNELS = int(os.getenv("RECENT_MESSAGES_MAX_CHANNELS", "512"))
+
+
+class RecentMessages:
+    def __init__(self, per_channel: int = RECENT_PER_CHANNEL, max_channels: int = RECENT_MAX_CHANNELS):
+        self.per_channel = per_channel
+        self.max_channels = max_channels
+        self.sources: Counter = Counter()   # reference / buffer / client / rest / none
+        self._channels: "OrderedDict[int, deque]" = OrderedDict()   # least recently active first
+
+    def remember(self, message: discord.Message):
+        cid = message.channel.id
+        buf = self._channels.get(cid)
+        if buf is None:
+            buf = self._channels[cid] = deque(maxlen=self.per_channel)
+            if len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(cid)
+        buf.append(message)
+
+    def forget(self, channel_id: int, message_id: int):
+        buf = self._channels.get(channel_id)
+        if buf:
+            for m in buf:
+                if m.id == message_id:
+                    buf.remove(m)
+                    return
+
+    def get(self, channel_id: int, message_id: int) -> Optional[discord.Message]:
+        for m in reversed(self._channels.get(channel_id) or ()):
+            if m.id == message_id:
+                return m
+        return None
+
+    def before(self, channel_id: int, message_id: int) -> Optional[discord.Message]:
+        """Newest buffered message in the channel older than message_id."""
+        for m in reversed(self._channels.get(channel_id) or ()):
+            if m.id < message_id:
+                return m
+        return None
+
+    def clear(self):
+        """Drop every buffered message (after a new gateway session; see module docstring)."""
+        self._channels.clear()
+
+    def hit_rate(self) -> float:
+        resolved = sum(n for src, n in self.sources.items() if src != "none")
+        return 1.0 - self.sources["rest"] / resolved if resolved else 0.0
+
+
+RECENT = RecentMessages()
+
+
+def _from_client(client, channel_id: int, before_id: int) -> Optional[discord.Message]:
+    for m in reversed(getattr(client, "cached_messages", None) or ()):
+        if m.channel.id == channel_id and m.id < before_id:
+            return m
+    return None
+
+
+async def referenced_message(ctx) -> Optional[discord.Message]:
+    """The message ctx's command replied to, or None if it isn't a reply (or is gone)."""
+    ref = getattr(ctx.message, "reference", None)
+    if not ref:
+        return None
+    if isinstance(getattr(ref, "resolved", None), discord.Message):
+        RECENT.sources["reference"] += 1
+        return ref.resolved
+    message_id = getattr(ref, "message_id", None)
+    if not message_id:
+        return None
+    hit = RECENT.get(ctx.channel.id, message_id)
+    if hit is not None:
+        RECENT.sources["buffer"] += 1
+        return hit
+    hit = getattr(ref, "cached_message", None)
+    if hit is not None:
+        RECENT.sources["client"] += 1
+        return hit
+    try:
+        msg = await ctx.channel.fetch_message(message_id)
+        RECENT.sources["rest"] += 1
+        return msg
+    except (discord.NotFound, discord.Forbidden, discord.HTTPException):
+        RECENT.sources["none"] += 1
+        return None
+
+
+async def target_message(ctx) -> Optional[discord.Message]:
+    """
+    Prefer the message this command replied to; otherwise use the one
+    immediately above in the same channel/thread.
+    """
+    if getattr(ctx.message, "reference", None):
+        msg = await referenced_message(ctx)
+        if msg is not None:
+            return msg   # else fall back to the previous message
+
+    cid, mid = ctx.channel.id, ctx.message.id
+    hit = RECENT.before(cid, mid)
+    if hit is not None:
+        RECENT.sources["buffer"] += 1
+        return hit
+    hit = _from_client(ctx.bot, cid, mid)
+    if hit is not None:
+        RECENT.sources["client"] += 1
+        return hit
+
+    msgs = [m async for m in ctx.channel.history(limit=1, before=ctx.message)]
+    RECENT.sources["rest" if msgs else "none"] += 1
+    return msgs[0] if msgs else None
@@ -0,0 +1,322 @@
+"""
+rules_index.py
+==============
+
+Compiled, memory-mapped form of Maddy's rules data (unit_faction_index.json +
+blob.json), so the first question after a restart doesn't pay for parsing the
+whole blob on the event loop and the process doesn't hold it as a dict tree.
+
+Build it offline whenever the JSON changes:
+
+    python rules_index.py                 # data/ -> data/rules.idx
+    python rules_index.py --data DIR --out PATH
+
+Layout (little-endian, version in the header):
+
+    header      magic, version, counts, section offsets, source file stats
+    strings     one UTF-8 buffer; every string is an (offset, length) ref
+    names       refs to the unit names from unit_faction_index.json
+    factions    refs to faction names
+    units       fixed-size records: normalized key, faction, JSON slice, weapon rows
+    alts        (normalized alternate name, unit) pairs
+    weapons     damage.Weapon columns as a NumPy structured array
+    blobs       each unit's JSON, decoded only when that unit is asked for
+
+At runtime RulesIndex mmaps the file: the weapon columns are NumPy views
+straight onto the mapping (the damage matrix is built without touching any
+JSON) and a unit's record is json-decoded the first time it is looked up.
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import logging
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from damage import Weapon, WeaponTable
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"MADDYIDX"
+VERSION = 1
+SOURCES = ("unit_faction_index.json", "blob.json")
+
+# magic, version, n_names, n_factions, n_units, n_alts, n_weapons,
+# offsets of strings/names/factions/units/alts/weapons/blobs, end,
+# then (size, mtime_ns) for each source file
+_HEADER = struct.Struct("<8sI5I8Q" + "qq" * len(SOURCES))
+
+_REF = np.dtype([("off", "<u4"), ("len", "<u4")])
+_UNIT = np.dtype([
+    ("key_off", "<u4"), ("key_len", "<u4"),
+    ("faction", "<u4"),
+    ("blob_off", "<u8"), ("blob_len", "<u4"),
+    ("w_start", "<u4"), ("w_count", "<u4"),
+])
+_ALT = np.dtype([("key_off", "<u4"), ("key_len", "<u4"), ("unit", "<u4")])
+_WEAPON = np.dtype([
+    ("attacks", "<f8"), ("damage", "<f8"), ("p_hit", "<f8"), ("p_wound", "<f8"),
+    ("p_crit", "<f8"), ("scale", "<f8"), ("save_mod", "<i8"), ("owner", "<i8"),
+    ("crit_mortal", "?"), ("crit_auto", "?"), ("crit_two_hits", "?"), ("_pad", "V5"),
+])
+
+
+def _source_stats(data_dir: Path) -> List[int]:
+    out: List[int] = []
+    for name in SOURCES:
+        try:
+            st = (data_dir / name).stat()
+            out += [st.st_size, st.st_mtime_ns]
+        except OSError:
+            out += [-1, -1]
+    return out
+
+
+# ----------------------------------------------------------------------------
+# Runtime
+# ----------------------------------------------------------------------------
+class _LazyUnits(Mapping):
+    """normalized name -> (faction, unit dict), decoding each unit on first access."""
+
+    def __init__(self, index: "RulesIndex", rows: Dict[str, int]):
+        self._index = index
+        self._rows = rows
+
+    def __getitem__(self, key: str) -> Tuple[str, Dict[str, Any]]:
+        return self._index.unit(self._rows[key])
+
+    def __contains__(self, key) -> bool:
+        return key in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class RulesIndex:
+    """Read-only view of a compiled rules index; see the module docstring for the layout."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._units: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        self._unit_index: Optional[Dict[str, _LazyUnits]] = None
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse_header(self):
+        if len(self._mm) < _HEADER.size:
+            raise ValueError(f"{self.path}: truncated rules index")
+        h = _HEADER.unpack_from(self._mm, 0)
+        magic, version = h[0], h[1]
+        if magic != MAGIC:
+            raise ValueError(f"{self.path}: not a rules index")
+        if version != VERSION:
+            raise ValueError(f"{self.path}: index version {version}, expected {VERSION}")
+        n_names, n_factions, n_units, n_alts, n_weapons = h[2:7]
+        (self._strings_at, names_at, factions_at, units_at,
+         alts_at, weapons_at, self._blobs_at, end) = h[7:15]
+        if end != len(self._mm):
+            raise ValueError(f"{self.path}: size mismatch (rebuild the index)")
+        self.source_stats = list(h[15:])
+
+        buf = self._mm
+        self._names = np.frombuffer(buf, _REF, n_names, names_at)
+        self._factions = np.frombuffer(buf, _REF, n_factions, factions_at)
+        self._records = np.frombuffer(buf, _UNIT, n_units, units_at)
+        self._alts = np.frombuffer(buf, _ALT, n_alts, alts_at)
+        self._weapons = np.frombuffer(buf, _WEAPON, n_weapons, weapons_at)
+
+    def close(self):
+        # the NumPy views hold exports of the mapping; drop them before unmapping
+        for name in ("_names", "_factions", "_records", "_alts", "_weapons"):
+            self.__dict__.pop(name, None)
+        self._units.clear()
+        self._unit_index = None
+        self._mm.close()
+
+    def is_stale(self, data_dir: Path) -> bool:
+        """True if a source JSON that exists in data_dir differs from the one this was built from."""
+        current = _source_stats(Path(data_dir))
+        for i in range(0, len(current), 2):
+            if current[i] >= 0 and current[i:i + 2] != self.source_stats[i:i + 2]:
+                return True
+        return False
+
+    def _str(self, off: int, length: int) -> str:
+        start = self._strings_at + int(off)
+        return self._mm[start:start + int(length)].decode("utf-8")
+
+    # ---- tables ----
+    def unit_names(self) -> List[str]:
+        return [self._str(o, n) for o, n in self._names]
+
+    def factions(self) -> List[str]:
+        """Faction name of every unit record, in record order."""
+        names = [self._str(o, n) for o, n in self._factions]
+        return [names[f] for f in self._records["faction"]]
+
+    def keys(self) -> List[str]:
+        """Normalized name of every unit record, in record order."""
+        return [self._str(o, n) for o, n in zip(self._records["key_off"], self._records["key_len"])]
+
+    def weapon_table(self) -> WeaponTable:
+        """Every weapon row as damage.WeaponTable columns (views onto the mapping)."""
+        return WeaponTable(*(self._weapons[name] for name in Weapon._fields))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    # ---- units ----
+    def unit(self, row: int) -> Tuple[str, Dict[str, Any]]:
+        """(faction, unit dict) for a record, decoded once and then reused."""
+        hit = self._units.get(row)
+        if hit is None:
+            rec = self._records[row]
+            start = self._blobs_at + int(rec["blob_off"])
+            o, n = self._factions[rec["faction"]]
+            u = json.loads(self._mm[start:start + int(rec["blob_len"])])
+            hit = self._units[row] = (self._str(o, n), u)
+        return hit
+
+    def iter_units(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """(key, faction, unit dict) for every record, decoded without keeping them (for bulk scans)."""
+        factions = [self._str(o, n) for o, n in self._factions]
+        for key, rec in zip(self.keys(), self._records):
+            start = self._blobs_at + int(rec["blob_off"])
+            yield key, factions[rec["faction"]], json.loads(self._mm[start:start + int(rec["blob_len"])])
+
+    def unit_index(self) -> Dict[str, _LazyUnits]:
+        """Same shape as maddybot's {"by_name", "by_alt"} index, decoding units lazily."""
+        if self._unit_index is None:
+            by_name = {k: i for i, k in enumerate(self.keys())}
+            by_alt = {self._str(o, n): int(u) for o, n, u in self._alts}
+            self._unit_index = {"by_name": _LazyUnits(self, by_name), "by_alt": _LazyUnits(self, by_alt)}
+        return self._unit_index
+
+
+def open_index(path: Path, data_dir: Path) -> Optional[RulesIndex]:
+    """Open `path` if it exists, is readable and matches the JSON in data_dir; else None."""
+    if not path.exists():
+        return None
+    try:
+        idx = RulesIndex(path)
+    except (OSError, ValueError) as e:
+        log.warning("Ignoring rules index %s: %s", path, e)
+        return None
+    if idx.is_stale(data_dir):
+        log.warning("Rules index %s is older than the JSON in %s; run rules_index.py to rebuild",
+                    path, data_dir)
+        idx.close()
+        return None
+    return idx
+
+
+# ----------------------------------------------------------------------------
+# Build
+# ----------------------------------------------------------------------------
+class _Strings:
+    def __init__(self):
+        self.buf = bytearray()
+        self._seen: Dict[str, Tuple[int, int]] = {}
+
+    def ref(self, s: str) -> Tuple[int, int]:
+        hit = self._seen.get(s)
+        if hit is None:
+            b = s.encode("utf-8")
+            hit = self._seen[s] = (len(self.buf), len(b))
+            self.buf += b
+        return hit
+
+
+def _section(arr: np.ndarray) -> bytes:
+    return arr.tobytes()
+
+
+def build_index(data_dir: Path, out: Path) -> Dict[str, int]:
+    """Compile data_dir's JSON into `out`, parsing units exactly the way maddybot does."""
+    import maddybot as m   # build-time only; maddybot imports this module at runtime
+
+    data_dir = Path(data_dir)
+    idx = m._load_json(data_dir / "unit_faction_index.json")
+    names = sorted(set([u["unit"] for u in idx.get("units", []) if "unit" in u]))
+    rules = m._load_json(data_dir / "blob.json")
+    armies = m._armies_from_rules(rules)
+    unit_index = m._build_unit_index(armies)
+
+    strings = _Strings()
+    blobs = bytearray()
+    faction_ids: Dict[str, int] = {}
+    row_of: Dict[int, int] = {}
+    records, weapons = [], []
+    for row, (key, (fac, u)) in enumerate(unit_index["by_name"].items()):
+        row_of[id(u)] = row
+        blob = json.dumps(u, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        compiled = m._UnitProfile(u).weapons
+        records.append(strings.ref(key) + (faction_ids.setdefault(fac, len(faction_ids)),
+                                           len(blobs), len(blob), len(weapons), len(compiled)))
+        blobs += blob
+        weapons.extend(w._replace(owner=row) for w in compiled)
+
+    alts = [strings.ref(k) + (row_of[id(u)],) for k, (_fac, u) in unit_index["by_alt"].items()
+            if id(u) in row_of]
+
+    w_arr = np.zeros(len(weapons), _WEAPON)
+    for name in Weapon._fields:
+        w_arr[name] = [getattr(w, name) for w in weapons]
+    sections = [
+        np.array([strings.ref(n) for n in names], _REF),
+        np.array([strings.ref(f) for f in faction_ids], _REF),
+        np.array(records, _UNIT),
+        np.array(alts, _ALT),
+        w_arr,
+    ]
+    body = [bytes(strings.buf)] + [_section(a) for a in sections] + [bytes(blobs)]
+
+    offsets, pos = [], _HEADER.size
+    for chunk in body:
+        pad = -pos % 8
+        offsets.append(pos + pad)
+        pos += pad + len(chunk)
+    header = _HEADER.pack(MAGIC, VERSION, len(names), len(faction_ids), len(records), len(alts),
+                          len(weapons), *offsets, pos, *_source_stats(data_dir))
+
+    tmp = Path(str(out) + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(header)
+        for at, chunk in zip(offsets, body):
+            f.write(b"\0" * (at - f.tell()))
+            f.write(chunk)
+    os.replace(tmp, out)
+    return {"names": len(names), "units": len(records), "weapons": len(weapons), "bytes": pos}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Compile Maddy's rules JSON into a binary index.")
+    ap.add_argument("--data", type=Path, default=None, help="data directory (default: MADDY_DATA_DIR or ./data)")
+    ap.add_argument("--out", type=Path, default=None, help="output file (default: <data>/rules.idx)")
+    args = ap.parse_args(argv)
+
+    import maddybot as m
+    data_dir = args.data or m._data_dir()
+    out = args.out or (data_dir / "rules.idx")
+    stats = build_index(data_dir, out)
+    print(f"wrote {out}: {stats['units']} units, {stats['weapons']} weapons, "
+          f"{stats['names']} names, {stats['bytes'] / 1024:.0f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
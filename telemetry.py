@@ -0,0 +1,257 @@
+"""
+telemetry.py
+============
+
+Per-call accounting for every LLM completion, so spend and latency can be
+traced back to the command (and guild) that caused them.
+
+llm.complete() calls record() once per completion, successful or not, with
+the tokens, wall time, time to first token, model, retries and the call
+site ("maddy.answer", "persona.noog", "sentiment.classify", ...). The
+originating command and guild come from a ContextVar that the bot tags
+before each command runs:
+
+    @bot.before_invoke
+    async def _tag(ctx):
+        telemetry.tag(command=ctx.command.qualified_name, guild=getattr(ctx.guild, "id", None))
+
+Calls are aggregated per (command, site, model) into counters and fixed-bucket
+histograms (latency, first token, tokens per call), which are small enough to
+keep forever. Streams report no usage, so their tokens are estimated from
+characters (~4 per token) and counted as estimated.
+
+    report()          -> text table for the !llmstats admin command
+    prometheus()      -> Prometheus text exposition
+    await serve(port) -> local http://127.0.0.1:<port>/metrics
+"""
+
+import os
+import json
+import bisect
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("LLM_METRICS_PORT", "0"))   # 0 = no endpoint
+CHARS_PER_TOKEN = 4
+
+# USD per 1M (prompt, completion) tokens; override with LLM_PRICES='{"model": [in, out]}'
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+PRICES.update({k: tuple(v) for k, v in json.loads(os.getenv("LLM_PRICES", "{}")).items()})
+
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+
+_ORIGIN: ContextVar[Dict[str, Optional[str]]] = ContextVar("llm_origin", default={})
+
+
+def tag(command: Optional[str] = None, guild=None):
+    """Attribute LLM calls made from here on (in this task and its children)."""
+    _ORIGIN.set({"command": command, "guild": None if guild is None else str(guild)})
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+class Histogram:
+    """Fixed upper-bound buckets (plus +Inf), Prometheus style."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the q-th value: linear within its bucket, which is first
+        narrowed to the observed min/max (so calls of 4-5s don't read as 8s)."""
+        if not self.count:
+            return 0.0
+        rank, seen, lower = q * self.count, 0, 0.0
+        for bound, n in zip(self.bounds + (float("inf"),), self.counts):
+            if n and seen + n >= rank:
+                lo, hi = max(lower, self.min), min(bound, self.max)
+                return lo + (hi - lo) * max(0.0, rank - seen) / n
+            seen += n
+            lower = bound
+        return self.max
+
+
+class _Series:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.estimated = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.latency = Histogram(LATENCY_BUCKETS_MS)
+        self.first_token = Histogram(LATENCY_BUCKETS_MS)
+        self.tokens = Histogram(TOKEN_BUCKETS)
+
+
+class _Key(NamedTuple):
+    command: str
+    site: str
+    model: str
+
+
+_SERIES: Dict[_Key, _Series] = {}
+_GUILD_COST: Dict[str, float] = {}
+
+
+def cost_usd(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    p_in, p_out = PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * p_in + completion_tokens * p_out) / 1_000_000
+
+
+def record(
+    *,
+    site: str,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    total_ms: float,
+    first_token_ms: Optional[float] = None,
+    retries: int = 0,
+    ok: bool = True,
+    estimated: bool = False,
+):
+    origin = _ORIGIN.get()
+    key = _Key(origin.get("command") or "-", site, model)
+    s = _SERIES.get(key)
+    if s is None:
+        s = _SERIES[key] = _Series()
+    cost = cost_usd(model, prompt_tokens, completion_tokens)
+    s.calls += 1
+    s.errors += not ok
+    s.retries += retries
+    s.estimated += estimated
+    s.prompt_tokens += prompt_tokens
+    s.completion_tokens += completion_tokens
+    s.cost += cost
+    s.latency.observe(total_ms)
+    if first_token_ms is not None:
+        s.first_token.observe(first_token_ms)
+    s.tokens.observe(prompt_tokens + completion_tokens)
+    guild = origin.get("guild") or "-"
+    _GUILD_COST[guild] = _GUILD_COST.get(guild, 0.0) + cost
+    log.debug("LLM %s/%s %s: %d+%d tok, %.0f ms, %d retries, ok=%s",
+              key.command, site, model, prompt_tokens, completion_tokens, total_ms, retries, ok)
+
+
+def reset():
+    _SERIES.clear()
+    _GUILD_COST.clear()
+
+
+# ----------------------------------------------------------------------------
+# exposure
+# ----------------------------------------------------------------------------
+def _fmt_ms(v: float) -> str:
+    if v >= 10000:
+        return f"{v / 1000:.0f}s"
+    return f"{v / 1000:.1f}s" if v >= 1000 else f"{v:.0f}ms"
+
+
+def report(limit: int = 12) -> List[str]:
+    """Per command/site lines, most expensive first."""
+    if not _SERIES:
+        return ["No LLM calls recorded yet."]
+    total_cost = sum(s.cost for s in _SERIES.values())
+    total_calls = sum(s.calls for s in _SERIES.values())
+    lines = [f"{total_calls} calls, ${total_cost:.4f} since start",
+             f"{'command':<12} {'site':<20} {'calls':>5} {'err':>3} {'retry':>5} "
+             f"{'tok in/out':>13} {'p50':>6} {'p95':>6} {'cost $':>8}"]
+    ranked = sorted(_SERIES.items(), key=lambda kv: -kv[1].cost)
+    for key, s in ranked[:limit]:
+        tokens = f"{s.prompt_tokens}/{s.completion_tokens}{'~' if s.estimated else ''}"
+        lines.append(
+            f"{key.command[:12]:<12} {key.site[:20]:<20} {s.calls:>5} {s.errors:>3} {s.retries:>5} "
+            f"{tokens:>13} {_fmt_ms(s.latency.quantile(0.5)):>6} {_fmt_ms(s.latency.quantile(0.95)):>6} "
+            f"{s.cost:>8.4f}"
+        )
+    if len(ranked) > limit:
+        lines.append(f"... {len(ranked) - limit} more")
+    top = sorted(_GUILD_COST.items(), key=lambda kv: -kv[1])[:3]
+    lines.append("top guilds: " + ", ".join(f"{g} ${c:.4f}" for g, c in top))
+    lines.append("~ = includes estimated tokens (streamed replies)")
+    return lines
+
+
+def _labels(**kw) -> str:
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in kw.items()) + "}"
+
+
+def _histogram_lines(name: str, h: Histogram, labels: dict) -> List[str]:
+    out, seen = [], 0
+    for bound, n in zip(h.bounds + ("+Inf",), h.counts):
+        seen += n
+        out.append(f"{name}_bucket{_labels(**labels, le=bound)} {seen}")
+    out.append(f"{name}_sum{_labels(**labels)} {h.sum:g}")
+    out.append(f"{name}_count{_labels(**labels)} {h.count}")
+    return out
+
+
+def prometheus(gauges: Optional[Callable[[], Dict[str, float]]] = None) -> str:
+    lines = [
+        "# TYPE llm_calls_total counter", "# TYPE llm_errors_total counter",
+        "# TYPE llm_retries_total counter", "# TYPE llm_tokens_total counter",
+        "# TYPE llm_cost_usd_total counter", "# TYPE llm_latency_ms histogram",
+        "# TYPE llm_first_token_ms histogram", "# TYPE llm_call_tokens histogram",
+    ]
+    for key, s in sorted(_SERIES.items()):
+        labels = key._asdict()
+        lines.append(f"llm_calls_total{_labels(**labels)} {s.calls}")
+        lines.append(f"llm_errors_total{_labels(**labels)} {s.errors}")
+        lines.append(f"llm_retries_total{_labels(**labels)} {s.retries}")
+        lines.append(f"llm_tokens_total{_labels(**labels, kind='prompt')} {s.prompt_tokens}")
+        lines.append(f"llm_tokens_total{_labels(**labels, kind='completion')} {s.completion_tokens}")
+        lines.append(f"llm_cost_usd_total{_labels(**labels)} {s.cost:.6f}")
+        lines += _histogram_lines("llm_latency_ms", s.latency, labels)
+        lines += _histogram_lines("llm_first_token_ms", s.first_token, labels)
+        lines += _histogram_lines("llm_call_tokens", s.tokens, labels)
+    for guild, cost in sorted(_GUILD_COST.items()):
+        lines.append(f"llm_guild_cost_usd_total{_labels(guild=guild)} {cost:.6f}")
+    for name, value in (gauges() if gauges else {}).items():
+        lines.append(f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+async def serve(port: int = METRICS_PORT, host: str = "127.0.0.1",
+                gauges: Optional[Callable[[], Dict[str, float]]] = None):
+    """Serve /metrics until cancelled (no-op when port is 0)."""
+    if not port:
+        return
+    from aiohttp import web
+
+    async def metrics(request):
+        return web.Response(text=prometheus(gauges), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("LLM metrics on http://%s:%d/metrics", host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
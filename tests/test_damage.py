@@ -0,0 +1,165 @@
+"""
+damage.py against straightforward scalar versions of the same maths (the
+per-weapon loops the vectorized engine replaced), over a fixed set of weapon
+profiles covering the crit rules, rend off either end of the save range and
+D3/D6 damage.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+import damage
+from damage import SAVES, Weapon, WeaponTable
+
+EXACT = 1e-12
+
+
+def _p_plus(target):
+    return max(0.0, min((7 - target) / 6.0, 1.0))
+
+
+def _scalar_expected(w: Weapon, save: int) -> float:
+    """One weapon into one save, the long way round."""
+    eff = save + w.save_mod
+    p_save = 5 / 6 if eff < 2 else (7 - eff) / 6.0 if eff <= 6 else 0.0
+    p_unsaved = 1 - p_save
+    p_noncrit = max(0.0, w.p_hit - w.p_crit)
+    per_attack = w.attacks * w.damage * w.scale
+    e = per_attack * p_noncrit * w.p_wound * p_unsaved
+    if w.crit_mortal:
+        e += per_attack * w.p_crit
+    elif w.crit_auto:
+        e += per_attack * w.p_crit * p_unsaved
+    else:
+        e += per_attack * w.p_crit * w.p_wound * p_unsaved
+    if w.crit_two_hits:
+        e += per_attack * w.p_crit * w.p_wound * p_unsaved
+    return e
+
+
+def _scalar_stathammer(num_attacks, to_hit, to_wound, rend, save, dmg,
+                       crit_mortal=False, crit_auto_wound=False, crit_extra=False, crit_threshold=6):
+    """The !stathammer formula as it was before damage.py."""
+    p_hit = _p_plus(to_hit)
+    p_crit = _p_plus(max(to_hit, crit_threshold))
+    p_noncrit = max(0.0, p_hit - p_crit)
+    p_wound = _p_plus(to_wound)
+    eff_save = save + rend
+    p_save = 5 / 6 if eff_save < 2 else (7 - eff_save) / 6.0 if eff_save <= 6 else 0.0
+    exp_dmg = {"d3": 2.0, "d6": 3.5}[dmg] if isinstance(dmg, str) else float(dmg)
+    e = num_attacks * p_noncrit * p_wound * (1 - p_save) * exp_dmg
+    if crit_mortal:
+        e += num_attacks * p_crit * exp_dmg
+    elif crit_auto_wound:
+        e += num_attacks * p_crit * (1 - p_save) * exp_dmg
+    else:
+        e += num_attacks * p_crit * p_wound * (1 - p_save) * exp_dmg
+    if crit_extra:
+        e += num_attacks * p_crit * p_wound * (1 - p_save) * exp_dmg
+    return e
+
+
+CRITS = [  # (crit_mortal, crit_auto, crit_two_hits)
+    (False, False, False),
+    (True, False, False),
+    (False, True, False),
+    (False, False, True),
+    (True, False, True),       # both flags set: mortal wins for the crit itself
+]
+
+WEAPONS = [
+    Weapon(attacks=a, damage=d, p_hit=_p_plus(hit), p_wound=_p_plus(wound),
+           p_crit=_p_plus(max(hit, 6)), save_mod=rend, crit_mortal=cm, crit_auto=ca,
+           crit_two_hits=c2, scale=scale)
+    for (a, d, hit, wound, rend, scale), (cm, ca, c2) in itertools.product(
+        [
+            (1, 1.0, 4, 4, 0, 1.0),
+            (3, 2.0, 3, 3, 1, 1.0),
+            (2, 3.5, 2, 2, 3, 5.0),     # D6 damage, rend pushes 4+ and worse off the table
+            (4.5, 2.0, 4, 3, 2, 10.0),  # 2D3+... attacks, D3 damage
+            (2, 1.0, 5, 5, -1, 1.0),    # negative rend: 2+ clamps to the 6-in-6 cap (5/6)
+            (6, 1.0, 6, 6, 0, 20.0),    # hit on 6 only: every hit is a crit
+            (1, 1.0, 7, 4, 0, 1.0),     # can't hit at all
+        ],
+        CRITS,
+    )
+]
+
+
+def test_damage_matrix_matches_scalar_per_weapon_and_save():
+    matrix = damage.damage_matrix(WeaponTable.from_weapons(WEAPONS))
+    assert matrix.shape == (len(WEAPONS), len(SAVES))
+    for i, w in enumerate(WEAPONS):
+        for j, save in enumerate(SAVES):
+            assert matrix[i, j] == pytest.approx(_scalar_expected(w, int(save)), abs=EXACT), (w, save)
+
+
+def test_unit_matrix_sums_each_units_weapons():
+    owned = [w._replace(owner=i % 4) for i, w in enumerate(WEAPONS)]
+    matrix = damage.unit_matrix(WeaponTable.from_weapons(owned), 5)
+    for unit in range(5):
+        for j, save in enumerate(SAVES):
+            want = sum(_scalar_expected(w, int(save)) for w in owned if w.owner == unit)
+            assert matrix[unit, j] == pytest.approx(want, abs=1e-9)
+    assert not matrix[4].any()          # a unit with no weapons
+
+
+def test_unit_matrix_of_no_weapons_is_zero():
+    assert not damage.unit_matrix(WeaponTable.from_weapons([]), 3).any()
+
+
+def test_save_failure_edges():
+    fail = damage.save_failure(np.array([-3, 0, 5]))
+    assert fail[0] == pytest.approx([1 / 6] * 4 + [2 / 6])                # never better than 2+
+    assert fail[1] == pytest.approx([1 / 6, 2 / 6, 3 / 6, 4 / 6, 5 / 6])
+    assert fail[2] == pytest.approx([1] * 5)                              # rend 5: 2+ becomes 7+, no save
+
+
+@pytest.mark.parametrize("to_hit,to_wound,rend,dmg,crit,threshold", list(itertools.product(
+    [2, 3, 4, 6], [2, 4, 5], [0, 1, 3], [1, 2, "d3", "d6"],
+    [(False, False, False), (True, False, False), (False, True, False), (False, False, True)],
+    [5, 6],
+)))
+def test_stathammer_table_matches_scalar(to_hit, to_wound, rend, dmg, crit, threshold):
+    cm, ca, c2 = crit
+    w = damage.stathammer_weapon(10, to_hit, to_wound, rend, dmg, cm, ca, c2, threshold)
+    for save, value in damage.stathammer_table(w):
+        want = _scalar_stathammer(10, to_hit, to_wound, rend, save, dmg, cm, ca, c2, threshold)
+        assert value == pytest.approx(want, abs=EXACT), save
+
+
+def test_stathammer_damage_dice():
+    assert damage.stathammer_weapon(1, 4, 4, 0, "D3").damage == 2.0
+    assert damage.stathammer_weapon(1, 4, 4, 0, "d6").damage == 3.5
+    with pytest.raises(ValueError):
+        damage.stathammer_weapon(1, 4, 4, 0, "2d6")
+
+
+def test_top_units_orders_by_save_column_and_respects_rows():
+    matrix = np.array([[1.0, 5.0], [3.0, 2.0], [2.0, 4.0]])
+    saves = np.array([3, 4])
+    assert damage.save_column(9, saves) == 1 and damage.save_column(1, saves) == 0
+    assert [r for r, _ in damage.top_units(matrix, 2, n=3)] == [1, 2, 0]
+    assert damage.top_units(matrix, 2, n=1, rows=[0, 2]) == [(2, 2.0)]
+    assert damage.top_units(matrix, 2, rows=[]) == []
+
+
+def test_maddy_unit_damage_parses_dice_and_crit_abilities():
+    import maddybot
+    unit = {"name": "Test Unit", "models": [{"max": 5, "weapons": [
+        {"attack": "2D3", "hit": "3+", "wound": "4+", "rend": "-1", "damage": "D3+1",
+         "abilities": ["Crit (Mortal)"]},
+        {"attack": "D6", "hit": "4+", "wound": "3+", "rend": "-", "damage": "D6",
+         "abilities": ["Crit (2 Hits)"]},
+    ]}]}
+    by_hand = [
+        Weapon(attacks=4.0, damage=3.0, p_hit=4 / 6, p_wound=3 / 6, p_crit=1 / 6, save_mod=1,
+               crit_mortal=True, scale=5),
+        Weapon(attacks=3.5, damage=3.5, p_hit=3 / 6, p_wound=4 / 6, p_crit=1 / 6, save_mod=0,
+               crit_two_hits=True, scale=5),
+    ]
+    for save in SAVES:
+        want = sum(_scalar_expected(w, int(save)) for w in by_hand)
+        assert maddybot._expected_damage_vs_save(unit, int(save)) == pytest.approx(want, abs=0.005)
@@ -0,0 +1,224 @@
+"""
+Watermark / back-fill behaviour of aos_sentiment._analyze_channel, against an
+in-memory stand-in for the asyncpg pool and a fake channel history, with the
+local LLM backend doing the classifying.
+"""
+
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import aos_sentiment
+import llm
+from llm_local import LocalProvider
+
+NOW = datetime.now(timezone.utc)
+
+
+# ----------------------------------------------------------------------------
+# fakes
+# ----------------------------------------------------------------------------
+class _Conn:
+    """Just the statements aos_sentiment issues, matched on their table names."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def transaction(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def fetchrow(self, query, channel_id):
+        return self.db["watermark"].get(channel_id)
+
+    async def executemany(self, query, rows):
+        if "sentiment_message" in query:
+            for row in rows:
+                self.db["messages"].setdefault(row[0], row)
+        else:
+            for row in rows:
+                self.db["themes"].setdefault(row[:2], row)
+
+    async def execute(self, query, *args):
+        if "sentiment_watermark" not in query:
+            return
+        channel_id, _faction, low, high = args
+        old = self.db["watermark"].get(channel_id)
+        if old is not None and low <= old["high_id"] + 1:
+            low, high = min(old["low_id"], low), max(old["high_id"], high)
+        elif old is not None:
+            high = max(old["high_id"], high)
+        self.db["watermark"][channel_id] = {"low_id": low, "high_id": high}
+
+    async def fetch(self, query, channel_id, since):
+        if "sentiment_message" in query:
+            counts = Counter(r[4] for r in self.db["messages"].values() if r[1] == channel_id and r[3] >= since)
+            return [{"label": k, "n": v} for k, v in counts.items()]
+        return [{"themes": r[3]} for r in self.db["themes"].values() if r[0] == channel_id and r[2] >= since]
+
+
+class _Pool:
+    def __init__(self):
+        self.db = {"watermark": {}, "messages": {}, "themes": {}}
+
+    def acquire(self):
+        return _Conn(self.db)
+
+
+class _Channel:
+    def __init__(self, channel_id=1):
+        self.id = channel_id
+        self.messages = []
+        self.fetched = 0
+
+    def post(self, ago: timedelta, bot=False):
+        at = NOW - ago
+        self.messages.append(SimpleNamespace(
+            id=discord.utils.time_snowflake(at) + len(self.messages), created_at=at,
+            content=f"message {len(self.messages)}", author=SimpleNamespace(bot=bot)))
+
+    async def history(self, after=None, before=None, limit=None, oldest_first=True):
+        found = [m for m in self.messages
+                 if (after is None or m.id > after.id) and (before is None or m.id < before.id)]
+        for m in sorted(found, key=lambda m: m.id, reverse=not oldest_first):
+            self.fetched += 1
+            yield m
+
+
+@pytest.fixture(autouse=True)
+def _local_backend(monkeypatch):
+    old = llm.set_provider(LocalProvider(latency=0, failure_rate=0, chunk_delay=0))
+    # each test runs its own event loop: start from fresh locks and budgets
+    monkeypatch.setitem(llm._STATE, "semaphores", {})
+    monkeypatch.setattr(aos_sentiment, "_BUDGET", aos_sentiment._BatchBudget())
+    monkeypatch.setattr(aos_sentiment, "_CHANNEL_LOCKS", {})
+    monkeypatch.setattr(aos_sentiment, "MAX_MESSAGES_PER_CHANNEL", 50)
+
+    async def summarise(*_):
+        return ""
+    monkeypatch.setattr(aos_sentiment, "_summarise", summarise)
+    yield
+    llm.set_provider(old)
+
+
+def _run(pool, channel, hours):
+    return asyncio.run(aos_sentiment._analyze_channel(pool, "Faction", channel, hours))
+
+
+def _since_id(hours):
+    return discord.utils.time_snowflake(NOW - timedelta(hours=hours))
+
+
+# ----------------------------------------------------------------------------
+# tests
+# ----------------------------------------------------------------------------
+def test_fresh_window_classifies_everything_and_marks_the_span():
+    pool, channel = _Pool(), _Channel()
+    for i in range(30):
+        channel.post(timedelta(hours=10, minutes=-i))
+    channel.post(timedelta(hours=1), bot=True)     # skipped, but still covered by the span
+
+    r = _run(pool, channel, 24)
+
+    assert r["volume"] == 30
+    mark = pool.db["watermark"][channel.id]
+    assert mark["low_id"] <= min(m.id for m in channel.messages)
+    assert mark["high_id"] == max(m.id for m in channel.messages)
+
+
+def test_forward_continuation_only_reads_new_messages():
+    pool, channel = _Pool(), _Channel()
+    for i in range(20):
+        channel.post(timedelta(hours=5, minutes=-i))
+    _run(pool, channel, 24)
+
+    for i in range(5):
+        channel.post(timedelta(minutes=10 - i))
+    channel.fetched = 0
+    r = _run(pool, channel, 24)
+
+    assert channel.fetched == 5
+    assert r["volume"] == 25
+    assert pool.db["watermark"][channel.id]["high_id"] == channel.messages[-1].id
+
+
+def test_backfill_stops_at_the_cap_and_resumes_contiguously():
+    pool, channel = _Pool(), _Channel()
+    for i in range(80):
+        channel.post(timedelta(hours=30, minutes=-i))      # 30h..28.7h ago
+    for i in range(10):
+        channel.post(timedelta(hours=2, minutes=-i))
+
+    assert _run(pool, channel, 24)["volume"] == 10           # recent messages only
+    r = _run(pool, channel, 48)                              # back-fill capped at 50
+    assert r["volume"] == 60
+    mark = pool.db["watermark"][channel.id]
+    assert mark["low_id"] > _since_id(48) + 1                # not down to the window start yet
+    stored = {m for m in pool.db["messages"]}
+    old = sorted(m.id for m in channel.messages[:80])
+    assert stored >= set(old[-50:]) and not stored & set(old[:-50])   # newest end, no gap
+
+    r = _run(pool, channel, 48)                              # finishes the back-fill
+    assert r["volume"] == 90
+    assert _since_id(48) < pool.db["watermark"][channel.id]["low_id"] <= min(old)
+
+    channel.fetched = 0
+    assert _run(pool, channel, 48)["volume"] == 90
+    assert channel.fetched == 0                              # nothing left to read
+
+
+def test_narrower_window_reuses_stored_labels():
+    pool, channel = _Pool(), _Channel()
+    for i in range(20):
+        channel.post(timedelta(hours=40, minutes=-i))
+    for i in range(15):
+        channel.post(timedelta(hours=3, minutes=-i))
+    _run(pool, channel, 48)
+    mark = dict(pool.db["watermark"][channel.id])
+
+    channel.fetched = 0
+    r = _run(pool, channel, 6)
+
+    assert r["volume"] == 15                                 # only the last 6h counted
+    assert channel.fetched == 0                              # no back-fill, nothing new
+    assert pool.db["watermark"][channel.id] == mark          # span not narrowed
+
+
+def test_short_classifier_reply_does_not_advance_the_watermark(monkeypatch):
+    pool, channel = _Pool(), _Channel()
+    for i in range(10):
+        channel.post(timedelta(hours=1, minutes=-i))
+
+    async def truncated(messages):
+        raise ValueError("classifier gave 3 labels for 10 messages")
+    monkeypatch.setattr(aos_sentiment, "_classify_batch", truncated)
+
+    with pytest.raises(ValueError):
+        _run(pool, channel, 24)
+    assert not pool.db["messages"] and not pool.db["watermark"]
+
+
+def test_overlapping_runs_classify_each_message_once():
+    pool, channel = _Pool(), _Channel()
+    for i in range(45):
+        channel.post(timedelta(hours=2, minutes=-i))
+    provider = LocalProvider(latency=0.01, failure_rate=0, chunk_delay=0)
+    llm.set_provider(provider)
+
+    async def both():
+        return await asyncio.gather(*(aos_sentiment._analyze_channel(pool, "Faction", channel, 24)
+                                      for _ in range(2)))
+    a, b = asyncio.run(both())
+
+    assert a["volume"] == b["volume"] == 45
+    assert provider.calls == 2                               # one run's two batches, not four
+    assert len(pool.db["themes"]) <= 2
@@ -0,0 +1,111 @@
+"""
+ttlcache.py
+===========
+
+Small LRU cache with a per-entry time-to-live and optional JSON persistence,
+used to remember LLM replies so repeat questions don't pay for another call.
+
+    cache = TTLCache(maxsize=512, ttl=6 * 3600, path="data/maddy_cache.json")
+    hit = cache.get(key)          # None if missing or expired
+    cache.put(key, value)
+    text = cache.snapshot()       # on the event loop (cheap)
+    write_atomic(cache.path, text)  # in a worker thread
+
+Keys are strings and values must be JSON-serializable when a path is set.
+Expiry uses wall-clock time so persisted entries age across restarts.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+log = logging.getLogger(__name__)
+
+
+class TTLCache:
+    def __init__(
+        self,
+        maxsize: int = 512,
+        ttl: float = 3600.0,
+        path: Optional[Union[str, Path]] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = Path(path) if path else None
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        if self.path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        hit = self._data.get(key)
+        if hit is None or hit[0] <= self.clock():
+            if hit is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return hit[1]
+
+    def put(self, key: str, value: Any):
+        self._data[key] = (self.clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    # ---- persistence ----
+    def snapshot(self) -> str:
+        """Live entries as JSON text (oldest first), ready for write_atomic."""
+        now = self.clock()
+        return json.dumps([[k, exp, v] for k, (exp, v) in self._data.items() if exp > now])
+
+    def load(self):
+        """Replace the contents with the unexpired entries in self.path, if it exists."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable cache file %s: %s", self.path, e)
+            return
+        now = self.clock()
+        self._data.clear()
+        for k, exp, v in rows[-self.maxsize:]:
+            if exp > now:
+                self._data[k] = (exp, v)
+
+
+def write_atomic(path: Union[str, Path], text: str):
+    """
+    Write text to path via a temp file + rename, so readers never see half a
+    file. Each call gets its own temp file, so concurrent writers can't clobber
+    one another's (the last rename wins).
+    """
+    path = Path(path)
+    tmp = None
+    try:
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent,
+                                         prefix=f".{path.name}.", suffix=".tmp", delete=False) as f:
+            tmp = f.name
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp is not None and os.path.exists(tmp):
+            os.unlink(tmp)
+        raise